@@ -1,11 +1,14 @@
+import os
+import numpy as np
 from array import array
 from enum import Enum, unique
-from typing import NewType, List
+from typing import NewType, List, Tuple, Dict
 
 
 uint32_t = NewType("uint32_t", int)
 uint8_t = NewType("uint8_t", int)
 CanStr = NewType("CanStr", str)
+BinFrame = NewType("BinFrame", bytes)
 ArrayOfBool = NewType("ArrayOfBool", List[bool])
 
 
@@ -61,6 +64,68 @@ class ACTIVITY_CODE(Enum):
   rpy2net_SET_LED_STRIP_STATE_OF_BATTERY_SLOT_MODULE      = 22
   rpy2net_RESET_BATTERY_CAN_BUS_ERROR_STATE_AND_TIMER     = 23
 
+@unique
+class SERIAL_LINK_MODE(Enum):
+  ASCII  = 0
+  BINARY = 1
+
+
+# Binary link frame: can_id (4 bytes, little-endian) + data (8 bytes) + CRC-8 (1 byte).
+# On the wire each frame is COBS-encoded and terminated by a single 0x00 delimiter.
+BIN_FRAME_LEN = 13
+BIN_FRAME_DELIMITER = b"\x00"
+BIN_MODE_REQUEST = b"#BIN\n"
+BIN_MODE_ACK = b"#BIN-OK"
+BIN_MODE_ADVERTISEMENT = b"#BIN-CAPABLE" # (Sent by bridges that support binary mode, legacy ones would put a request on the bus.)
+
+def _createCrc8Table(polynomial : uint8_t = 0x07) -> List[uint8_t]:
+  table = []
+  for byte in range(256):
+    crc = byte
+    for _ in range(8):
+      crc = ((crc << 1) ^ polynomial) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    table.append(crc)
+  return table
+
+CRC8_TABLE = _createCrc8Table()
+
+def crc8(data : bytes) -> uint8_t:
+  crc = 0
+  for byte in data:
+    crc = CRC8_TABLE[crc ^ byte]
+  return crc
+
+def cobsEncode(data : bytes) -> bytes:
+  res = bytearray([0])
+  codeIndex, code = 0, 1
+  for byte in data:
+    if byte == 0:
+      res[codeIndex] = code
+      codeIndex, code = len(res), 1
+      res.append(0)
+    else:
+      res.append(byte)
+      code += 1
+      if code == 0xFF:
+        res[codeIndex] = code
+        codeIndex, code = len(res), 1
+        res.append(0)
+  res[codeIndex] = code
+  return bytes(res)
+
+def cobsDecode(packet : bytes) -> bytes:
+  res = bytearray()
+  i = 0
+  while i < len(packet):
+    code = packet[i]
+    if code == 0 or i + code > len(packet):
+      raise ValueError("'packet' is not a valid COBS-encoded packet")
+    res += packet[i+1 : i+code]
+    i += code
+    if code != 0xFF and i < len(packet):
+      res.append(0)
+  return bytes(res)
+
 
 def createCanMsgCanId(priorityLevel      : PRIORITY_LEVEL, 
                       activityCode       : ACTIVITY_CODE , 
@@ -95,7 +160,28 @@ def getOriginAddressFromCanMsgCanId(canId : uint32_t) -> MODULE_ADDRESS:
   return MODULE_ADDRESS(originAddress)
 
 
+DecodedCanId = Tuple[PRIORITY_LEVEL, ACTIVITY_CODE, MODULE_ADDRESS, MODULE_ADDRESS]
+
+# Only a few hundred distinct can_ids ever travel through the network, so each one is decoded
+# through the Enums once and then served from this table for every subsequent frame.
+CAN_ID_DECODING_TABLE : Dict[uint32_t, DecodedCanId] = {}
+
+def decodeCanMsgCanId(canId : uint32_t) -> DecodedCanId:
+  try:
+    return CAN_ID_DECODING_TABLE[canId]
+  except KeyError:
+    pass
+  decodedCanId = (getPriorityLevelFromCanMsgCanId(canId),
+                  getActivityCodeFromCanMsgCanId(canId),
+                  getDestinationAddressFromCanMsgCanId(canId),
+                  getOriginAddressFromCanMsgCanId(canId))
+  CAN_ID_DECODING_TABLE[canId] = decodedCanId
+  return decodedCanId
+
+
 class can_frame:
+    __slots__ = ("_can_id", "_data", "_decodedCanId")
+
     def __init__(self, can_id: uint32_t = 0, data: List[uint8_t] = [0,0,0,0,0,0,0,0])->None:
         self.can_id = can_id
         self.data = data
@@ -110,12 +196,31 @@ class can_frame:
         if not isinstance(value, int) or value < 0:
             raise ValueError("'can_id' must be of type uint32_t")
         self._can_id = value
-        self.priorityLevel      = getPriorityLevelFromCanMsgCanId(self._can_id)
-        self.activityCode       = getActivityCodeFromCanMsgCanId(self._can_id)
-        self.destinationAddress = getDestinationAddressFromCanMsgCanId(self._can_id)
-        self.originAddress      = getOriginAddressFromCanMsgCanId(self._can_id)
+        self._decodedCanId = None
         return None
     
+    @property
+    def decodedCanId(self)->DecodedCanId:
+        if self._decodedCanId is None:
+            self._decodedCanId = decodeCanMsgCanId(self._can_id)
+        return self._decodedCanId
+    
+    @property
+    def priorityLevel(self)->PRIORITY_LEVEL:
+        return self.decodedCanId[0]
+    
+    @property
+    def activityCode(self)->ACTIVITY_CODE:
+        return self.decodedCanId[1]
+    
+    @property
+    def destinationAddress(self)->MODULE_ADDRESS:
+        return self.decodedCanId[2]
+    
+    @property
+    def originAddress(self)->MODULE_ADDRESS:
+        return self.decodedCanId[3]
+    
     @property
     def data(self)->List[uint8_t]:
        return self._data
@@ -124,6 +229,11 @@ class can_frame:
     def data(self, value: List[uint8_t])->None:
         if len(value) != 8:
             raise ValueError("'data' must be a list/array of length 8")
+        
+        # Byte buffers are wrapped as they are. Anything else gets copied into an array("B").
+        if isinstance(value, (bytes, bytearray, memoryview)) or (isinstance(value, array) and value.typecode == "B"):
+            self._data = value
+            return None
         try:
             self._data = array("B", value)
         except TypeError:
@@ -133,13 +243,26 @@ class can_frame:
     @classmethod
     def from_canStr(cls, canStr: CanStr):
         can_id, data = canStr.split("-")
-        return cls(int(can_id), [int(i) for i in data.split(",")[:-1]])
+        return cls(int(can_id), array("B", map(int, data.split(",")[:-1])))
     
     def to_canStr(self)->CanStr:
         return f"{self.can_id}-{','.join([str(i) for i in self.data])},\n"
     
     def __str__(self)->CanStr:
        return self.to_canStr()
+
+    @classmethod
+    def from_binFrame(cls, binFrame: BinFrame):
+        frame = cobsDecode(binFrame.rstrip(BIN_FRAME_DELIMITER))
+        if len(frame) != BIN_FRAME_LEN:
+            raise ValueError(f"'binFrame' must decode to exactly {BIN_FRAME_LEN} bytes")
+        if crc8(frame[:-1]) != frame[-1]:
+            raise ValueError("CRC mismatch in 'binFrame'")
+        return cls(int.from_bytes(frame[:4], "little"), memoryview(frame)[4:12])
+
+    def to_binFrame(self)->BinFrame:
+        frame = self.can_id.to_bytes(4, "little") + bytes(self.data)
+        return cobsEncode(frame + bytes([crc8(frame)])) + BIN_FRAME_DELIMITER
     
     @classmethod
     def from_canIdParams(cls, priorityLevel      :PRIORITY_LEVEL, 
@@ -147,15 +270,132 @@ class can_frame:
                               destinationAddress :MODULE_ADDRESS, 
                               originAddress      :MODULE_ADDRESS, 
                               data:List[uint8_t]= [0,0,0,0,0,0,0,0]):
-         return cls(createCanMsgCanId(priorityLevel, activityCode, destinationAddress, originAddress), data)
+         canMsg = cls(createCanMsgCanId(priorityLevel, activityCode, destinationAddress, originAddress), data)
+         canMsg._decodedCanId = (priorityLevel, activityCode, destinationAddress, originAddress)
+         return canMsg
     
     def __repr__(self) -> str:
-       return f"can_frame.from_canIdParams(\n{self.priorityLevel},\n{self.activityCode},\n{self.destinationAddress},\n{self.originAddress},\n{self.data})\n"
+       return f"can_frame.from_canIdParams(\n{self.priorityLevel},\n{self.activityCode},\n{self.destinationAddress},\n{self.originAddress},\n{array('B', self.data)})\n"
 
-    
-  
 
 
+#%%                   BULK DECODING OF RECORDED CAN STRINGS
+
+CAN_FRAMES_DTYPE = np.dtype([
+  ("can_id"      , np.uint32),
+  ("priority"    , np.uint8),
+  ("activity"    , np.uint8),
+  ("destination" , np.uint8),
+  ("origin"      , np.uint8),
+  ("data"        , np.uint8, (8,)),
+])
+
+_NEWLINE, _CARRIAGE_RETURN, _SPACE, _HYPHEN, _COMMA, _ZERO, _NINE = b"\n\r -,09"
+_CAN_STR_SEPARATORS_PATTERN = np.array([_HYPHEN] + 8*[_COMMA], dtype=np.uint8)
+_POWERS_OF_TEN = 10**np.arange(20, dtype=np.uint64)
+_VALID_ACTIVITY_CODES = np.isin(np.arange(256), [code.value for code in ACTIVITY_CODE])
+_VALID_MODULE_ADDRESSES = np.isin(np.arange(256), [address.value for address in MODULE_ADDRESS])
+
+def _decodeCanStrChunk(chars : np.ndarray) -> Tuple[np.ndarray, np.ndarray, int]:
+  # 'chars' must hold whole lines, i.e, it must end with a newline.
+  isNewline = chars == _NEWLINE
+  isDigit   = (chars >= _ZERO) & (chars <= _NINE)
+  isHyphen  = chars == _HYPHEN
+  isComma   = chars == _COMMA
+  isBad     = ~(isDigit | isHyphen | isComma | isNewline | (chars == _CARRIAGE_RETURN) | (chars == _SPACE))
+
+  newlines   = np.flatnonzero(isNewline)
+  lineStarts = np.concatenate(([0], newlines[:-1] + 1))
+  numLines   = newlines.size
+
+  lineHasBadChars = np.logical_or.reduceat(isBad, lineStarts)
+  hyphensPerLine  = np.add.reduceat(isHyphen, lineStarts, dtype=np.int64)
+  commasPerLine   = np.add.reduceat(isComma,  lineStarts, dtype=np.int64)
+
+  # Every run of digits is a token. Its value is the sum of its digits times the matching powers of ten.
+  tokenStarts = np.flatnonzero(isDigit & ~np.concatenate(([False], isDigit[:-1])))
+  tokenEnds   = np.flatnonzero(isDigit & ~np.concatenate((isDigit[1:], [False]))) + 1
+  tokenLens   = tokenEnds - tokenStarts
+  tokenLines  = np.searchsorted(newlines, tokenStarts)
+  tokenSeps   = chars[tokenEnds]
+
+  digitPositions = np.flatnonzero(isDigit)
+  digitPowers    = np.repeat(tokenEnds, tokenLens) - 1 - digitPositions
+  digitValues    = (chars[digitPositions] - _ZERO).astype(np.uint64) * _POWERS_OF_TEN[np.minimum(digitPowers, 19)]
+  tokenValues    = np.add.reduceat(digitValues, np.cumsum(tokenLens) - tokenLens) if tokenLens.size else digitValues
+
+  tokensPerLine = np.bincount(tokenLines, minlength=numLines)
+  isBlankLine   = (tokensPerLine == 0) & (hyphensPerLine == 0) & (commasPerLine == 0) & ~lineHasBadChars
+
+  # A well-formed line has exactly 9 tokens, i.e, "can_id-d0,d1,d2,d3,d4,d5,d6,d7,".
+  lines9      = np.flatnonzero(tokensPerLine == 9)
+  hasNineTkns = (tokensPerLine == 9)[tokenLines]
+  values      = tokenValues[hasNineTkns].reshape(-1, 9)
+  lens        = tokenLens[hasNineTkns].reshape(-1, 9)
+  seps        = tokenSeps[hasNineTkns].reshape(-1, 9)
+
+  canIds = values[:, 0]
+  isValid  = (seps == _CAN_STR_SEPARATORS_PATTERN).all(axis=1)
+  isValid &= (hyphensPerLine[lines9] == 1) & (commasPerLine[lines9] == 8) & ~lineHasBadChars[lines9]
+  isValid &= (lens[:, 0] <= 10) & (canIds <= 0xFFFFFFFF)
+  isValid &= (lens[:, 1:] <= 3).all(axis=1) & (values[:, 1:] <= 255).all(axis=1)
+  isValid &= _VALID_ACTIVITY_CODES[(canIds >> 16) & 0xFF]
+  isValid &= _VALID_MODULE_ADDRESSES[(canIds >> 8) & 0xFF] & _VALID_MODULE_ADDRESSES[canIds & 0xFF]
+
+  canIds = canIds[isValid].astype(np.uint32)
+  frames = np.empty(canIds.size, dtype=CAN_FRAMES_DTYPE)
+  frames["can_id"]      = canIds
+  frames["priority"]    = (canIds >> 26) & 0b111
+  frames["activity"]    = (canIds >> 16) & 0xFF
+  frames["destination"] = (canIds >> 8)  & 0xFF
+  frames["origin"]      =  canIds        & 0xFF
+  frames["data"]        = values[isValid, 1:]
+
+  isRejected = ~isBlankLine
+  isRejected[lines9[isValid]] = False
+  return frames, np.flatnonzero(isRejected), numLines
+
+def decodeCanStrBuffer(buffer : bytes | str, chunkSize : int = 1 << 24) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Decode a buffer of newline-separated canStrs into a structured array of dtype CAN_FRAMES_DTYPE.
+  Returns the decoded frames together with the (0-based) line indices of the malformed lines.
+  Blank lines are skipped silently. The buffer is processed in chunks of roughly 'chunkSize' bytes.
+  """
+  if isinstance(buffer, str):
+    buffer = buffer.encode("utf-8")
+  chars = np.frombuffer(buffer, dtype=np.uint8) if not isinstance(buffer, np.ndarray) else buffer
+
+  framesPerChunk, rejectsPerChunk = [], []
+  start, lineOffset = 0, 0
+  while start < chars.size:
+    end = min(start + chunkSize, chars.size)
+    if end < chars.size:
+      newlines = np.flatnonzero(chars[start:end] == _NEWLINE)
+      if newlines.size:
+        end = start + newlines[-1] + 1
+      else:
+        newlines = np.flatnonzero(chars[end:] == _NEWLINE)
+        end = end + newlines[0] + 1 if newlines.size else chars.size
+
+    chunk = chars[start:end]
+    if chunk[-1] != _NEWLINE:
+      chunk = np.append(chunk, np.uint8(_NEWLINE))
+
+    frames, rejects, numLines = _decodeCanStrChunk(chunk)
+    framesPerChunk.append(frames)
+    rejectsPerChunk.append(rejects + lineOffset)
+    lineOffset += numLines
+    start = end
+
+  if not framesPerChunk:
+    return np.empty(0, dtype=CAN_FRAMES_DTYPE), np.empty(0, dtype=np.intp)
+  return np.concatenate(framesPerChunk), np.concatenate(rejectsPerChunk)
+
+def decodeCanStrFile(path : str, chunkSize : int = 1 << 24) -> Tuple[np.ndarray, np.ndarray]:
+  if os.path.getsize(path) == 0:
+    return np.empty(0, dtype=CAN_FRAMES_DTYPE), np.empty(0, dtype=np.intp)
+  return decodeCanStrBuffer(np.memmap(path, dtype=np.uint8, mode="r"), chunkSize)
+
 
 
 
@@ -177,6 +417,12 @@ if __name__ == "__main__":
         print("-------------------\n")
         print(canMsg)
         print(repr(canMsg))
+        print(canMsg.to_binFrame())
+        print(can_frame.from_binFrame(canMsg.to_binFrame()))
+
+    frames, rejects = decodeCanStrBuffer("".join(canMsg.to_canStr() for canMsg in canMsgs) + "not-a-canStr\n")
+    print(frames)
+    print(rejects)
 
 
 
@@ -0,0 +1,428 @@
+import os
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from typing import List
+from BSS_control.io_stats import IoLatencyStats
+
+from BSS_control.CanUtils import (
+    can_frame,
+    CanStr,
+    MODULE_ADDRESS,
+    SERIAL_LINK_MODE,
+    BIN_FRAME_DELIMITER,
+    BIN_MODE_REQUEST,
+    BIN_MODE_ACK,
+    BIN_MODE_ADVERTISEMENT)
+
+try:
+    import can
+except ImportError:
+    can = None
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+
+
+CAN_EFF_FLAG = 1 << 31
+CAN_EFF_MASK = 0x1FFFFFFF
+
+def canMsgFromBusMessage(msg)->can_frame | None:
+    # python-can message -> can_frame (None if it isn't a valid data frame of the station's protocol).
+    if not msg.is_extended_id or msg.is_remote_frame or msg.is_error_frame:
+        return None
+    try:
+        res = can_frame(msg.arbitration_id | CAN_EFF_FLAG, msg.data)
+    except ValueError:
+        res = None
+    return res
+
+
+#%%                   DEFINITION OF THE ASYNCIO CAN TRANSPORT INTERFACE
+
+class AsyncCanTransport(ABC):
+    """
+    Interface of the transports of the station daemon, with no thread nor Qt involved. 'open' opens the link, 'run' hands whatever arrives to the
+    ControlCenter (a batch per read) until 'close', and 'sendCanMsg' must not block the event loop.
+
+    rxStats: time [ms] a read took, from the moment the event loop dispatched it until its frames were
+             handed over to the ControlCenter, and its CPU time.
+    txStats: time [ms] from the moment a frame is sent until the link took it (frames the link can't
+             take anymore are dropped and counted in framesDropped).
+    """
+    def __init__(self):
+        self.controlCenter = None
+        self.keepRunning = True
+        self.framesReceived = 0
+        self.framesRejected = 0
+        self.framesDropped = 0
+        self.rxStats = IoLatencyStats()
+        self.txStats = IoLatencyStats()
+        return None
+
+    def connectToControlCenter(self, controlCenter)->None:
+        self.controlCenter = controlCenter
+        controlCenter.SIGNALS.sendCanMsg.connect(self.sendCanMsg)
+        return None
+
+    @abstractmethod
+    async def open(self)->bool:
+        ...
+
+    @abstractmethod
+    async def run(self)->None:
+        ...
+
+    @abstractmethod
+    def sendCanMsg(self, canStr : CanStr)->None:
+        ...
+
+    def close(self)->None:
+        self.keepRunning = False
+        return None
+
+    def deliver(self, canMsgs : List[can_frame])->None:
+        if canMsgs:
+            self.framesReceived += len(canMsgs)
+            self.controlCenter.updateStatesFromCanMsgs(canMsgs)
+        return None
+
+    def getIoStats(self)->dict:
+        return {"rx" : self.rxStats.asDict(), "tx" : self.txStats.asDict()}
+
+
+#%%                   DEFINITION OF THE ASYNCIO TRANSPORTS
+
+class AsyncEmulatorTransport(AsyncCanTransport):
+    """
+    Loopback transport: steps a StationEmulator (see station_emulator.py) on the event loop's clock.
+    """
+    TICK_PERIOD = 0.005 #[s]
+
+    def __init__(self, emulator):
+        super().__init__()
+        self.emulator = emulator
+        return None
+
+    async def open(self)->bool:
+        self.start = asyncio.get_running_loop().time()
+        self.emulator.now = 0
+        print("STATION EMULATOR LAUNCH SUCCESS")
+        return True
+
+    async def run(self)->None:
+        loop = asyncio.get_running_loop()
+        while self.keepRunning:
+            await asyncio.sleep(self.TICK_PERIOD)
+            self.deliver(self.emulator.step(1000*(loop.time() - self.start)))
+        return None
+
+    def sendCanMsg(self, canStr : CanStr)->None:
+        # (Same thread as the ControlCenter, so commands are executed right away.)
+        self.emulator.executeCanStr(canStr)
+        return None
+
+
+class AsyncSocketCanTransport(AsyncCanTransport):
+    """
+    Talks to the CAN network through a python-can bus (e.g, SocketCAN), whose frames are handed
+    to the event loop by a can.Notifier: the bus socket is waited on, not polled.
+    """
+    def __init__(self, channel : str = "can0", interface : str = "socketcan"):
+        super().__init__()
+        self.channel = channel
+        self.interface = interface
+        self.bus = None
+        self.notifier = None
+        return None
+
+    async def open(self)->bool:
+        if can is None:
+            print("SOCKETCAN LAUNCH FAILURE: python-can is not installed")
+            return False
+
+        controlCenterFilter = {"can_id"   : MODULE_ADDRESS.CONTROL_CENTER.value << 8,
+                               "can_mask" : 0xFF << 8,
+                               "extended" : True}
+        try:
+            self.bus = can.Bus(interface=self.interface, channel=self.channel, can_filters=[controlCenterFilter])
+        except (OSError, can.CanError) as e:
+            print(f"SOCKETCAN LAUNCH FAILURE: {e}")
+            return False
+        self.reader = can.AsyncBufferedReader()
+        self.notifier = can.Notifier(self.bus, [self.reader], loop=asyncio.get_running_loop())
+        print(f"SOCKETCAN LAUNCH SUCCESS: {self.channel}")
+        return True
+
+    async def run(self)->None:
+        while self.keepRunning:
+            # Wait for a frame, then take whatever else already arrived along with it.
+            msgs = [await self.reader.get_message()]
+            start, cpuStart = time.perf_counter(), time.thread_time()
+            while not self.reader.buffer.empty():
+                msgs.append(self.reader.buffer.get_nowait())
+            canMsgs = [canMsg for canMsg in map(canMsgFromBusMessage, msgs) if canMsg is not None]
+            self.framesRejected += len(msgs) - len(canMsgs)
+            self.deliver(canMsgs)
+            self.rxStats.update(1000*(time.perf_counter() - start), 1000*(time.thread_time() - cpuStart), 16*len(msgs))
+        return None
+
+    def sendCanMsg(self, canStr : CanStr)->None:
+        if self.bus is None:
+            return None
+        canMsg = can_frame.from_canStr(canStr)
+        start, cpuStart = time.perf_counter(), time.thread_time()
+        try:
+            # (A socketcan write only blocks if the interface's TX queue is full.)
+            self.bus.send(can.Message(arbitration_id=canMsg.can_id & CAN_EFF_MASK, is_extended_id=True, data=canMsg.data), timeout=0)
+        except can.CanError as e:
+            print(f"WARNING: CAN frame could not be sent in AsyncSocketCanTransport.sendCanMsg(): {e}")
+        self.txStats.update(1000*(time.perf_counter() - start), 1000*(time.thread_time() - cpuStart), 16)
+        return None
+
+    def close(self)->None:
+        super().close()
+        if self.notifier is not None:
+            self.notifier.stop()
+        if self.bus is not None:
+            self.bus.shutdown()
+        print("SHUTTING SOCKETCAN TRANSPORT DOWN")
+        return None
+
+
+class AsyncSerialBridgeTransport(AsyncCanTransport):
+    """
+    Talks to the CAN network through the serial bridge module (see serial_coms_interface_module.ino). The port's file
+    descriptor is non-blocking and driven by the event loop: 'readAvailable' is called whenever it is
+    readable, and whatever a write can't take right away is queued and written out by 'writePending'
+    once it is writable again. Nothing waits on the port in between.
+
+    Binary mode is only requested from a bridge that has shown it supports it: by advertising it (in
+    ASCII mode, after its boot) or by sending binary frames (it's still in binary mode from a previous
+    run). A legacy bridge would parse the request as a CAN string and put a junk frame on the bus.
+    """
+    BAUDRATE = 115200
+    BIN_MODE_NEGOTIATION_TIMEOUT = 5.0 #[s]
+    BIN_MODE_REQUEST_PERIOD = 1.0 #[s]
+    RX_BUFFER_MAXLEN = 4096 #[bytes]
+    RX_READ_SIZE = 4096 #[bytes]
+    TX_BUFFER_MAXLEN = 16384 #[bytes] (~1.4 s of traffic at BAUDRATE: beyond that the bridge is gone.)
+
+    def __init__(self, port : str = "/dev/ttyUSB0", requestBinaryMode : bool = True):
+        super().__init__()
+        self.port = port
+        self.requestBinaryMode = requestBinaryMode
+        self.linkMode = SERIAL_LINK_MODE.ASCII
+        self.rxBuffer = bytearray()
+        self.txBuffer = bytearray()
+        self.txPendingSince = None
+        self.fd = None
+        self.ser = None
+        self.isNegotiating = False
+        self.bridgeIsInBinaryMode = False
+        self.binModeRequestTime = None
+        self.binModeAcknowledged = None
+        self.closed = None
+        return None
+
+    async def open(self)->bool:
+        if serial is None:
+            print("SERIAL LAUNCH FAILURE: pyserial is not installed")
+            return False
+        try:
+            self.ser = serial.Serial(port=self.port, baudrate=self.BAUDRATE, timeout=0)
+            self.ser.reset_input_buffer()
+        except (serial.SerialException, OSError) as e:
+            print(f"SERIAL LAUNCH FAILURE: {e}")
+            return False
+        print("SERIAL LAUNCH SUCCESS")
+
+        # (pyserial already opens the port with O_NONBLOCK, this makes sure of it.)
+        self.fd = self.ser.fileno()
+        os.set_blocking(self.fd, False)
+        loop = asyncio.get_running_loop()
+        self.closed = loop.create_future()
+        self.binModeAcknowledged = loop.create_future()
+        loop.add_reader(self.fd, self.readAvailable)
+        await self.negotiateLinkMode()
+        return True
+
+    async def negotiateLinkMode(self)->None:
+        # The request itself is sent by 'handleAsciiData', once the bridge has shown it supports binary
+        # mode. Without an acknowledgement within BIN_MODE_NEGOTIATION_TIMEOUT, the link stays in ASCII mode.
+        self.linkMode = SERIAL_LINK_MODE.ASCII
+        if self.requestBinaryMode:
+            self.isNegotiating = True
+            await asyncio.wait([self.binModeAcknowledged], timeout=self.BIN_MODE_NEGOTIATION_TIMEOUT)
+            self.isNegotiating = False
+        print(f"SERIAL LINK MODE: {self.linkMode.name}")
+        return None
+
+    def sendBinModeRequest(self)->None:
+        # (At most once every BIN_MODE_REQUEST_PERIOD, as the evidence keeps coming until the bridge switches.)
+        now = time.monotonic()
+        if self.binModeRequestTime is None or now - self.binModeRequestTime >= self.BIN_MODE_REQUEST_PERIOD:
+            # (A bridge in binary mode only takes the request at a frame boundary: the delimiter ends whatever
+            # partial frame it may be holding.)
+            self.write(BIN_FRAME_DELIMITER + BIN_MODE_REQUEST if self.bridgeIsInBinaryMode else BIN_MODE_REQUEST)
+            self.binModeRequestTime = now
+        return None
+
+    def readAvailable(self)->None:
+        start, cpuStart = time.perf_counter(), time.thread_time()
+        try:
+            data = os.read(self.fd, self.RX_READ_SIZE)
+        except BlockingIOError:
+            return None
+        except OSError as e:
+            print(f"SERIAL LINK FAILURE: {e}")
+            self.close()
+            return None
+        if not data:
+            # (A readable descriptor with nothing to read: the device is gone, e.g, unplugged.)
+            print("SERIAL LINK FAILURE: the port was closed")
+            self.close()
+            return None
+        self.handleData(data)
+        self.rxStats.update(1000*(time.perf_counter() - start), 1000*(time.thread_time() - cpuStart), len(data))
+        return None
+
+    def handleData(self, data : bytes)->None:
+        self.rxBuffer += data
+        if self.linkMode == SERIAL_LINK_MODE.ASCII:
+            self.handleAsciiData()
+        # (Not an 'else': what follows an acknowledgement in the same read is already binary.)
+        if self.linkMode == SERIAL_LINK_MODE.BINARY:
+            self.handleBinaryData()
+        if len(self.rxBuffer) > self.RX_BUFFER_MAXLEN:
+            self.rxBuffer.clear()
+        return None
+
+    def handleAsciiData(self)->None:
+        if self.isNegotiating:
+            ackStart = self.rxBuffer.find(BIN_MODE_ACK + b"\n")
+            binFramesEnd = self.rxBuffer.rfind(BIN_FRAME_DELIMITER, 0, ackStart if ackStart >= 0 else len(self.rxBuffer))
+            if binFramesEnd >= 0:
+                # Binary frames: the bridge is still in binary mode (e.g, from a previous run), and they're of
+                # no use until it acknowledges the request again.
+                self.bridgeIsInBinaryMode = True
+                if ackStart < 0:
+                    self.sendBinModeRequest()
+                else:
+                    ackStart -= binFramesEnd + 1
+                del self.rxBuffer[:binFramesEnd+1]
+
+            if ackStart >= 0:
+                lines = self.rxBuffer[:ackStart].split(b"\n")
+                del self.rxBuffer[:ackStart + len(BIN_MODE_ACK) + 1]
+                self.deliver(self.decodeAsciiLines(lines))
+                self.linkMode = SERIAL_LINK_MODE.BINARY
+                self.binModeAcknowledged.set_result(True)
+                return None
+            if self.bridgeIsInBinaryMode:
+                return None # (Nor is an incomplete binary frame a line.)
+
+        # Incomplete lines stay in the buffer for the next read.
+        end = self.rxBuffer.rfind(b"\n")
+        if end >= 0:
+            lines = self.rxBuffer[:end].split(b"\n")
+            del self.rxBuffer[:end+1]
+            self.deliver(self.decodeAsciiLines(lines))
+        return None
+
+    def handleBinaryData(self)->None:
+        # Incomplete frames stay in the buffer for the next read.
+        end = self.rxBuffer.rfind(BIN_FRAME_DELIMITER)
+        if end >= 0:
+            packets = self.rxBuffer[:end].split(BIN_FRAME_DELIMITER)
+            del self.rxBuffer[:end+1]
+            self.deliver(self.decodeBinFrames(packets))
+        return None
+
+    def decodeBinFrames(self, packets : List[bytes])->List[can_frame]:
+        canMsgs = []
+        for packet in packets:
+            if packet:
+                try:
+                    canMsgs.append(can_frame.from_binFrame(bytes(packet)))
+                except ValueError:
+                    self.framesRejected += 1
+        return canMsgs
+
+    def decodeAsciiLines(self, lines : List[bytes])->List[can_frame]:
+        canMsgs = []
+        for line in lines:
+            line = line.rstrip()
+            if line == BIN_MODE_ADVERTISEMENT:
+                if self.isNegotiating:
+                    self.sendBinModeRequest()
+            elif line.startswith(b"#"):
+                continue # (Link control lines, e.g, an acknowledgement that came after the negotiation timed out.)
+            elif line:
+                try:
+                    canMsgs.append(can_frame.from_canStr(line.decode("utf-8")))
+                except (UnicodeDecodeError, ValueError):
+                    self.framesRejected += 1
+        return canMsgs
+
+    async def run(self)->None:
+        # Reads are driven by the event loop (see readAvailable): this just lasts as long as the link.
+        await self.closed
+        return None
+
+    def sendCanMsg(self, canStr : CanStr)->None:
+        if self.linkMode == SERIAL_LINK_MODE.BINARY:
+            self.write(can_frame.from_canStr(canStr).to_binFrame())
+        else:
+            self.write(canStr.encode("utf-8"))
+        return None
+
+    def write(self, data : bytes)->None:
+        if self.ser is None or not self.ser.is_open:
+            return None
+        if len(self.txBuffer) + len(data) > self.TX_BUFFER_MAXLEN:
+            self.framesDropped += 1
+            return None
+        if not self.txBuffer:
+            self.txPendingSince = time.perf_counter()
+            self.txBuffer += data
+            self.writePending()
+        else:
+            # Already waiting for the port to be writable: 'writePending' will take it along.
+            self.txBuffer += data
+        return None
+
+    def writePending(self)->None:
+        cpuStart = time.thread_time()
+        try:
+            numBytesWritten = os.write(self.fd, self.txBuffer)
+        except BlockingIOError:
+            numBytesWritten = 0
+        except OSError as e:
+            print(f"SERIAL LINK FAILURE: {e}")
+            self.close()
+            return None
+        del self.txBuffer[:numBytesWritten]
+
+        loop = asyncio.get_running_loop()
+        if self.txBuffer:
+            loop.add_writer(self.fd, self.writePending)
+        else:
+            loop.remove_writer(self.fd)
+            self.txStats.update(1000*(time.perf_counter() - self.txPendingSince), 1000*(time.thread_time() - cpuStart), numBytesWritten)
+        return None
+
+    def close(self)->None:
+        super().close()
+        if self.ser is not None and self.ser.is_open:
+            loop = asyncio.get_running_loop()
+            loop.remove_reader(self.fd)
+            loop.remove_writer(self.fd)
+            self.ser.close()
+            print("SHUTTING SERIAL TRANSPORT DOWN")
+        if self.closed is not None and not self.closed.done():
+            self.closed.set_result(None)
+        return None
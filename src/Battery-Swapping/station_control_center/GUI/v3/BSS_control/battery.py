@@ -1,10 +1,21 @@
 import datetime
 import numpy as np
-from typing import Set, Dict
+from typing import Set, Dict, Iterable
+from functools import reduce
+from operator import or_
 from collections import deque
 from enum import Enum, unique
-from scipy.interpolate import interp1d
 from math import isnan
+from BSS_control.charge_time_estimator import ChargeTimeEstimator
+
+from BSS_control.station_state_table import (
+    StationStateTable,
+    StateVectorField)
+
+from BSS_control.memoization import (
+    GenerationMemoized,
+    memoizedProperty,
+    isSameValue)
 
 from BSS_control.CanUtils import (
     can_frame,
@@ -50,78 +61,75 @@ class BATTERY_WARNINGS(Enum):
     STATE_OF_CHARGE                             = 31
 
 
-def voltage2TimePassed(voltage):
+def warningsToMask(warnings : Iterable[BATTERY_WARNINGS])->int:
+    return sum(1 << warning.value for warning in set(warnings))
 
-    if voltage < 35.072:
-        timePassed = 103.630*voltage - 3111.774
-    
-    elif voltage < 41.697:
-        timePassed = -70.81*voltage**2 + 6552.578*voltage - 142189.681
-    
-    elif voltage < 42.1:
-        timePassed = 4665.0124*voltage - 186597.0223
+def maskToWarnings(mask : int)->Set[BATTERY_WARNINGS]:
+    return {warning for warning in BATTERY_WARNINGS if mask & (1 << warning.value)}
 
-    return timePassed
 
-# @property
-# def timeUntilFullCharge(self)->float:
-#     if self.isChargedEnough:
-#         return 0
-    
-#     if    self.voltage < 30.03: voltage_ = 30.03
-#     elif  self.voltage > 42.10: voltage_ = 42.10
-#     else: voltage_ = self.voltage
-
-#     if voltage_ < 42.1:
-#         timePassed    = voltage2TimePassed(voltage_)
-#         timeRemaining = self.TOTAL_TIME_UNTIL_FULL_CHARGE - timePassed
-    
-#     elif self.isCharging:
-#         timeRemaining  = self.TOTAL_TIME_UNTIL_FULL_CHARGE
-#         timeRemaining -= self.PARTIAL_TIME_UNTIL_FULL_CHARGE
-#         timeRemaining *= self.current/self.MAX_CHARGING_CURRENT
-
-#     else:
-#         timeRemaining  = self.TOTAL_TIME_UNTIL_FULL_CHARGE
-#         timeRemaining -= self.PARTIAL_TIME_UNTIL_FULL_CHARGE
-
-#     return timeRemaining
-
-# MAX_CHARGING_CURRENT = 12 #[A]
-# TOTAL_TIME_UNTIL_FULL_CHARGE = 11000  #[s] (From 30V to Full Charge)
-# PARTIAL_TIME_UNTIL_FULL_CHARGE = 9800 #[s] (From 30V to 42.1V)
-
-
-class Battery:
+class Battery(GenerationMemoized):
     DEQUE_MAXLEN = 10
     MAX_CHARGING_CURRENT = 12 #[A]
     SECONDS_PER_SOC_PERCENTAGE_INCREASE = 76.5 #[s/%]
 
     BATTERY_IS_CHARGED_ENOUGH_SOC_THRESHOLD = 97 #[%]
     BATTERY_IS_CHARGING_CURRENT_THRESHOLD = 0.6 #[A]
+    CELL_IMBALANCE_THRESHOLD = 0.3 #[V] (Max - min cell voltage above which the battery is deemed damaged.)
+
+    # Shared by all batteries and refitted by the ControlCenter as charge sessions complete.
+    CHARGE_TIME_ESTIMATOR = ChargeTimeEstimator(BATTERY_IS_CHARGING_CURRENT_THRESHOLD, BATTERY_IS_CHARGED_ENOUGH_SOC_THRESHOLD,
+                                                MAX_CHARGING_CURRENT, SECONDS_PER_SOC_PERCENTAGE_INCREASE)
 
     FATAL_BATTERY_WARNINGS = set()
+    FATAL_BATTERY_WARNINGS_MASK = warningsToMask(FATAL_BATTERY_WARNINGS)
+    WARNINGS_WINDOW = DEQUE_MAXLEN #[frames] (Warnings are kept for the last frames that carried any.)
+
+    # Index of the frames that carry cell voltages (see StationStateTable.cellVoltages).
+    CELL_VOLTAGES_FRAME_INDICES = {ACTIVITY_CODE[f"net2rpy_BATTERY_DATA_{i}"] : i-2 for i in range(2, 10)}
     WAITING_FOR_ALL_DATA_TIMEOUT = 4.5*1000 #[ms]
     DATA_PACKETS_ARE_DAMAGED_TIMEOUT = 2.5*60*1000 #[ms]
     
    
 
-    def __init__(self, moduleAddressToControl):
+    # Scalar states, stored in the state vectors of the station table (see StationStateTable).
+    localTimer                      = StateVectorField(float)
+    currentGlobalTime               = StateVectorField(float)
+    dataPacketsAreDamagedTimer      = StateVectorField(float)
+    inSlot                          = StateVectorField(bool)
+    bmsON                           = StateVectorField(bool)
+    waitingForAllData               = StateVectorField(bool)
+    bmsHasCanBusError               = StateVectorField(bool)
+    relayChanneOn                   = StateVectorField(bool)
+    proccessToStartChargeIsActive_  = StateVectorField(bool)
+    proccessToFinishChargeIsActive_ = StateVectorField(bool)
+    dataPacketsAreDamaged           = StateVectorField(bool)
+    warningsMask                    = StateVectorField(int)
+
+    def __init__(self, moduleAddressToControl, stateTable : StationStateTable | None = None):
+        # A battery that isn't part of a station (e.g, for debugging) gets a table of its own.
+        if stateTable is None:
+            stateTable = StationStateTable([moduleAddressToControl], batteryWindow=self.DEQUE_MAXLEN)
+        self.stateTable = stateTable
+        self.row = stateTable.rows[moduleAddressToControl]
+        stateTable.batteries[self.row] = self
+        super().__init__()
         self.moduleAddressToControl = moduleAddressToControl
 
         self.buffers = {
-            "voltage"  : deque(maxlen=self.DEQUE_MAXLEN),
-            "current"  : deque(maxlen=self.DEQUE_MAXLEN),
-            "soc"      : deque(maxlen=self.DEQUE_MAXLEN),
-            "warnings" : deque(maxlen=len(BATTERY_WARNINGS)),
-            "NTC1"     : deque(maxlen=self.DEQUE_MAXLEN),
-            "NTC2"     : deque(maxlen=self.DEQUE_MAXLEN),
-            "NTC3"     : deque(maxlen=self.DEQUE_MAXLEN),
-            "NTC4"     : deque(maxlen=self.DEQUE_MAXLEN),
-            "NTC5"     : deque(maxlen=self.DEQUE_MAXLEN),
-            "NTC6"     : deque(maxlen=self.DEQUE_MAXLEN),
-            "MOSFET"   : deque(maxlen=self.DEQUE_MAXLEN),
+            "voltage"  : stateTable.getRowView("voltage", self.row),
+            "current"  : stateTable.getRowView("current", self.row),
+            "soc"      : stateTable.getRowView("soc", self.row),
+            "warnings" : deque(maxlen=self.WARNINGS_WINDOW),
+            "NTC1"     : stateTable.getRowView("NTC1", self.row),
+            "NTC2"     : stateTable.getRowView("NTC2", self.row),
+            "NTC3"     : stateTable.getRowView("NTC3", self.row),
+            "NTC4"     : stateTable.getRowView("NTC4", self.row),
+            "NTC5"     : stateTable.getRowView("NTC5", self.row),
+            "NTC6"     : stateTable.getRowView("NTC6", self.row),
+            "MOSFET"   : stateTable.getRowView("MOSFET", self.row),
         }
+        self.tempsBuffers = {key:val for key,val in self.buffers.items() if key not in ["voltage", "current", "soc", "warnings"]}
         
         
         # TIMERS
@@ -140,47 +148,55 @@ class Battery:
         self.proccessToStartChargeIsActive_setter(False)     
         self.proccessToFinishChargeIsActive_setter(False)
         self.dataPacketsAreDamaged = False
+        self.warningsMask = 0
         return None
 
 
 
     def updateStatesFromCanMsg(self, canMsg : can_frame)->None:
+        self.bumpGeneration()
 
         if canMsg.activityCode == ACTIVITY_CODE.net2rpy_BATTERY_DATA_0:
-            self.buffers["soc"].append(canMsg.data[4])
-            self.buffers["voltage"].append( 0.1*((canMsg.data[1] << 8) | canMsg.data[0]) )
-            self.buffers["current"].append( 0.1*((canMsg.data[3] << 8) | canMsg.data[2]) - 3200 )
+            self.stateTable.append("BATTERY_DATA_0", self.row, 
+                                   (0.1*((canMsg.data[1] << 8) | canMsg.data[0]),
+                                    0.1*((canMsg.data[3] << 8) | canMsg.data[2]) - 3200,
+                                    canMsg.data[4]))
             
-            for i in range(3):
-                if canMsg.data[i+5] > 0:
-                    bitValues = [(((1 << j) & canMsg.data[i+5]) >> j) for j in range(8)]
-                    self.buffers["warnings"].extend( [BATTERY_WARNINGS(8*i + j) for j in range(8) if bitValues[j]] )
+            # Warnings 0..23 are the bits of data[5..7], in order.
+            warningsMask = canMsg.data[5] | (canMsg.data[6] << 8) | (canMsg.data[7] << 16)
+            if warningsMask:
+                self.appendWarningsMask(warningsMask)
 
 
         elif canMsg.activityCode == ACTIVITY_CODE.net2rpy_BATTERY_DATA_1:
-            if canMsg.data[0]:
-                bitValues = [(((1 << j) & canMsg.data[0]) >> j) for j in range(5)]
-                self.buffers["warnings"].extend( [BATTERY_WARNINGS(24 + j) for j in range(5) if bitValues[j]] )
-
-            if canMsg.data[1]:
-                bitValues = [(((1 << j) & canMsg.data[1]) >> j) for j in range(3)]
-                self.buffers["warnings"].extend( [BATTERY_WARNINGS(29 + j) for j in range(3) if bitValues[j]] )
+            # Warnings 24..28 are the 5 low bits of data[0] and warnings 29..31 the 3 low bits of data[1].
+            warningsMask = ((canMsg.data[0] & 0x1F) << 24) | ((canMsg.data[1] & 0x07) << 29)
+            if warningsMask:
+                self.appendWarningsMask(warningsMask)
 
 
         elif canMsg.activityCode == ACTIVITY_CODE.net2rpy_BATTERY_DATA_9:
-            for i in range(1,5):
-                self.buffers[f"NTC{i}"].append(canMsg.data[i+3] - 40)
+            self.stateTable.cellVoltages.write(self.row, self.CELL_VOLTAGES_FRAME_INDICES[canMsg.activityCode], canMsg.data)
+            self.stateTable.append("BATTERY_DATA_9", self.row, [canMsg.data[i+3] - 40 for i in range(1,5)])
 
 
         elif canMsg.activityCode == ACTIVITY_CODE.net2rpy_BATTERY_DATA_10:
-            self.buffers["NTC5"].append(  canMsg.data[0] - 40)
-            self.buffers["NTC6"].append(  canMsg.data[1] - 40)
-            self.buffers["MOSFET"].append(canMsg.data[2] - 40)
+            self.stateTable.append("BATTERY_DATA_10", self.row, [canMsg.data[i] - 40 for i in range(3)])
+
+
+        elif canMsg.activityCode in self.CELL_VOLTAGES_FRAME_INDICES:
+            self.stateTable.cellVoltages.write(self.row, self.CELL_VOLTAGES_FRAME_INDICES[canMsg.activityCode], canMsg.data)
 
         return None
     
+    def appendWarningsMask(self, warningsMask : int)->None:
+        self.buffers["warnings"].append(warningsMask)
+        self.warningsMask = reduce(or_, self.buffers["warnings"])
+        return None
+
     def updateCurrentGlobalTime(self, newCurrentGlobalTime : float)->None:
         self.currentGlobalTime = newCurrentGlobalTime
+        self.bumpGeneration()
 
         if self.currentGlobalTime - self.dataPacketsAreDamagedTimer > self.DATA_PACKETS_ARE_DAMAGED_TIMEOUT:
             self.dataPacketsAreDamaged = False
@@ -188,6 +204,7 @@ class Battery:
         return None
 
     def updateStatesFromBatterySlotModule(self, inSlot:bool|float, bmsHasCanBusError:bool|float, bmsON:bool|float)->None:
+        self.bumpGeneration()
 
         if any(np.isnan([inSlot, bmsHasCanBusError, bmsON])):
             return None
@@ -219,11 +236,14 @@ class Battery:
         return None
     
     def updateStatesFromControlCenter(self, relayChannelOn : bool|float)->None:
+        # This gets called for every received batch, so the generation is only bumped on actual changes.
+        if not isSameValue(relayChannelOn, self.relayChanneOn):
+            self.bumpGeneration()
         self.relayChanneOn = relayChannelOn
         return None
     
 
-    @property
+    @memoizedProperty
     def isAddressable(self)->bool:
         if isnan(self.inSlot):
             res = False
@@ -237,30 +257,32 @@ class Battery:
 
     @property
     def voltage(self)->float:
-        return np.mean(self.buffers["voltage"])
+        return self.buffers["voltage"].mean
 
     @property
     def current(self)->float:
-        return np.mean(self.buffers["current"])
+        return self.buffers["current"].mean
     
     @property
     def soc(self)->float:
-        return np.mean(self.buffers["soc"])
+        return self.buffers["soc"].mean
     
-    @property
+    # The warnings are kept as a bitmask (bit i <=> BATTERY_WARNINGS(i)); the sets of enums
+    # are only built when something asks for them (e.g, the super-access battery status panel).
+    @memoizedProperty
     def warnings(self)->Set[BATTERY_WARNINGS]:
-        return set(self.buffers["warnings"])
+        return maskToWarnings(self.warningsMask)
     
-    @property
+    @memoizedProperty
     def fatalWarnings(self)->Set[BATTERY_WARNINGS]:
-        return self.warnings.intersection(self.FATAL_BATTERY_WARNINGS)
+        return maskToWarnings(self.warningsMask & self.FATAL_BATTERY_WARNINGS_MASK)
     
     @property
     def hasWarnings(self)->bool|float:
         if not self.isAddressable:
             res = np.nan
         else:
-            res = bool(self.warnings)
+            res = self.warningsMask != 0
         return res
         
     @property
@@ -268,21 +290,24 @@ class Battery:
         if not self.isAddressable:
             res = np.nan
         else:
-            res = bool(self.fatalWarnings)
+            res = (self.warningsMask & self.FATAL_BATTERY_WARNINGS_MASK) != 0
         return res
     
-    @property
+    @memoizedProperty
     def isDamaged(self)->bool|float:
 
         if (not self.inSlot) or (not self.bmsON) or self.waitingForAllData:
             return np.nan
 
-        dataPacketsAreDamagedLogic = any(np.array(self.buffers["voltage"]) < 0)
-        dataPacketsAreDamagedLogic = any(np.array(self.buffers["current"]) < 0)                                                 or dataPacketsAreDamagedLogic
-        dataPacketsAreDamagedLogic = any(np.array(self.buffers["soc"]) < 0)                                                     or dataPacketsAreDamagedLogic
+        dataPacketsAreDamagedLogic = self.buffers["voltage"].hasNegatives
+        dataPacketsAreDamagedLogic = self.buffers["current"].hasNegatives                                                       or dataPacketsAreDamagedLogic
+        dataPacketsAreDamagedLogic = self.buffers["soc"].hasNegatives                                                           or dataPacketsAreDamagedLogic
         dataPacketsAreDamagedLogic = ((self.current > self.BATTERY_IS_CHARGING_CURRENT_THRESHOLD) and (not self.relayChanneOn)) or dataPacketsAreDamagedLogic
 
         if dataPacketsAreDamagedLogic:
+            # Latching the flag changes the inputs of other derived states (e.g, isCharging).
+            if not self.dataPacketsAreDamaged:
+                self.bumpGeneration()
             self.dataPacketsAreDamaged = True
             self.dataPacketsAreDamagedTimer = self.currentGlobalTime
 
@@ -292,22 +317,53 @@ class Battery:
             res = True
         elif self.hasFatalWarnings:
             res = True
+        elif self.hasCellImbalance:
+            res = True
         else:
             res = False
             
         return res
     
+    @memoizedProperty
+    def cellVoltagesStats(self)->Dict[str, float]:
+        return self.stateTable.cellVoltages.getRowStats(self.row)
+    
     @property
-    def temps(self)->Dict[str, float]:
-        return {key:np.mean(val) for key,val in self.buffers.items() if key not in ["voltage", "current", "soc", "warnings"]}
+    def cellVoltages(self)->np.ndarray:
+        cellVoltages = self.stateTable.cellVoltages.getCellMeans(self.row)
+        return cellVoltages[~np.isnan(cellVoltages)]
+
+    @property
+    def minCellVoltage(self)->float:
+        return self.cellVoltagesStats["min"]
+
+    @property
+    def maxCellVoltage(self)->float:
+        return self.cellVoltagesStats["max"]
+
+    @property
+    def cellVoltageDelta(self)->float:
+        return self.cellVoltagesStats["delta"]
     
     @property
+    def hasCellImbalance(self)->bool|float:
+        if not self.isAddressable:
+            res = np.nan
+        else:
+            res = self.cellVoltageDelta > self.CELL_IMBALANCE_THRESHOLD
+        return res
+    
+    @memoizedProperty
+    def temps(self)->Dict[str, float]:
+        return {key:val.mean for key,val in self.tempsBuffers.items()}
+    
+    @memoizedProperty
     def maxTemp(self)->Dict[str, float]:
         temperatures = self.temps
         maxTemperatureKey = max(temperatures, key=temperatures.get)
         return {maxTemperatureKey:temperatures[maxTemperatureKey]}
     
-    @property
+    @memoizedProperty
     def isCharging(self)->bool|float:
         if (not self.inSlot) or (not self.bmsON) or (not self.relayChanneOn):
             res = False
@@ -317,7 +373,7 @@ class Battery:
             res = self.current > self.BATTERY_IS_CHARGING_CURRENT_THRESHOLD
         return res
     
-    @property
+    @memoizedProperty
     def isChargedEnough(self)->bool|float:
         if not self.isAddressable:
             res = np.nan
@@ -325,7 +381,7 @@ class Battery:
             res = self.soc >= self.BATTERY_IS_CHARGED_ENOUGH_SOC_THRESHOLD
         return res
 
-    @property
+    @memoizedProperty
     def canProceedToBeCharged(self)->bool: 
         if not self.isAddressable:
             res = False 
@@ -343,24 +399,22 @@ class Battery:
     
 
     
-    @property
+    @memoizedProperty
     def timeUntilFullCharge(self)->float:
         if self.isChargedEnough and not self.isCharging:
             timeRemaining = 0
         
-        elif self.soc < self.BATTERY_IS_CHARGED_ENOUGH_SOC_THRESHOLD:
-            timeRemaining = (self.BATTERY_IS_CHARGED_ENOUGH_SOC_THRESHOLD - self.soc)*self.SECONDS_PER_SOC_PERCENTAGE_INCREASE + 20*60
-
-        elif self.isCharging:
-            timeRemaining = (20*60)*(self.current/self.MAX_CHARGING_CURRENT)
-        
         else:
-            timeRemaining = np.nan
+            # A battery that isn't charging (yet) is estimated as if it were charged at full current.
+            current = self.current if self.isCharging == True else self.MAX_CHARGING_CURRENT
+            temperatures = [temperature for temperature in self.temps.values() if temperature == temperature]
+            temperature = max(temperatures) if temperatures else np.nan
+            timeRemaining = self.CHARGE_TIME_ESTIMATOR.estimate(self.soc, current, temperature)
         
         return timeRemaining
     
     
-    @property
+    @memoizedProperty
     def timeUntilFullChargeInStrFormat(self)->str|float:
         try:
             timeStr = str(datetime.timedelta(seconds=self.timeUntilFullCharge))
@@ -370,7 +424,7 @@ class Battery:
             timeStr = np.nan
         return timeStr
     
-    @property
+    @memoizedProperty
     def isDeliverableToUser(self)->bool:
         if not self.isAddressable:
             res = False
@@ -393,6 +447,7 @@ class Battery:
     
     def proccessToStartChargeIsActive_setter(self, value)->bool:
         self.proccessToStartChargeIsActive_ = value
+        self.bumpGeneration()
         return None
 
 
@@ -402,9 +457,10 @@ class Battery:
     
     def proccessToFinishChargeIsActive_setter(self, value)->bool:
         self.proccessToFinishChargeIsActive_ = value
+        self.bumpGeneration()
         return None
 
-    @property
+    @memoizedProperty
     def isBusyWithChargeProcess(self):
         if self.proccessToStartChargeIsActive or self.proccessToFinishChargeIsActive:
             res = True
@@ -414,9 +470,86 @@ class Battery:
 
     
     
+    # STATION-WIDE STATES
+    # Same logic as the properties above, evaluated at once for every row of a StationStateTable.
+    # Tri-state results (True/False/nan) are returned as float arrays of 1/0/nan. Python's truthiness
+    # is kept throughout, i.e, a nan state counts as True (x != 0) and never as False (x == 0).
+
+    @classmethod
+    def getAddressableStates(cls, stateTable : StationStateTable)->np.ndarray:
+        v = stateTable.stateVectors
+        anyIsNan = np.isnan(v["inSlot"]) | np.isnan(v["bmsON"]) | np.isnan(v["bmsHasCanBusError"])
+        return ~anyIsNan & (v["inSlot"] != 0) & (v["bmsON"] != 0) & (v["waitingForAllData"] == 0) & (v["bmsHasCanBusError"] == 0)
+
+    @classmethod
+    def getDamagedStates(cls, stateTable : StationStateTable)->np.ndarray:
+        v = stateTable.stateVectors
+        isUndefined = (v["inSlot"] == 0) | (v["bmsON"] == 0) | (v["waitingForAllData"] != 0)
+
+        dataPacketsAreDamagedLogic  = stateTable.getHasNegatives("voltage") 
+        dataPacketsAreDamagedLogic |= stateTable.getHasNegatives("current")
+        dataPacketsAreDamagedLogic |= stateTable.getHasNegatives("soc")
+        dataPacketsAreDamagedLogic |= (stateTable.getMeans("current") > cls.BATTERY_IS_CHARGING_CURRENT_THRESHOLD) & (v["relayChanneOn"] == 0)
+
+        # Latch the flag exactly like 'isDamaged' does, bumping the generation of the batteries it changes.
+        toLatch = ~isUndefined & dataPacketsAreDamagedLogic
+        for row in np.flatnonzero(toLatch & (v["dataPacketsAreDamaged"] == 0)):
+            stateTable.batteries[row].bumpGeneration()
+        v["dataPacketsAreDamaged"][toLatch] = True
+        v["dataPacketsAreDamagedTimer"][toLatch] = v["currentGlobalTime"][toLatch]
+
+        # 'hasFatalWarnings' and 'hasCellImbalance' are nan (i.e, true) for batteries that aren't addressable.
+        isNotAddressable = ~cls.getAddressableStates(stateTable)
+        hasFatalWarnings = isNotAddressable | ((v["warningsMask"].astype(np.int64) & cls.FATAL_BATTERY_WARNINGS_MASK) != 0)
+        hasCellImbalance = isNotAddressable | (stateTable.cellVoltages.getStats()["delta"] > cls.CELL_IMBALANCE_THRESHOLD)
+        isDamaged = (v["bmsHasCanBusError"] != 0) | (v["dataPacketsAreDamaged"] != 0) | hasFatalWarnings | hasCellImbalance
+        return np.where(isUndefined, np.nan, isDamaged)
+
+    @classmethod
+    def getChargingStates(cls, stateTable : StationStateTable)->np.ndarray:
+        v = stateTable.stateVectors
+        isOff = (v["inSlot"] == 0) | (v["bmsON"] == 0) | (v["relayChanneOn"] == 0)
+        isUndefined = (v["waitingForAllData"] != 0) | (v["bmsHasCanBusError"] != 0) | (v["dataPacketsAreDamaged"] != 0)
+        isCharging = stateTable.getMeans("current") > cls.BATTERY_IS_CHARGING_CURRENT_THRESHOLD
+        return np.where(isOff, 0.0, np.where(isUndefined, np.nan, isCharging))
+
+    @classmethod
+    def getChargedEnoughStates(cls, stateTable : StationStateTable)->np.ndarray:
+        isChargedEnough = stateTable.getMeans("soc") >= cls.BATTERY_IS_CHARGED_ENOUGH_SOC_THRESHOLD
+        return np.where(cls.getAddressableStates(stateTable), isChargedEnough, np.nan)
+
+    @classmethod
+    def getBusyWithChargeProcessStates(cls, stateTable : StationStateTable)->np.ndarray:
+        v = stateTable.stateVectors
+        processIsActive = (v["proccessToStartChargeIsActive_"] != 0) | (v["proccessToFinishChargeIsActive_"] != 0)
+        return np.where(processIsActive, 1.0, cls.getChargingStates(stateTable))
+
+    @classmethod
+    def getDeliverableToUserStates(cls, stateTable : StationStateTable)->np.ndarray:
+        isDeliverable  = cls.getAddressableStates(stateTable)
+        isDeliverable &= cls.getDamagedStates(stateTable) == 0
+        isDeliverable &= cls.getBusyWithChargeProcessStates(stateTable) == 0
+        isDeliverable &= cls.getChargedEnoughStates(stateTable) != 0
+        isDeliverable &= stateTable.stateVectors["relayChanneOn"] == 0
+        return isDeliverable
+
+    @classmethod
+    def getCanProceedToBeChargedStates(cls, stateTable : StationStateTable)->np.ndarray:
+        canProceed  = cls.getAddressableStates(stateTable)
+        canProceed &= cls.getDamagedStates(stateTable) == 0
+        canProceed &= cls.getBusyWithChargeProcessStates(stateTable) == 0
+        canProceed &= cls.getChargedEnoughStates(stateTable) == 0
+        canProceed &= stateTable.stateVectors["relayChanneOn"] == 0
+        return canProceed
+
+    
+    
     def clearBuffers(self)->None:
-        for key in self.buffers.keys():
-            self.buffers[key].clear()
+        self.bumpGeneration()
+        self.stateTable.clearRow(self.row, StationStateTable.BATTERY_COLUMN_GROUPS)
+        self.stateTable.cellVoltages.clearRow(self.row)
+        self.buffers["warnings"].clear()
+        self.warningsMask = 0
         return None
     
     def _debugPrint(self)->None:
@@ -452,6 +585,9 @@ class Battery:
         print(f"hasFatalWarnings: {self.hasFatalWarnings}")
         print(f"dataPacketsAreDamaged: {self.dataPacketsAreDamaged}")
         print(f"isDamaged: {self.isDamaged}")
+        print(f"cellVoltages: {self.cellVoltages}")
+        print(f"cellVoltageDelta: {self.cellVoltageDelta}")
+        print(f"hasCellImbalance: {self.hasCellImbalance}")
         print(f"temps: {self.temps}")
         print(f"maxTemp: {self.maxTemp}")
         print(f"isCharging: {self.isCharging}")
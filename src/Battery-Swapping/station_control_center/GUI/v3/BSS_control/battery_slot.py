@@ -2,9 +2,12 @@ import numpy as np
 from array import array
 from typing import List
 from enum import Enum, unique
-from collections import deque
 from BSS_control.battery import Battery
-from PyQt5.QtCore import pyqtSignal, QObject
+from BSS_control.station_state_table import StationStateTable
+from BSS_control.memoization import (
+    GenerationMemoized,
+    memoizedProperty)
+from BSS_control.signals import Signal
 
 from BSS_control.CanUtils import (
     can_frame,
@@ -15,15 +18,18 @@ from BSS_control.CanUtils import (
 
 
 
-class BatterySlotSignals(QObject):
-    addCanMsgToQueue_slot1 = pyqtSignal(str)
-    addCanMsgToQueue_slot2 = pyqtSignal(str)
-    addCanMsgToQueue_slot3 = pyqtSignal(str)
-    addCanMsgToQueue_slot4 = pyqtSignal(str)
-    addCanMsgToQueue_slot5 = pyqtSignal(str)
-    addCanMsgToQueue_slot6 = pyqtSignal(str)
-    addCanMsgToQueue_slot7 = pyqtSignal(str)
-    addCanMsgToQueue_slot8 = pyqtSignal(str)
+class BatterySlotSignals:
+    addCanMsgToQueue_slot1 = Signal(str)
+    addCanMsgToQueue_slot2 = Signal(str)
+    addCanMsgToQueue_slot3 = Signal(str)
+    addCanMsgToQueue_slot4 = Signal(str)
+    addCanMsgToQueue_slot5 = Signal(str)
+    addCanMsgToQueue_slot6 = Signal(str)
+    addCanMsgToQueue_slot7 = Signal(str)
+    addCanMsgToQueue_slot8 = Signal(str)
+
+    # (slot address value, new limit switch state, timestamp [s] from the station's clock)
+    limitSwitchStateChanged = Signal(int, bool, float)
 
 @unique
 class SOLENOID_NAME(Enum):
@@ -40,7 +46,7 @@ class LED_STRIP_STATE(Enum):
     PURPLE = 4
 
 
-class BatterySlot:
+class BatterySlot(GenerationMemoized):
     DEQUE_MAXLEN = 5
     SIGNALS = BatterySlotSignals()
     CONTROL_CENTER_ADDRESS = MODULE_ADDRESS.CONTROL_CENTER
@@ -57,28 +63,32 @@ class BatterySlot:
     }
 
 
-    def __init__(self, moduleAddressToControl : MODULE_ADDRESS):
+    def __init__(self, moduleAddressToControl : MODULE_ADDRESS, stateTable : StationStateTable | None = None):
+        super().__init__()
+        # A slot that isn't part of a station (e.g, for debugging) gets a table of its own.
+        if stateTable is None:
+            stateTable = StationStateTable([moduleAddressToControl], Battery.DEQUE_MAXLEN, self.DEQUE_MAXLEN)
+        self.stateTable = stateTable
+        self.row = stateTable.rows[moduleAddressToControl]
         self.moduleAddressToControl = moduleAddressToControl
         self.buffers = {
-        "limitSwitchState"        : deque(maxlen=self.DEQUE_MAXLEN),
-        "batteryCanBusErrorState" : deque(maxlen=self.DEQUE_MAXLEN),
-        "ledStripState"           : deque(maxlen=self.DEQUE_MAXLEN),
-        "solenoidsStates"         : {SOLENOID_NAME.BMS          : deque(maxlen=self.DEQUE_MAXLEN),
-                                     SOLENOID_NAME.DOOR_LOCK    : deque(maxlen=self.DEQUE_MAXLEN),
-                                     SOLENOID_NAME.BATTERY_LOCK : deque(maxlen=self.DEQUE_MAXLEN)},
+        "limitSwitchState"        : stateTable.getRowView("limitSwitchState", self.row),
+        "batteryCanBusErrorState" : stateTable.getRowView("batteryCanBusErrorState", self.row),
+        "ledStripState"           : stateTable.getRowView("ledStripState", self.row),
+        "solenoidsStates"         : {SOLENOID_NAME.BMS          : stateTable.getRowView("bmsSolenoidState", self.row),
+                                     SOLENOID_NAME.DOOR_LOCK    : stateTable.getRowView("doorLockSolenoidState", self.row),
+                                     SOLENOID_NAME.BATTERY_LOCK : stateTable.getRowView("batteryLockSolenoidState", self.row)},
         }
-        self.battery = Battery(self.moduleAddressToControl)
+        self.battery = Battery(self.moduleAddressToControl, stateTable)
         self.currentGlobalTime = 0
+        self.lastLimitSwitchState = None # Last known (i.e, not nan) debounced limit switch state.
         return None
 
     def updateStatesFromCanMsg(self, canMsg : can_frame)->None:
         if canMsg.activityCode == ACTIVITY_CODE.net2rpy_PERIPHERALS_STATES_OF_BATTERY_SLOT_MODULE:
-            self.buffers["limitSwitchState"].append(canMsg.data[0])
-            self.buffers["ledStripState"].append(canMsg.data[1])
-            self.buffers["solenoidsStates"][SOLENOID_NAME.BMS].append(canMsg.data[2])
-            self.buffers["solenoidsStates"][SOLENOID_NAME.DOOR_LOCK].append(canMsg.data[3])
-            self.buffers["solenoidsStates"][SOLENOID_NAME.BATTERY_LOCK].append(canMsg.data[4])
-            self.buffers["batteryCanBusErrorState"].append(canMsg.data[5])
+            self.bumpGeneration()
+            # Same order as StationStateTable.SLOT_COLUMN_GROUPS["PERIPHERALS"].
+            self.stateTable.append("PERIPHERALS", self.row, tuple(canMsg.data[:6]))
         else:
             self.battery.updateStatesFromCanMsg(canMsg)
 
@@ -88,37 +98,52 @@ class BatterySlot:
                                                            self.solenoidsStates[SOLENOID_NAME.BMS.value])
         except TypeError:
             pass
+
+        if canMsg.activityCode == ACTIVITY_CODE.net2rpy_PERIPHERALS_STATES_OF_BATTERY_SLOT_MODULE:
+            self.emitLimitSwitchStateChange()
+        return None
+    
+    def emitLimitSwitchStateChange(self)->None:
+        # Edge-triggered: emitted once per change of the debounced state. Losing the data (nan) isn't a change,
+        # and the first known state is only taken as a reference.
+        limitSwitchState = self.limitSwitchState
+        if limitSwitchState != limitSwitchState:
+            return None
+        if self.lastLimitSwitchState is not None and limitSwitchState != self.lastLimitSwitchState:
+            self.SIGNALS.limitSwitchStateChanged.emit(self.moduleAddressToControl.value, limitSwitchState, self.stateTable.clock())
+        self.lastLimitSwitchState = limitSwitchState
         return None
     
     def updateCurrentGlobalTime(self, newCurrentGlobalTime : float)->None:
         self.currentGlobalTime = newCurrentGlobalTime
+        self.bumpGeneration()
         self.battery.updateCurrentGlobalTime(newCurrentGlobalTime)
         return None 
 
 
-    @property
+    @memoizedProperty
     def limitSwitchState(self)->bool | float:
         try:
-            res = bool(round(np.mean(self.buffers["limitSwitchState"])))
+            res = bool(round(self.buffers["limitSwitchState"].mean))
         except ValueError:
             res = np.nan
         return res
     
-    @property
+    @memoizedProperty
     def ledStripState(self)->LED_STRIP_STATE | float:
         try:
-            res = LED_STRIP_STATE(round(np.mean(self.buffers["ledStripState"])))
+            res = LED_STRIP_STATE(round(self.buffers["ledStripState"].mean))
         except ValueError:
             res = np.nan
         return res
     
-    @property
+    @memoizedProperty
     def solenoidsStates(self)->ArrayOfBool | float:
         try:
             res = array("B",[
-            bool(round(np.mean(self.buffers["solenoidsStates"][SOLENOID_NAME.BMS]))),
-            bool(round(np.mean(self.buffers["solenoidsStates"][SOLENOID_NAME.DOOR_LOCK]))),
-            bool(round(np.mean(self.buffers["solenoidsStates"][SOLENOID_NAME.BATTERY_LOCK])))
+            bool(round(self.buffers["solenoidsStates"][SOLENOID_NAME.BMS].mean)),
+            bool(round(self.buffers["solenoidsStates"][SOLENOID_NAME.DOOR_LOCK].mean)),
+            bool(round(self.buffers["solenoidsStates"][SOLENOID_NAME.BATTERY_LOCK].mean))
             ])
         except ValueError:
             res = np.nan
@@ -139,10 +164,10 @@ class BatterySlot:
         except TypeError: res = np.nan
         return res
     
-    @property
+    @memoizedProperty
     def batteryCanBusErrorState(self)->bool | float:
         try:
-            res = bool(round(np.mean(self.buffers["batteryCanBusErrorState"])))
+            res = bool(round(self.buffers["batteryCanBusErrorState"].mean))
         except ValueError:
             res = np.nan
         return res
@@ -200,7 +225,7 @@ class BatterySlot:
 
     def setLedStripState(self, state : LED_STRIP_STATE):
         data = [state.value, 0, 0, 0, 0, 0, 0, 0]
-        canMsg = can_frame.from_canIdParams(PRIORITY_LEVEL.HIGH_,
+        canMsg = can_frame.from_canIdParams(PRIORITY_LEVEL.MEDIUM,
                                             ACTIVITY_CODE.rpy2net_SET_LED_STRIP_STATE_OF_BATTERY_SLOT_MODULE,
                                             self.moduleAddressToControl,
                                             self.CONTROL_CENTER_ADDRESS,
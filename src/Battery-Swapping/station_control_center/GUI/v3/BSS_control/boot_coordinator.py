@@ -0,0 +1,102 @@
+import warnings
+from enum import Enum
+from math import isnan
+from typing import List
+
+
+
+class BOOT_PHASE(Enum):
+    OPENING_LINK = 0
+    WAITING_FOR_MODULES = 1
+    RECONCILING = 2
+    READY = 3
+
+
+class BootCoordinator:
+    """
+    Boots the station as soon as there is evidence that it's ready, rather than after fixed delays:
+
+        OPENING_LINK        : until the transport's link is open (see 'linkOpened').
+        WAITING_FOR_MODULES : until every slot and the relay have sent MIN_FRAMES_PER_MODULE frames and
+                              their peripherals' states are known, i.e, the hardware setup can be based on them.
+        RECONCILING         : the hardware setup is commanded, until the modules' feedback confirms all of
+                              its desired states (see PeripheralsReconciler.getUnconfirmedTargets).
+        READY
+
+    A phase that outlasts its timeout is given up on: the boot goes on (with a warning, and the phase
+    is marked as timed out in the report), so that a dead module can't keep the station from booting.
+    Times are the ControlCenter's global time [ms], i.e, since the station was started.
+    """
+    MIN_FRAMES_PER_MODULE = 5 # (A full debounce window of a slot's peripheral states, see StationStateTable.)
+    PHASE_TIMEOUTS = {
+        BOOT_PHASE.WAITING_FOR_MODULES : 10000, #[ms]
+        BOOT_PHASE.RECONCILING         : 10000, #[ms]
+    }
+
+    def __init__(self, controlCenter):
+        self.controlCenter = controlCenter
+        self.moduleAddresses = controlCenter.SLOT_ADDRESSES + [controlCenter.EIGHT_CHANNEL_RELAY_ADDRESS]
+        self.phase = BOOT_PHASE.OPENING_LINK
+        self.phaseStart = 0.0 #[ms]
+        self.isLinkOpen = False
+        self.phaseTimes = {} # BOOT_PHASE -> [duration [ms], timedOut]
+        return None
+
+    @property
+    def isReady(self)->bool:
+        return self.phase == BOOT_PHASE.READY
+
+    def linkOpened(self)->None:
+        self.isLinkOpen = True
+        return None
+
+    def getModulesNotReporting(self)->List:
+        res = []
+        for address in self.moduleAddresses:
+            module = self.controlCenter.modules[address]
+            if address == self.controlCenter.EIGHT_CHANNEL_RELAY_ADDRESS:
+                statesAreKnown = not isnan(module.channelsStates[0])
+            else:
+                statesAreKnown = not isnan(module.limitSwitchState)
+            if self.controlCenter.frameArrivalStats[address].numFrames < self.MIN_FRAMES_PER_MODULE or not statesAreKnown:
+                res.append(address)
+        return res
+
+    def update(self, now : float)->bool:
+        # Called on every tick (before the reconciliation). Returns True on the tick the station gets ready.
+        if self.phase == BOOT_PHASE.OPENING_LINK:
+            if self.isLinkOpen:
+                self.enterPhase(BOOT_PHASE.WAITING_FOR_MODULES, now)
+
+        elif self.phase == BOOT_PHASE.WAITING_FOR_MODULES:
+            modulesNotReporting = self.getModulesNotReporting()
+            if not modulesNotReporting or self.hasTimedOut(now, f"modules not reporting: {modulesNotReporting}"):
+                self.controlCenter.hardwareSetup()
+                self.enterPhase(BOOT_PHASE.RECONCILING, now)
+
+        elif self.phase == BOOT_PHASE.RECONCILING:
+            unconfirmedTargets = self.controlCenter.reconciler.getUnconfirmedTargets()
+            if not unconfirmedTargets or self.hasTimedOut(now, f"unconfirmed states: {unconfirmedTargets}"):
+                self.enterPhase(BOOT_PHASE.READY, now)
+                print(f"STATION READY: {self.getReport()}")
+                return True
+        return False
+
+    def hasTimedOut(self, now : float, reason : str)->bool:
+        res = now - self.phaseStart > self.PHASE_TIMEOUTS[self.phase]
+        if res:
+            warnings.warn(f"WARNING: Boot phase {self.phase.name} timed out ({reason}), booting on anyway")
+            self.phaseTimes[self.phase] = [now - self.phaseStart, True]
+        return res
+
+    def enterPhase(self, phase : BOOT_PHASE, now : float)->None:
+        if self.phase not in self.phaseTimes:
+            self.phaseTimes[self.phase] = [now - self.phaseStart, False]
+        self.phase = phase
+        self.phaseStart = now
+        return None
+
+    def getReport(self)->dict:
+        return {"phase"      : self.phase.name,
+                "bootTime"   : self.phaseStart if self.isReady else None, #[ms]
+                "phaseTimes" : {phase.name : {"duration" : duration, "timedOut" : timedOut} for phase, (duration, timedOut) in self.phaseTimes.items()}}
@@ -0,0 +1,155 @@
+import time
+import heapq
+from itertools import count
+from collections import deque
+from typing import Callable, Dict, Tuple
+
+from BSS_control.CanUtils import (
+    CanStr,
+    PRIORITY_LEVEL,
+    ACTIVITY_CODE)
+
+
+
+class CanMsgTxScheduler:
+    """
+    Outbound queue of CAN strings. Pending messages are ordered by the PRIORITY_LEVEL
+    encoded in their can_id (ULTRA_HIGH first, PRIORITY_LEVEL_NONE last) and then by age.
+    Each tick, messages are released until either the frame or the byte budget of the tick
+    is spent; whatever is left waits for the next tick.
+
+    SET-like commands are coalesced: a new command with the same key (destination, activity code,
+    target channel/solenoid) as a still pending one overwrites it in place, i.e, it keeps the
+    pending command's place in the queue. This is only done if no other command of the same family
+    was queued for that destination in the meantime, so the relative order of commands is preserved.
+    FLIP commands are never coalesced.
+    """
+    LATENCIES_MAXLEN = 100
+
+    COMMAND_FAMILIES = {
+        ACTIVITY_CODE.rpy2net_SET_STATE_OF_EIGHT_CHANNEL_RELAY_MODULE.value     : "RELAY",
+        ACTIVITY_CODE.rpy2net_SET_STATES_OF_EIGHT_CHANNEL_RELAY_MODULE.value    : "RELAY",
+        ACTIVITY_CODE.rpy2net_FLIP_STATE_OF_EIGHT_CHANNEL_RELAY_MODULE.value    : "RELAY",
+        ACTIVITY_CODE.rpy2net_FLIP_STATES_OF_EIGHT_CHANNEL_RELAY_MODULE.value   : "RELAY",
+        ACTIVITY_CODE.rpy2net_SET_SOLENOID_STATE_OF_BATTERY_SLOT_MODULE.value   : "SOLENOIDS",
+        ACTIVITY_CODE.rpy2net_SET_SOLENOIDS_STATES_OF_BATTERY_SLOT_MODULE.value : "SOLENOIDS",
+        ACTIVITY_CODE.rpy2net_FLIP_SOLENOID_STATE_OF_BATTERY_SLOT_MODULE.value  : "SOLENOIDS",
+        ACTIVITY_CODE.rpy2net_FLIP_SOLENOIDS_STATES_OF_BATTERY_SLOT_MODULE.value: "SOLENOIDS",
+        ACTIVITY_CODE.rpy2net_SET_LED_STRIP_STATE_OF_BATTERY_SLOT_MODULE.value  : "LED_STRIP",
+        ACTIVITY_CODE.rpy2net_RESET_BATTERY_CAN_BUS_ERROR_STATE_AND_TIMER.value : "CAN_BUS_ERROR",
+    }
+    # Activity code -> whether the target (channel/solenoid, i.e, data[0]) is part of the key.
+    COALESCABLE_ACTIVITY_CODES = {
+        ACTIVITY_CODE.rpy2net_SET_STATE_OF_EIGHT_CHANNEL_RELAY_MODULE.value     : True,
+        ACTIVITY_CODE.rpy2net_SET_STATES_OF_EIGHT_CHANNEL_RELAY_MODULE.value    : False,
+        ACTIVITY_CODE.rpy2net_SET_SOLENOID_STATE_OF_BATTERY_SLOT_MODULE.value   : True,
+        ACTIVITY_CODE.rpy2net_SET_SOLENOIDS_STATES_OF_BATTERY_SLOT_MODULE.value : False,
+        ACTIVITY_CODE.rpy2net_SET_LED_STRIP_STATE_OF_BATTERY_SLOT_MODULE.value  : False,
+        ACTIVITY_CODE.rpy2net_RESET_BATTERY_CAN_BUS_ERROR_STATE_AND_TIMER.value : False,
+    }
+
+    def __init__(self, maxFramesPerTick : int = 32, maxBytesPerTick : int = 1440, clock : Callable[[], float] = time.monotonic):
+        self.maxFramesPerTick = maxFramesPerTick
+        self.clock = clock
+        self.maxBytesPerTick = maxBytesPerTick
+        self.heap = []
+        self.sequence = count()
+        self.pendingByKey = {}
+        self.lastSequenceByFamily = {}
+        self.framesSentThisTick = 0
+        self.bytesSentThisTick = 0
+
+        # STATS
+        self.framesSent = 0
+        self.framesCoalesced = 0
+        self.latencies = deque(maxlen=self.LATENCIES_MAXLEN)
+        self.maxLatency = 0
+        return None
+
+    @staticmethod
+    def getPriorityOfCanStr(canStr : CanStr)->int:
+        priorityLevel = (int(canStr.split("-", 1)[0]) >> 26) & 0b111
+        if priorityLevel == PRIORITY_LEVEL.PRIORITY_LEVEL_NONE.value:
+            priorityLevel = len(PRIORITY_LEVEL)
+        return priorityLevel
+
+    @classmethod
+    def getKeysOfCanStr(cls, canStr : CanStr)->Tuple[Tuple | None, Tuple | None]:
+        canIdStr, dataStr = canStr.split("-", 1)
+        canId = int(canIdStr)
+        activityCode = (canId >> 16) & 0xFF
+        destinationAddress = (canId >> 8) & 0xFF
+
+        family = cls.COMMAND_FAMILIES.get(activityCode)
+        familyKey = (destinationAddress, family) if family is not None else None
+
+        if activityCode not in cls.COALESCABLE_ACTIVITY_CODES:
+            key = None
+        elif cls.COALESCABLE_ACTIVITY_CODES[activityCode]:
+            key = (destinationAddress, activityCode, int(dataStr.split(",", 1)[0]))
+        else:
+            key = (destinationAddress, activityCode, None)
+        return key, familyKey
+
+    def push(self, canStr : CanStr)->None:
+        key, familyKey = self.getKeysOfCanStr(canStr)
+        pendingEntry = self.pendingByKey.get(key)
+
+        if pendingEntry is not None and self.lastSequenceByFamily.get(familyKey) == pendingEntry[2]:
+            pendingEntry[3] = canStr
+            self.framesCoalesced += 1
+            return None
+        
+        # [priority, enqueueTime, sequence, canStr, key]
+        entry = [self.getPriorityOfCanStr(canStr), self.clock(), next(self.sequence), canStr, key]
+        heapq.heappush(self.heap, entry)
+        if key is not None:
+            self.pendingByKey[key] = entry
+        if familyKey is not None:
+            self.lastSequenceByFamily[familyKey] = entry[2]
+        return None
+
+    def startNewTick(self)->None:
+        self.framesSentThisTick = 0
+        self.bytesSentThisTick = 0
+        return None
+
+    def pop(self)->CanStr | None:
+        if not self.heap:
+            return None
+        if self.framesSentThisTick >= self.maxFramesPerTick:
+            return None
+        if self.bytesSentThisTick + len(self.heap[0][3]) > self.maxBytesPerTick:
+            return None
+
+        entry = heapq.heappop(self.heap)
+        _, enqueueTime, _, canStr, key = entry
+        if self.pendingByKey.get(key) is entry:
+            del self.pendingByKey[key]
+        self.framesSentThisTick += 1
+        self.bytesSentThisTick += len(canStr)
+
+        latency = 1000*(self.clock() - enqueueTime)
+        self.latencies.append(latency)
+        self.maxLatency = max(self.maxLatency, latency)
+        self.framesSent += 1
+        return canStr
+
+    def __len__(self)->int:
+        return len(self.heap)
+
+    @property
+    def queueDepth(self)->int:
+        return len(self.heap)
+
+    @property
+    def stats(self)->Dict[str, float]:
+        # Latencies are given in [ms].
+        return {
+            "queueDepth"      : self.queueDepth,
+            "framesSent"      : self.framesSent,
+            "framesCoalesced" : self.framesCoalesced,
+            "lastLatency"     : self.latencies[-1] if self.latencies else 0,
+            "meanLatency"     : sum(self.latencies)/len(self.latencies) if self.latencies else 0,
+            "maxLatency"      : self.maxLatency
+        }
@@ -0,0 +1,210 @@
+from enum import Enum, unique
+from typing import Callable, Dict, List, Tuple
+from BSS_control.CanUtils import MODULE_ADDRESS
+
+
+
+class TimerHandle:
+    __slots__ = ("deadline", "tick", "order", "callback", "cancelled")
+
+    def __init__(self, deadline : float, tick : int, order : int, callback : Callable[[], None]):
+        self.deadline = deadline
+        self.tick = tick
+        self.order = order
+        self.callback = callback
+        self.cancelled = False
+        return None
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel driven by the global time [ms]: every deadline goes into one of NUM_BUCKETS
+    buckets RESOLUTION ms wide, so scheduling and cancelling are O(1), and advancing the time only
+    visits the buckets it goes through. Deadlines more than one turn of the wheel away just stay in
+    their bucket until their turn comes.
+
+    Timers fire from 'advance', in order of deadline (and of scheduling, for equal deadlines), on the
+    first call whose time has reached their deadline, whether or not the time is aligned on RESOLUTION
+    (the timers of a bucket that aren't due yet are left in it). Cancelled timers are dropped when their
+    bucket is visited.
+    """
+    RESOLUTION = 250 #[ms] (The period of the global timer that drives it.)
+    NUM_BUCKETS = 64
+
+    def __init__(self, now : float = 0):
+        self.buckets = [[] for _ in range(self.NUM_BUCKETS)]
+        self.currentTick = int(now // self.RESOLUTION)
+        self.numScheduled = 0
+        self.numPending = 0
+        return None
+
+    def schedule(self, deadline : float, callback : Callable[[], None])->TimerHandle:
+        # Deadlines that are already due fire on the next call to 'advance'.
+        tick = max(int(deadline // self.RESOLUTION), self.currentTick)
+        handle = TimerHandle(deadline, tick, self.numScheduled, callback)
+        self.buckets[tick % self.NUM_BUCKETS].append(handle)
+        self.numScheduled += 1
+        self.numPending += 1
+        return handle
+
+    def cancel(self, handle : TimerHandle)->None:
+        if not handle.cancelled:
+            handle.cancelled = True
+            self.numPending -= 1
+        return None
+
+    def advance(self, now : float)->None:
+        newTick = int(now // self.RESOLUTION)
+        if newTick < self.currentTick:
+            return None
+
+        # (The current bucket is visited again, as it may hold timers that weren't due on the last call.)
+        due = []
+        for tick in range(self.currentTick, min(newTick, self.currentTick + self.NUM_BUCKETS - 1) + 1):
+            bucket = self.buckets[tick % self.NUM_BUCKETS]
+            due += [handle for handle in bucket if handle.deadline <= now and not handle.cancelled]
+            bucket[:] = [handle for handle in bucket if handle.deadline > now and not handle.cancelled]
+        # Timers scheduled by the callbacks are relative to the new time.
+        self.currentTick = newTick
+
+        for handle in sorted(due, key=lambda handle: (handle.deadline, handle.order)):
+            if not handle.cancelled: # (A callback may cancel the timers that follow it.)
+                handle.cancelled = True
+                self.numPending -= 1
+                handle.callback()
+        return None
+
+    def __len__(self)->int:
+        return self.numPending
+
+
+@unique
+class CHARGE_SEQUENCE_STATE(Enum):
+    IDLE             = 0
+    STARTING_CHARGE  = 1
+    FINISHING_CHARGE = 2
+    FORCING_STOP     = 3
+
+
+class ChargeSequence:
+    """
+    One run of a charge sequence on a slot: its steps, as (offset [ms], name, callback), and how long
+    [ms] the slot stays busy with it. 'setBusy' is called with True when it starts and with False
+    when it ends or is cancelled.
+    """
+    def __init__(self, state : CHARGE_SEQUENCE_STATE, startTime : float, steps : List[Tuple[float, str, Callable[[], None]]],
+                 duration : float, setBusy : Callable[[bool], None]):
+        self.state = state
+        self.startTime = startTime
+        self.steps = steps
+        self.endTime = startTime + duration
+        self.setBusy = setBusy
+        self.handles = []
+        self.doneSteps = []
+        return None
+
+    @property
+    def pendingSteps(self)->List[Tuple[str, float]]:
+        doneSteps = set(self.doneSteps)
+        return [(name, self.startTime + offset) for offset, name, _ in self.steps if name not in doneSteps]
+
+
+class ChargeSequencer:
+    """
+    Runs the charge sequences of every slot (at most one per slot) on a TimerWheel, so that every
+    step and the end of the busy window of every sequence have an explicit deadline that can be
+    inspected and cancelled.
+
+    A new sequence only preempts the one in flight on the same slot if it has a higher priority
+    (i.e, a forced stop cancels a pending start or finish). Otherwise, it's rejected.
+    """
+    PRIORITIES = {
+        CHARGE_SEQUENCE_STATE.STARTING_CHARGE  : 0,
+        CHARGE_SEQUENCE_STATE.FINISHING_CHARGE : 0,
+        CHARGE_SEQUENCE_STATE.FORCING_STOP     : 1,
+    }
+
+    def __init__(self, slotAddresses : List[MODULE_ADDRESS], timerWheel : TimerWheel):
+        self.timerWheel = timerWheel
+        self.sequences : Dict[MODULE_ADDRESS, ChargeSequence | None] = {slotAddress : None for slotAddress in slotAddresses}
+
+        # STATS
+        self.sequencesStarted = 0
+        self.sequencesRejected = 0
+        self.sequencesPreempted = 0
+        return None
+
+    def getState(self, slotAddress : MODULE_ADDRESS)->CHARGE_SEQUENCE_STATE:
+        sequence = self.sequences[slotAddress]
+        return CHARGE_SEQUENCE_STATE.IDLE if sequence is None else sequence.state
+
+    def start(self, slotAddress : MODULE_ADDRESS, state : CHARGE_SEQUENCE_STATE, now : float,
+              steps : List[Tuple[float, str, Callable[[], None]]], duration : float, setBusy : Callable[[bool], None])->bool:
+        """
+        Starts a sequence on a slot. Steps with a null offset run right away. Returns whether it was started.
+        """
+        current = self.sequences[slotAddress]
+        if current is not None:
+            if self.PRIORITIES[state] <= self.PRIORITIES[current.state]:
+                self.sequencesRejected += 1
+                return False
+            self.cancel(slotAddress)
+            self.sequencesPreempted += 1
+
+        sequence = ChargeSequence(state, now, steps, duration, setBusy)
+        self.sequences[slotAddress] = sequence
+        self.sequencesStarted += 1
+        sequence.setBusy(True)
+
+        for offset, name, callback in steps:
+            if offset > 0:
+                sequence.handles.append(self.timerWheel.schedule(now + offset, lambda sequence=sequence, name=name, callback=callback: self.runStep(sequence, name, callback)))
+        sequence.handles.append(self.timerWheel.schedule(sequence.endTime, lambda: self.finish(slotAddress, sequence)))
+
+        for offset, name, callback in steps:
+            if offset <= 0:
+                self.runStep(sequence, name, callback)
+        return True
+
+    def runStep(self, sequence : ChargeSequence, name : str, callback : Callable[[], None])->None:
+        sequence.doneSteps.append(name)
+        callback()
+        return None
+
+    def finish(self, slotAddress : MODULE_ADDRESS, sequence : ChargeSequence)->None:
+        if self.sequences[slotAddress] is sequence:
+            self.sequences[slotAddress] = None
+            sequence.setBusy(False)
+        return None
+
+    def cancel(self, slotAddress : MODULE_ADDRESS)->bool:
+        """
+        Drops the pending steps of the sequence in flight on a slot (the steps already run aren't undone)
+        and ends its busy window. Returns whether there was one.
+        """
+        sequence = self.sequences[slotAddress]
+        if sequence is None:
+            return False
+        for handle in sequence.handles:
+            self.timerWheel.cancel(handle)
+        self.sequences[slotAddress] = None
+        sequence.setBusy(False)
+        return True
+
+
+    # INTROSPECTION
+    def getStatus(self, slotAddress : MODULE_ADDRESS)->dict:
+        sequence = self.sequences[slotAddress]
+        if sequence is None:
+            return {"state" : CHARGE_SEQUENCE_STATE.IDLE}
+        return {"state"        : sequence.state,
+                "startTime"    : sequence.startTime,
+                "endTime"      : sequence.endTime,
+                "doneSteps"    : list(sequence.doneSteps),
+                "pendingSteps" : sequence.pendingSteps}
+
+    def getInFlightSteps(self)->List[Tuple[MODULE_ADDRESS, CHARGE_SEQUENCE_STATE, str, float]]:
+        # (slot, sequence, step, deadline [ms]) of every step still pending, soonest first.
+        steps = [(slotAddress, sequence.state, name, deadline) for slotAddress, sequence in self.sequences.items()
+                 if sequence is not None for name, deadline in sequence.pendingSteps]
+        return sorted(steps, key=lambda step: step[3])
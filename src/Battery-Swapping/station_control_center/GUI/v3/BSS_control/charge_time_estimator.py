@@ -0,0 +1,236 @@
+import os
+import warnings
+import numpy as np
+from typing import List, Tuple
+
+
+
+def extractChargeSessions(records : np.ndarray, chargingCurrentThreshold : float, chargedEnoughSoc : float,
+                          maxGap : float = 60)->List[Tuple[np.ndarray, float]]:
+    """
+    Splits telemetry records (see telemetry_history.TELEMETRY_RECORD_DTYPE) into completed charge
+    sessions, i.e, runs of records with current > chargingCurrentThreshold that end (the next record
+    isn't charging anymore) with SOC >= chargedEnoughSoc. Sessions that were interrupted, or that
+    have a hole of more than 'maxGap' [s] in the records (e.g, the app was restarted), are dropped.
+
+    Returns a list of (records of the session, timestamp at which the charge ended).
+    """
+    if len(records) < 2:
+        return []
+    timestamps = records["timestamp"]
+    isCharging = records["current"] > chargingCurrentThreshold
+    hasGap = np.diff(timestamps) > maxGap
+
+    # Boundaries of the runs of consecutive records that share the same 'isCharging' state without holes.
+    boundaries = np.flatnonzero((isCharging[1:] != isCharging[:-1]) | hasGap) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(records)]))
+
+    sessions = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if not isCharging[start] or end == len(records) or hasGap[end-1]:
+            continue
+        if records["soc"][end-1] >= chargedEnoughSoc:
+            sessions.append((records[start:end], timestamps.item(end)))
+    return sessions
+
+
+class ChargeTimeEstimator:
+    """
+    Estimates the time [s] until a battery finishes charging from its (SOC, current, temperature),
+    by trilinear interpolation in a lookup table over the grid SOC_AXIS x CURRENT_AXIS x TEMPERATURE_AXIS.
+
+    The table is fitted from completed charge sessions: every record of a session is spread over the
+    8 grid points around it (with its interpolation weights), which accumulate the time that was
+    actually left until the end of the charge. Each grid point is the weighted mean of its samples
+    blended with PRIOR_WEIGHT samples of the constant-rate formula the station has always used, so
+    grid points without data (and a station without history) fall back to that formula. Since only
+    sums and weights are kept, adding a session refits the table incrementally.
+    """
+    SOC_AXIS = (0, 1, 101)              #[%]  (origin, step, number of points)
+    CURRENT_AXIS = (0, 1, 13)           #[A]
+    TEMPERATURE_AXIS = (-10, 5, 15)     #[°C]
+    REFERENCE_TEMPERATURE = 25 #[°C] (Used when the temperature isn't known.)
+    PRIOR_WEIGHT = 20 #[samples] (About one second of records.)
+    TAIL_TIME = 20*60 #[s] (Time the formula allows for the end of the charge, above the charged enough SOC.)
+
+    def __init__(self, chargingCurrentThreshold : float, chargedEnoughSoc : float, maxChargingCurrent : float,
+                 secondsPerSocPercentageIncrease : float):
+        self.chargingCurrentThreshold = chargingCurrentThreshold
+        self.chargedEnoughSoc = chargedEnoughSoc
+        self.maxChargingCurrent = maxChargingCurrent
+        self.secondsPerSocPercentageIncrease = secondsPerSocPercentageIncrease
+
+        self.shape = (self.SOC_AXIS[2], self.CURRENT_AXIS[2], self.TEMPERATURE_AXIS[2])
+        socs, currents, _ = np.meshgrid(*(origin + step*np.arange(size) for origin, step, size in self.axes), indexing="ij")
+        self.prior = self.formulaEstimate(socs, currents).ravel()
+        self.sums = np.zeros(self.prior.size)
+        self.weights = np.zeros(self.prior.size)
+        self.numSessions = 0
+        self.refit()
+        return None
+
+    @property
+    def axes(self)->Tuple[Tuple[float, float, int], ...]:
+        return (self.SOC_AXIS, self.CURRENT_AXIS, self.TEMPERATURE_AXIS)
+
+    def formulaEstimate(self, soc, current):
+        """
+        Constant-rate estimate (i.e, what Battery.timeUntilFullCharge used to be), vectorized.
+        """
+        soc, current = np.asarray(soc, dtype=float), np.asarray(current, dtype=float)
+        return np.where(soc < self.chargedEnoughSoc,
+                        (self.chargedEnoughSoc - soc)*self.secondsPerSocPercentageIncrease + self.TAIL_TIME,
+                        self.TAIL_TIME*current/self.maxChargingCurrent)
+
+    def refit(self)->None:
+        table = (self.PRIOR_WEIGHT*self.prior + self.sums)/(self.PRIOR_WEIGHT + self.weights)
+        # A flat list is what makes 'estimate' cheap: 8 list lookups instead of 8 numpy calls.
+        self.table = table.tolist()
+        return None
+
+
+    # EVALUATION
+    def estimate(self, soc : float, current : float, temperature : float = np.nan)->float:
+        if soc != soc or current != current:
+            return np.nan
+        if temperature != temperature:
+            temperature = self.REFERENCE_TEMPERATURE
+
+        i, u = _gridPosition(soc, *self.SOC_AXIS)
+        j, v = _gridPosition(current, *self.CURRENT_AXIS)
+        k, w = _gridPosition(temperature, *self.TEMPERATURE_AXIS)
+        table = self.table
+        numCurrents, numTemperatures = self.shape[1], self.shape[2]
+        res = 0.0
+        for di, weightI in ((0, 1-u), (1, u)):
+            for dj, weightJ in ((0, 1-v), (1, v)):
+                index = ((i+di)*numCurrents + j+dj)*numTemperatures + k
+                res += weightI*weightJ*((1-w)*table[index] + w*table[index+1])
+        return res
+
+    def estimateMany(self, socs : np.ndarray, currents : np.ndarray, temperatures : np.ndarray)->np.ndarray:
+        table = np.asarray(self.table)
+        res = np.zeros(len(socs))
+        for indices, weights in self.getCornerWeights(socs, currents, temperatures):
+            res += weights*table[indices]
+        return res
+
+    def getCornerWeights(self, socs : np.ndarray, currents : np.ndarray, temperatures : np.ndarray)->List[Tuple[np.ndarray, np.ndarray]]:
+        # Flat indices of the 8 grid points around every sample and their trilinear weights.
+        temperatures = np.where(np.isnan(temperatures), self.REFERENCE_TEMPERATURE, temperatures)
+        (i, u), (j, v), (k, w) = (_gridPositions(np.asarray(values, dtype=float), *axis)
+                                  for values, axis in zip((socs, currents, temperatures), self.axes))
+        corners = []
+        for di, weightI in ((0, 1-u), (1, u)):
+            for dj, weightJ in ((0, 1-v), (1, v)):
+                for dk, weightK in ((0, 1-w), (1, w)):
+                    indices = np.ravel_multi_index((i+di, j+dj, k+dk), self.shape)
+                    corners.append((indices, weightI*weightJ*weightK))
+        return corners
+
+
+    # FITTING
+    def addSession(self, records : np.ndarray, endTime : float)->None:
+        temperatures = np.fmax.reduce(records["temperatures"], axis=1)
+        timesLeft = endTime - records["timestamp"]
+        for indices, weights in self.getCornerWeights(records["soc"], records["current"], temperatures):
+            self.sums += np.bincount(indices, weights*timesLeft, minlength=self.sums.size)
+            self.weights += np.bincount(indices, weights, minlength=self.weights.size)
+        self.numSessions += 1
+        self.refit()
+        return None
+
+    def addRecords(self, records : np.ndarray)->int:
+        """
+        Fits the table with the completed charge sessions found in 'records'. Returns how many there were.
+        """
+        sessions = extractChargeSessions(records, self.chargingCurrentThreshold, self.chargedEnoughSoc)
+        for sessionRecords, endTime in sessions:
+            self.addSession(sessionRecords, endTime)
+        return len(sessions)
+
+    def benchmark(self, sessions : List[Tuple[np.ndarray, float]])->dict:
+        """
+        Mean absolute error [s] of the table and of the constant-rate formula over the records of 'sessions'
+        (which, for a fair comparison, shouldn't be the ones the table was fitted with).
+        """
+        if not sessions:
+            return {"numSamples" : 0, "table" : np.nan, "formula" : np.nan}
+        records = np.concatenate([sessionRecords for sessionRecords, _ in sessions])
+        timesLeft = np.concatenate([endTime - sessionRecords["timestamp"] for sessionRecords, endTime in sessions])
+        temperatures = np.fmax.reduce(records["temperatures"], axis=1)
+        tableEstimates = self.estimateMany(records["soc"], records["current"], temperatures)
+        formulaEstimates = self.formulaEstimate(records["soc"], records["current"])
+        return {"numSamples" : len(records),
+                "table"      : float(np.mean(np.abs(tableEstimates - timesLeft))),
+                "formula"    : float(np.mean(np.abs(formulaEstimates - timesLeft)))}
+
+
+    # PERSISTENCE
+    def save(self, path : str)->None:
+        # Written aside and then renamed, so that a crash can't leave a truncated file behind.
+        temporaryPath = f"{path}.tmp.npz"
+        np.savez(temporaryPath, axes=np.array(self.axes, dtype=float), sums=self.sums, weights=self.weights, numSessions=self.numSessions)
+        os.replace(temporaryPath, path)
+        return None
+
+    def load(self, path : str)->bool:
+        try:
+            with np.load(path) as data:
+                if not np.array_equal(data["axes"], np.array(self.axes, dtype=float)):
+                    warnings.warn(f"WARNING: '{path}' was fitted on another grid. It will be ignored.")
+                    return False
+                self.sums, self.weights, self.numSessions = data["sums"], data["weights"], int(data["numSessions"])
+        except (OSError, KeyError, ValueError) as e:
+            warnings.warn(f"WARNING: Couldn't load the charge time tables from '{path}': {e}")
+            return False
+        self.refit()
+        return True
+
+
+def _gridPosition(value : float, origin : float, step : float, size : int)->Tuple[int, float]:
+    # Index of the grid cell 'value' falls in and its position inside it (values off the grid are clamped).
+    x = min(max((value - origin)/step, 0), size - 1)
+    i = min(int(x), size - 2)
+    return i, x - i
+
+def _gridPositions(values : np.ndarray, origin : float, step : float, size : int)->Tuple[np.ndarray, np.ndarray]:
+    x = np.clip((values - origin)/step, 0, size - 1)
+    i = np.minimum(x.astype(np.intp), size - 2)
+    return i, x - i
+
+
+
+#%%                    OFFLINE FIT
+
+if __name__ == "__main__":
+    import argparse
+    from BSS_control.battery import Battery
+    from BSS_control.telemetry_history import TelemetryRing
+
+    parser = argparse.ArgumentParser(description="Fits the charge time tables from the telemetry history of a station.")
+    parser.add_argument("directory", help="Telemetry history directory (see TelemetryHistory).")
+    parser.add_argument("output", help="Tables file (.npz).")
+    parser.add_argument("--test-fraction", type=float, default=0.2, help="Fraction of the latest sessions held out for the benchmark.")
+    args = parser.parse_args()
+
+    sessions = []
+    for fileName in sorted(os.listdir(args.directory)):
+        if fileName.endswith(".telemetry"):
+            ring = TelemetryRing(os.path.join(args.directory, fileName), None)
+            sessions += extractChargeSessions(ring.read(), Battery.BATTERY_IS_CHARGING_CURRENT_THRESHOLD, Battery.BATTERY_IS_CHARGED_ENOUGH_SOC_THRESHOLD)
+    sessions.sort(key=lambda session: session[1])
+    numTestSessions = round(args.test_fraction*len(sessions))
+    trainSessions, testSessions = sessions[:len(sessions)-numTestSessions], sessions[len(sessions)-numTestSessions:]
+
+    estimator = Battery.CHARGE_TIME_ESTIMATOR
+    for sessionRecords, endTime in trainSessions:
+        estimator.addSession(sessionRecords, endTime)
+    print(f"SESSIONS: {len(trainSessions)} FITTED, {len(testSessions)} HELD OUT")
+    print(f"MEAN ABSOLUTE ERROR [s]: {estimator.benchmark(testSessions)}")
+
+    # The tables are refitted with every session before being saved.
+    for sessionRecords, endTime in testSessions:
+        estimator.addSession(sessionRecords, endTime)
+    estimator.save(args.output)
@@ -1,15 +1,23 @@
+import os
+import time
 import warnings
 from math import isnan
-from collections import deque
 from functools import partial
 from typing import Callable, List
+from concurrent.futures import Executor
 from BSS_control import CanUtils as canUtils
+from BSS_control.can_msg_scheduler import CanMsgTxScheduler
+from BSS_control.peripherals_reconciler import PeripheralsReconciler
+from BSS_control.station_state_table import StationStateTable
+from BSS_control.slot_state_index import SlotStateIndex, SlotStatesQuery
+from BSS_control.telemetry_history import TelemetryHistory
+from BSS_control.frame_arrival_stats import FrameArrivalStats
+from BSS_control.tick_drift_stats import TickDriftStats
+from BSS_control.charge_sequencer import TimerWheel, TimerHandle, ChargeSequencer, CHARGE_SEQUENCE_STATE
+from BSS_control.battery import Battery
 
 
-from PyQt5.QtCore import (
-    QTimer,
-    QObject,
-    pyqtSignal)
+from BSS_control.signals import Signal
 
 from BSS_control.eight_channel_relay import (
     EightChannelRelay, 
@@ -23,28 +31,29 @@ from BSS_control.battery_slot import (
 from BSS_control.CanUtils import (
     can_frame,
     MODULE_ADDRESS,
+    ACTIVITY_CODE,
     CanStr)
 
-class ControlCenterSignals(QObject):
-    sendCanMsg = pyqtSignal(str)
-
-    proccessToStartChargeIsActive_slot1 = pyqtSignal(bool)
-    proccessToStartChargeIsActive_slot2 = pyqtSignal(bool)
-    proccessToStartChargeIsActive_slot3 = pyqtSignal(bool)
-    proccessToStartChargeIsActive_slot4 = pyqtSignal(bool)
-    proccessToStartChargeIsActive_slot5 = pyqtSignal(bool)
-    proccessToStartChargeIsActive_slot6 = pyqtSignal(bool)
-    proccessToStartChargeIsActive_slot7 = pyqtSignal(bool)
-    proccessToStartChargeIsActive_slot8 = pyqtSignal(bool)
-
-    proccessToFinishChargeIsActive_slot1 = pyqtSignal(bool)
-    proccessToFinishChargeIsActive_slot2 = pyqtSignal(bool)
-    proccessToFinishChargeIsActive_slot3 = pyqtSignal(bool)
-    proccessToFinishChargeIsActive_slot4 = pyqtSignal(bool)
-    proccessToFinishChargeIsActive_slot5 = pyqtSignal(bool)
-    proccessToFinishChargeIsActive_slot6 = pyqtSignal(bool)
-    proccessToFinishChargeIsActive_slot7 = pyqtSignal(bool)
-    proccessToFinishChargeIsActive_slot8 = pyqtSignal(bool)
+class ControlCenterSignals:
+    sendCanMsg = Signal(str)
+
+    proccessToStartChargeIsActive_slot1 = Signal(bool)
+    proccessToStartChargeIsActive_slot2 = Signal(bool)
+    proccessToStartChargeIsActive_slot3 = Signal(bool)
+    proccessToStartChargeIsActive_slot4 = Signal(bool)
+    proccessToStartChargeIsActive_slot5 = Signal(bool)
+    proccessToStartChargeIsActive_slot6 = Signal(bool)
+    proccessToStartChargeIsActive_slot7 = Signal(bool)
+    proccessToStartChargeIsActive_slot8 = Signal(bool)
+
+    proccessToFinishChargeIsActive_slot1 = Signal(bool)
+    proccessToFinishChargeIsActive_slot2 = Signal(bool)
+    proccessToFinishChargeIsActive_slot3 = Signal(bool)
+    proccessToFinishChargeIsActive_slot4 = Signal(bool)
+    proccessToFinishChargeIsActive_slot5 = Signal(bool)
+    proccessToFinishChargeIsActive_slot6 = Signal(bool)
+    proccessToFinishChargeIsActive_slot7 = Signal(bool)
+    proccessToFinishChargeIsActive_slot8 = Signal(bool)
     
 
 
@@ -53,6 +62,57 @@ class ControlCenter:
     SLOT_ADDRESSES = [MODULE_ADDRESS(i) for i in [1,4,5,8]]
     CONTROL_CENTER_ADDRESS = MODULE_ADDRESS.CONTROL_CENTER
     EIGHT_CHANNEL_RELAY_ADDRESS = MODULE_ADDRESS.EIGHT_CHANNEL_RELAY
+    TX_MAX_FRAMES_PER_TICK = 32
+    TX_MAX_BYTES_PER_TICK = 1440 #[bytes] (Roughly half of what a 115200 baud link carries in 250 ms)
+    CHARGE_SEQUENCE_STEP_DELAY = 250 #[ms]
+    CHARGE_SEQUENCE_BUSY_TIME = 6000 #[ms]
+    FORCED_STOP_RELAY_DELAY = 10000 #[ms] (Gives the charger time to wind down before its relay channel is opened.)
+    FORCED_STOP_BMS_DELAY = 11000 #[ms]
+    FORCED_STOP_BUSY_TIME = 12000 #[ms]
+    CHARGE_TIME_TABLES_FILE_NAME = "charge_time_tables.npz" # (Kept in the telemetry history directory.)
+
+    # keyword : (isSlotAttr, attrName), i.e, the state of the BatterySlot/Battery each keyword matches.
+    STATES_TO_MATCH_LOGIC = {
+        "LIMIT_SWITCH"                       : (True,  "limitSwitchState"),
+        "LED_STRIP"                          : (True,  "ledStripState"), 
+        "BMS_SOLENOID"                       : (True,  "bmsSolenoidState"),
+        "DOOR_LOCK_SOLENOID"                 : (True,  "doorLockSolenoidState"),
+        "BATTERY_LOCK_SOLENOID"              : (True,  "batteryLockSolenoidState"),
+
+        "BATTERY_IN_SLOT"                    : (True,  "limitSwitchState"),
+        "BATTERY_BMS_IS_ON"                  : (True,  "bmsSolenoidState"),
+        "BATTERY_BMS_HAS_CAN_BUS_ERROR"      : (True,  "batteryCanBusErrorState"),
+        "BATTERY_IS_WAITING_FOR_ALL_DATA"    : (False, "waitingForAllData"), 
+            
+
+        "BATTERY_IS_ADDRESSABLE"              : (False, "isAddressable"),
+        "BATTERY_IS_CHARGING"                 : (False, "isCharging"),
+        "BATTERY_IS_CHARGED_ENOUGH"           : (False, "isChargedEnough"),
+        "BATTERY_CAN_PROCEED_TO_BE_CHARGED"   : (False, "canProceedToBeCharged"),
+        "BATTERY_HAS_WARNINGS"                : (False, "hasWarnings"),
+        "BATTERY_HAS_FATAL_WARNINGS"          : (False, "hasFatalWarnings"),
+        "BATTERY_IS_DAMAGED"                  : (False, "isDamaged"),
+        "BATTERY_IS_DELIVERABLE_TO_USER"      : (False, "isDeliverableToUser"),
+        "BATTERY_IS_BUSY_WITH_CHARGE_PROCESS" : (False, "isBusyWithChargeProcess"),
+        "BATTERY_RELAY_CHANNEL_IS_ON"         : (False, "relayChanneOn"),
+
+        "PROCESS_TO_START_BATTERY_CHARGE_IS_ACTIVE"   : (False, "proccessToStartChargeIsActive"),
+        "PROCESS_TO_FINISH_BATTERY_CHARGE_IS_ACTIVE"  : (False, "proccessToFinishChargeIsActive")
+    }
+
+    # Precompiled queries of the helpers below.
+    FREE_SLOTS_QUERY        = SlotStatesQuery.compile({"BATTERY_IN_SLOT"    : False}, STATES_TO_MATCH_LOGIC)
+    DAMAGED_SLOTS_QUERY     = SlotStatesQuery.compile({"BATTERY_IS_DAMAGED" : True},  STATES_TO_MATCH_LOGIC)
+    DELIVERABLE_SLOTS_QUERY = SlotStatesQuery.compile({"BATTERY_IS_DELIVERABLE_TO_USER" : True}, STATES_TO_MATCH_LOGIC)
+    ELIGIBLE_SLOTS_QUERY    = SlotStatesQuery.compile({"BATTERY_IS_ADDRESSABLE" : True,
+                                                       "BATTERY_IS_DAMAGED"     : False}, STATES_TO_MATCH_LOGIC)
+    BMS_SHOULD_BE_ON_QUERY  = SlotStatesQuery.compile({"BATTERY_IN_SLOT"                     : True,
+                                                       "BATTERY_BMS_IS_ON"                   : False,
+                                                       "BATTERY_IS_BUSY_WITH_CHARGE_PROCESS" : False,
+                                                       "BATTERY_RELAY_CHANNEL_IS_ON"         : False}, STATES_TO_MATCH_LOGIC)
+    BMS_SHOULD_BE_OFF_QUERY = SlotStatesQuery.compile({"BATTERY_BMS_IS_ON"                   : True,
+                                                       "BATTERY_IS_BUSY_WITH_CHARGE_PROCESS" : False,
+                                                       "BATTERY_RELAY_CHANNEL_IS_ON"         : False}, STATES_TO_MATCH_LOGIC)
 
     SIGNALS_DICT_START_CHARGE = {
         MODULE_ADDRESS.SLOT1 : SIGNALS.proccessToStartChargeIsActive_slot1,
@@ -76,19 +136,46 @@ class ControlCenter:
         MODULE_ADDRESS.SLOT8 : SIGNALS.proccessToFinishChargeIsActive_slot8
     }
 
-    def __init__(self):
-        self.modules = {address:BatterySlot(address) for address in self.SLOT_ADDRESSES}
-        self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS] = EightChannelRelay()
-        self.canMsgQueue = deque([])
+    def __init__(self, telemetryHistoryDirectory : str | None = None, clock : Callable[[], float] = time.monotonic,
+                 executor : Executor | None = None):
+        # Every time of the station is taken from 'clock' [s], which must be monotonic (injectable for tests).
+        # Slow background work (i.e, fitting the charge time estimator) runs on 'executor', if any.
+        self.clock = clock
+        self.executor = executor
+        self.clockOrigin = clock()
+        self.stateTable = StationStateTable(self.SLOT_ADDRESSES, Battery.DEQUE_MAXLEN, BatterySlot.DEQUE_MAXLEN, clock=clock)
+        self.modules = {address:BatterySlot(address, self.stateTable) for address in self.SLOT_ADDRESSES}
+        self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS] = EightChannelRelay(self.stateTable.clock)
+        self.frameArrivalStats = {address : FrameArrivalStats() for address in self.modules}
+        self.stateIndex = SlotStateIndex(self.modules, self.SLOT_ADDRESSES, self.STATES_TO_MATCH_LOGIC)
+        self.canMsgQueue = CanMsgTxScheduler(self.TX_MAX_FRAMES_PER_TICK, self.TX_MAX_BYTES_PER_TICK, clock)
+        self.reconciler = PeripheralsReconciler(self.modules, self.SLOT_ADDRESSES, self.EIGHT_CHANNEL_RELAY_ADDRESS)
+        # Every delayed command (and every step of the charge sequences) is a deadline in this one wheel.
+        self.timerWheel = TimerWheel()
+        self.chargeSequencer = ChargeSequencer(self.SLOT_ADDRESSES, self.timerWheel)
+        # Without a directory, no telemetry history is kept (e.g, for debugging).
+        self.telemetryHistory = None if telemetryHistoryDirectory is None else TelemetryHistory(telemetryHistoryDirectory, self.SLOT_ADDRESSES)
+        self.chargeSessionStarts = {slotAddress : None for slotAddress in self.SLOT_ADDRESSES}
+        if telemetryHistoryDirectory is not None:
+            self.chargeTimeTablesPath = os.path.join(telemetryHistoryDirectory, self.CHARGE_TIME_TABLES_FILE_NAME)
+            if os.path.isfile(self.chargeTimeTablesPath):
+                Battery.CHARGE_TIME_ESTIMATOR.load(self.chargeTimeTablesPath)
         self.currentGlobalTime = 0
+        self.tickStats = {} # period [ms] : TickDriftStats, of every periodic timer that calls 'recordTick'.
         self.connect_addCanMsgToQueue()
         self.connect_startAndFinishChargeProcessSignals()
         return None
     
     def connect_addCanMsgToQueue(self)->None:
         for slotAddress in self.SLOT_ADDRESSES:
-            self.modules[slotAddress].SIGNALS_DICT[slotAddress].connect(self.canMsgQueue.appendleft)
-        self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS].SIGNALS.addCanMsgToQueue_eightChannelRelay.connect(self.canMsgQueue.appendleft)
+            self.modules[slotAddress].SIGNALS_DICT[slotAddress].connect(self.addCanMsgToQueue)
+        self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS].SIGNALS.addCanMsgToQueue_eightChannelRelay.connect(self.addCanMsgToQueue)
+        return None
+    
+    def addCanMsgToQueue(self, canStr : CanStr)->None:
+        # Messages go out right away as long as the budget of the current tick allows it.
+        self.canMsgQueue.push(canStr)
+        self.sendCanMsgs()
         return None
     
     def connect_startAndFinishChargeProcessSignals(self):
@@ -99,39 +186,144 @@ class ControlCenter:
     
     
     def updateStatesFromCanStr(self, canStr : CanStr)->None:
+        self.applyCanStr(canStr)
+        self.propagateRelayChannelStates()
+        return None
+    
+    def updateStatesFromCanStrs(self, canStrs : List[CanStr])->None:
+        # Batched version of updateStatesFromCanStr: the derived states are propagated once per batch.
+        for canStr in canStrs:
+            self.applyCanStr(canStr)
+        self.propagateRelayChannelStates()
+        return None
+    
+    def updateStatesFromCanMsg(self, canMsg : can_frame)->None:
+        self.applyCanMsg(canMsg)
+        self.propagateRelayChannelStates()
+        return None
+    
+    def updateStatesFromCanMsgs(self, canMsgs : List[can_frame])->None:
+        # Same as updateStatesFromCanStrs, for transports that already deliver can_frames.
+        for canMsg in canMsgs:
+            self.applyCanMsg(canMsg)
+        self.propagateRelayChannelStates()
+        return None
+    
+    def applyCanStr(self, canStr : CanStr)->None:
         try:
             canMsg = can_frame.from_canStr(canStr)
         except Exception as e:
             warnings.warn(f"WARNING: Exception catched in ControlCenter.updateStatesFromCanStr(): {e}")
             return None
+        self.applyCanMsg(canMsg)
+        return None
+    
+    def applyCanMsg(self, canMsg : can_frame)->None:
+        try:
+            destinationAddress = canMsg.destinationAddress
+        except Exception as e:
+            warnings.warn(f"WARNING: Exception catched in ControlCenter.applyCanMsg(): {e}")
+            return None
         
-        if canMsg.destinationAddress == self.CONTROL_CENTER_ADDRESS:
+        # Frames from modules that this station doesn't have (e.g, an emulated station with more slots) are ignored.
+        if destinationAddress == self.CONTROL_CENTER_ADDRESS and canMsg.originAddress in self.modules:
+            self.frameArrivalStats[canMsg.originAddress].update(self.stateTable.clock())
             self.modules[canMsg.originAddress].updateStatesFromCanMsg(canMsg)
+            # One history record per BATTERY_DATA_0 frame, i.e, at the rate the BMS reports.
+            if self.telemetryHistory is not None and canMsg.activityCode == ACTIVITY_CODE.net2rpy_BATTERY_DATA_0:
+                self.recordTelemetry(canMsg.originAddress)
+        return None
+    
+    def recordTelemetry(self, slotAddress : MODULE_ADDRESS)->None:
+        battery = self.modules[slotAddress].battery
+        buffers = battery.buffers
+        self.telemetryHistory.append(slotAddress, time.time(), buffers["voltage"].last, buffers["current"].last, buffers["soc"].last,
+                                     self.stateTable.getLastTemperatures(battery.row), battery.warningsMask)
+        self.updateChargeSession(slotAddress, buffers["current"].last)
+        return None
+    
+    def updateChargeSession(self, slotAddress : MODULE_ADDRESS, current : float)->None:
+        # When a charge ends, its records are read back from the history to refit the charge time estimator.
+        timestamp = self.telemetryHistory.getLastTimestamp(slotAddress)
+        sessionStart = self.chargeSessionStarts[slotAddress]
+        if current > Battery.BATTERY_IS_CHARGING_CURRENT_THRESHOLD:
+            if sessionStart is None:
+                self.chargeSessionStarts[slotAddress] = timestamp
+        elif sessionStart is not None:
+            self.chargeSessionStarts[slotAddress] = None
+            # The records are read right here (the appends move them under the feet of a reader on another
+            # thread), but the fit and the save, which take a while, are left to the executor.
+            records = self.telemetryHistory.read(slotAddress, sessionStart, timestamp)
+            if self.executor is None:
+                self.fitChargeTimeEstimator(records)
+            else:
+                self.executor.submit(self.fitChargeTimeEstimator, records)
+        return None
 
+    def fitChargeTimeEstimator(self, records)->None:
+        # Interrupted charges (e.g, the battery was damaged) aren't sessions, and are ignored. (The estimator
+        # swaps its table in whole, so estimates can be read meanwhile.)
+        if Battery.CHARGE_TIME_ESTIMATOR.addRecords(records):
+            try:
+                Battery.CHARGE_TIME_ESTIMATOR.save(self.chargeTimeTablesPath)
+            except OSError as e:
+                warnings.warn(f"WARNING: Couldn't save the charge time tables to '{self.chargeTimeTablesPath}': {e}")
+        return None
+    
+    def propagateRelayChannelStates(self)->None:
         relayChannelStates = self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS].channelsStates
         for slotAddress in self.SLOT_ADDRESSES:
             self.modules[slotAddress].battery.updateStatesFromControlCenter(relayChannelStates[slotAddress.value-1])
         return None
     
     
+    def getGlobalTime(self)->float:
+        # Time [ms] elapsed since the ControlCenter was created, from its clock.
+        return 1000*(self.clock() - self.clockOrigin)
+
+    def recordTick(self, period : int)->float:
+        # Called by the handler of every periodic timer. Returns the global time [ms] of the tick.
+        now = self.getGlobalTime()
+        if period not in self.tickStats:
+            self.tickStats[period] = TickDriftStats(period)
+        self.tickStats[period].update(now)
+        return now
+
     def updateCurrentGlobalTime(self, newCurrentGlobalTime : float)->None:
         self.currentGlobalTime = newCurrentGlobalTime
         for address in self.SLOT_ADDRESSES + [self.EIGHT_CHANNEL_RELAY_ADDRESS]:
             self.modules[address].updateCurrentGlobalTime(newCurrentGlobalTime)
+        self.reconciler.updateCurrentGlobalTime(newCurrentGlobalTime)
+        self.timerWheel.advance(newCurrentGlobalTime)
+        return None
+    
+    def reconcilePeripherals(self)->None:
+        self.reconciler.reconcile()
         return None
     
     def sendCanMsg(self):
-        if self.canMsgQueue:
-            self.SIGNALS.sendCanMsg.emit(self.canMsgQueue.pop())
+        self.canMsgQueue.startNewTick()
+        self.sendCanMsgs()
+        return None
+    
+    def sendCanMsgs(self):
+        canStr = self.canMsgQueue.pop()
+        while canStr is not None:
+            self.SIGNALS.sendCanMsg.emit(canStr)
+            canStr = self.canMsgQueue.pop()
         return None
     
 
+    def callLater(self, delay : int, callback : Callable[[], None])->TimerHandle:
+        # Runs 'callback' from the global timer tick once 'delay' [ms] have gone by (cancel with self.timerWheel.cancel).
+        return self.timerWheel.schedule(self.currentGlobalTime + delay, callback)
+
     def setSlotSolenoidState(self, slotAddress : MODULE_ADDRESS, name : SOLENOID_NAME, state : bool, delay : int = 0)->None:
         try:
             if delay > 0:
-                QTimer.singleShot(delay, partial(self.modules[slotAddress].setSolenoidState, name, state))
+                self.callLater(delay, partial(self.reconciler.setSlotSolenoidState, slotAddress, name, state))
             else:
-                self.modules[slotAddress].setSolenoidState(name, state)
+                self.reconciler.setSlotSolenoidState(slotAddress, name, state)
         except AttributeError:
             Exception("'slotAddress' is not valid. It must be of type MODULE_ADDRESS.SLOTi")
         return None
@@ -139,9 +331,9 @@ class ControlCenter:
     def setSlotSolenoidsStates(self, slotAddress : MODULE_ADDRESS, states : List[bool], delay : int = 0)->None:
         try:
             if delay > 0:
-                QTimer.singleShot(delay, partial(self.modules[slotAddress].setSolenoidsStates, states))
+                self.callLater(delay, partial(self.reconciler.setSlotSolenoidsStates, slotAddress, states))
             else:
-                self.modules[slotAddress].setSolenoidsStates(states)
+                self.reconciler.setSlotSolenoidsStates(slotAddress, states)
         except AttributeError:
             Exception("'slotAddress' is not valid. It must be of type MODULE_ADDRESS.SLOTi")
         return None
@@ -149,72 +341,63 @@ class ControlCenter:
     def setSlotLedStripState(self, slotAddress : MODULE_ADDRESS, state : LED_STRIP_STATE, delay : int = 0)->None:
         try:
             if delay > 0:
-                QTimer.singleShot(delay, partial(self.modules[slotAddress].setLedStripState, state))
+                self.callLater(delay, partial(self.reconciler.setSlotLedStripState, slotAddress, state))
             else:
-                self.modules[slotAddress].setLedStripState(state)
+                self.reconciler.setSlotLedStripState(slotAddress, state)
         except AttributeError:
             Exception("'slotAddress' is not valid. It must be of type MODULE_ADDRESS.SLOTi")
         return None    
     
     def setRelayChannelState(self, name : CHANNEL_NAME, state : bool, delay : int = 0)->None:
         if delay > 0:
-            QTimer.singleShot(delay, partial(self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS].setChannelState, name, state))
+            self.callLater(delay, partial(self.reconciler.setRelayChannelState, name, state))
         else:
-            self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS].setChannelState(name, state)
+            self.reconciler.setRelayChannelState(name, state)
         return None
     
     def setRelayChannelStates(self, states : List[bool], delay : int = 0)->None:
         if delay > 0:
-            QTimer.singleShot(delay, partial(self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS].setChannelStates, states))
+            self.callLater(delay, partial(self.reconciler.setRelayChannelStates, states))
         else: 
-            self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS].setChannelStates(states)
-        return None
-
-
-    def getSlotsThatMatchStates(self, statesToMatch):
-        statesToMatchLogic = {
-            "LIMIT_SWITCH"                       : (True,  "limitSwitchState"),
-            "LED_STRIP"                          : (True,  "ledStripState"), 
-            "BMS_SOLENOID"                       : (True,  "bmsSolenoidState"),
-            "DOOR_LOCK_SOLENOID"                 : (True,  "doorLockSolenoidState"),
-            "BATTERY_LOCK_SOLENOID"              : (True,  "batteryLockSolenoidState"),
-
-            "BATTERY_IN_SLOT"                    : (True,  "limitSwitchState"),
-            "BATTERY_BMS_IS_ON"                  : (True,  "bmsSolenoidState"),
-            "BATTERY_BMS_HAS_CAN_BUS_ERROR"      : (True,  "batteryCanBusErrorState"),
-            "BATTERY_IS_WAITING_FOR_ALL_DATA"    : (False, "waitingForAllData"), 
-                
-
-            "BATTERY_IS_ADDRESSABLE"              : (False, "isAddressable"),
-            "BATTERY_IS_CHARGING"                 : (False, "isCharging"),
-            "BATTERY_IS_CHARGED_ENOUGH"           : (False, "isChargedEnough"),
-            "BATTERY_CAN_PROCEED_TO_BE_CHARGED"   : (False, "canProceedToBeCharged"),
-            "BATTERY_HAS_WARNINGS"                : (False, "hasWarnings"),
-            "BATTERY_HAS_FATAL_WARNINGS"          : (False, "hasFatalWarnings"),
-            "BATTERY_IS_DAMAGED"                  : (False, "isDamaged"),
-            "BATTERY_IS_DELIVERABLE_TO_USER"      : (False, "isDeliverableToUser"),
-            "BATTERY_IS_BUSY_WITH_CHARGE_PROCESS" : (False, "isBusyWithChargeProcess"),
-            "BATTERY_RELAY_CHANNEL_IS_ON"         : (False, "relayChanneOn"),
-
-            "PROCESS_TO_START_BATTERY_CHARGE_IS_ACTIVE"   : (False, "proccessToStartChargeIsActive"),
-            "PROCESS_TO_FINISH_BATTERY_CHARGE_IS_ACTIVE"  : (False, "proccessToFinishChargeIsActive")
-        }
-        statesToMatch_ = {key:value for key,value in statesToMatch.items() if key in statesToMatchLogic.keys()}
-
-        res = list(self.SLOT_ADDRESSES)
-        for stateKeyword, stateValueToMatch in statesToMatch_.items():
-
-            if len(res) < 1:
-                break
-
-            isSlotAttr, attrName = statesToMatchLogic[stateKeyword]
-
-            if isSlotAttr:
-                res = [slotAddress for slotAddress in res if getattr(self.modules[slotAddress], attrName) == stateValueToMatch]
-            else:
-                res = [slotAddress for slotAddress in res if getattr(self.modules[slotAddress].battery, attrName) == stateValueToMatch]
+            self.reconciler.setRelayChannelStates(states)
+        return None
+
+
+    def cancelChargeSequence(self, slotAddress : MODULE_ADDRESS)->bool:
+        # Steps already sent aren't undone (e.g, the BMS may be left off until the next reconciliation).
+        return self.chargeSequencer.cancel(slotAddress)
+
+    def getChargeSequenceStatus(self, slotAddress : MODULE_ADDRESS)->dict:
+        return self.chargeSequencer.getStatus(slotAddress)
 
-        return res
+    def getInFlightChargeSteps(self)->list:
+        return self.chargeSequencer.getInFlightSteps()
+
+
+    def compileStatesQuery(self, statesToMatch : dict)->SlotStatesQuery:
+        return SlotStatesQuery.compile(statesToMatch, self.STATES_TO_MATCH_LOGIC)
+
+    def getSlotsThatMatchStates(self, statesToMatch : dict | SlotStatesQuery)->List[MODULE_ADDRESS]:
+        if not isinstance(statesToMatch, SlotStatesQuery):
+            statesToMatch = self.compileStatesQuery(statesToMatch)
+        return self.stateIndex.match(statesToMatch)
+    
+    def getDeliverableSlots(self)->List[MODULE_ADDRESS]:
+        return self.getSlotsThatMatchStates(self.DELIVERABLE_SLOTS_QUERY)
+    
+    def getStationMaxTemperature(self)->float:
+        return self.stateTable.getStationMaxTemperature()
+    
+    def getFrameArrivalStats(self, moduleAddress : MODULE_ADDRESS)->dict:
+        return self.frameArrivalStats[moduleAddress].asDict(self.stateTable.clock())
+    
+    def getTickStats(self)->dict:
+        return {period : stats.asDict() for period, stats in self.tickStats.items()}
+
+    def getSilentModules(self)->List[MODULE_ADDRESS]:
+        # Modules that stopped sending, as opposed to the ones that just send few frames.
+        now = self.stateTable.clock()
+        return [address for address, stats in self.frameArrivalStats.items() if stats.isSilent(now) == True]
 
     
     def _debugPrint(self):
@@ -229,9 +412,9 @@ class ControlCenter:
         return None
 
     def turnOnLedStripsBasedOnState(self):
-        batteries_notInSlot         = self.getSlotsThatMatchStates({"BATTERY_IN_SLOT"                : False })
-        batteries_damaged           = self.getSlotsThatMatchStates({"BATTERY_IS_DAMAGED"             : True  })
-        batteries_deliverableToUser = self.getSlotsThatMatchStates({"BATTERY_IS_DELIVERABLE_TO_USER" : True  })
+        batteries_notInSlot         = self.getSlotsThatMatchStates(self.FREE_SLOTS_QUERY)
+        batteries_damaged           = self.getSlotsThatMatchStates(self.DAMAGED_SLOTS_QUERY)
+        batteries_deliverableToUser = self.getDeliverableSlots()
         other_batteries             = [slotAddress for slotAddress in self.SLOT_ADDRESSES if slotAddress not in 
                                        set(batteries_notInSlot + batteries_damaged + batteries_deliverableToUser)]
 
@@ -250,7 +433,7 @@ class ControlCenter:
         return None
     
     def turnOnLedStripsBasedOnState_Entry(self):
-        freeSlots     = self.getSlotsThatMatchStates({"BATTERY_IN_SLOT" : False})
+        freeSlots     = self.getSlotsThatMatchStates(self.FREE_SLOTS_QUERY)
         occupiedSlots = [slotAddress for slotAddress in self.SLOT_ADDRESSES if slotAddress not in freeSlots]
 
         for slotAddress in freeSlots:
@@ -261,7 +444,7 @@ class ControlCenter:
         return None
     
     def turnOnLedStripsBasedOnState_Egress(self):
-        slotsWithDeliverableBatteriesToUser = self.getSlotsThatMatchStates({"BATTERY_IS_DELIVERABLE_TO_USER" : True})
+        slotsWithDeliverableBatteriesToUser = self.getDeliverableSlots()
         otherSlots = [slotAddress for slotAddress in self.SLOT_ADDRESSES if slotAddress not in slotsWithDeliverableBatteriesToUser] 
 
         try:
@@ -283,22 +466,24 @@ class ControlCenter:
 
     
     def turnOnBmsSolenoidsWhereWise(self):
-        bmsShouldBeOn = self.getSlotsThatMatchStates({"BATTERY_IN_SLOT"                     : True,
-                                                      "BATTERY_BMS_IS_ON"                   : False,
-                                                      "BATTERY_IS_BUSY_WITH_CHARGE_PROCESS" : False,
-                                                      "BATTERY_RELAY_CHANNEL_IS_ON"         : False})
+        bmsShouldBeOn = self.getSlotsThatMatchStates(self.BMS_SHOULD_BE_ON_QUERY)
         for slotAddress in bmsShouldBeOn:
             self.setSlotSolenoidState(slotAddress, SOLENOID_NAME.BMS, 1)
         return None
     
     def turnOffAllBmsSolenoidsIfPossible(self):
-        bmsShouldBeOff = self.getSlotsThatMatchStates({"BATTERY_BMS_IS_ON"                   : True,
-                                                       "BATTERY_IS_BUSY_WITH_CHARGE_PROCESS" : False,
-                                                       "BATTERY_RELAY_CHANNEL_IS_ON"         : False})
+        bmsShouldBeOff = self.getSlotsThatMatchStates(self.BMS_SHOULD_BE_OFF_QUERY)
         
         for slotAddress in bmsShouldBeOff:
             self.setSlotSolenoidState(slotAddress, SOLENOID_NAME.BMS, 0)
         return None
+
+    def hardwareSetup(self):
+        # The station's resting state: run once booted (see BootCoordinator) and on every reset of the GUI.
+        self.turnOffAllLedStrips()
+        self.secureAllSlots()
+        self.turnOnBmsSolenoidsWhereWise()
+        return None
     
 
     def startChargeOfSlotBatteryIfAllowable(self, slotAddress):
@@ -312,12 +497,11 @@ class ControlCenter:
             
 
         if batteryCanProceedToBeCharged and (not doorLockSolenoidIsOn) and (not batteryLockSolenoidIsOn):
-            self.SIGNALS_DICT_START_CHARGE[slotAddress].emit(True)
-            self.setSlotSolenoidState(slotAddress, SOLENOID_NAME.BMS,    0)
-            self.setRelayChannelState(CHANNEL_NAME(slotAddress.value-1), 1)
-            self.setSlotSolenoidState(slotAddress, SOLENOID_NAME.BMS,    1)
-            QTimer.singleShot(6000, partial(self.SIGNALS_DICT_START_CHARGE[slotAddress].emit, False))
-            print(f"startChargeOfSlotBatteryIfAllowable was triggered on slot: {slotAddress}")
+            # The steps of the sequence are explicitly spaced, as the outbound queue no longer does it for us.
+            steps = self.getChargeSequenceSteps(slotAddress, 1, self.CHARGE_SEQUENCE_STEP_DELAY, 2*self.CHARGE_SEQUENCE_STEP_DELAY)
+            if self.chargeSequencer.start(slotAddress, CHARGE_SEQUENCE_STATE.STARTING_CHARGE, self.currentGlobalTime, steps,
+                                          self.CHARGE_SEQUENCE_BUSY_TIME, self.SIGNALS_DICT_START_CHARGE[slotAddress].emit):
+                print(f"startChargeOfSlotBatteryIfAllowable was triggered on slot: {slotAddress}")
             return None
 
         elif doorLockSolenoidIsOn or batteryLockSolenoidIsOn:
@@ -358,15 +542,22 @@ class ControlCenter:
         if isnan(batteryRelayChannelIsOn): batteryRelayChannelIsOn = False
 
 
-        if (not batteryInSlot) or (not batteryBmsIsOn) or (not batteryRelayChannelIsOn):
+        # A start still in flight is about to close the relay channel, so it must be stopped too (though
+        # not for waiting for all data, as it's the start that just power cycled the BMS). 'isDamaged' is nan
+        # while the BMS is off, which is always the case during a start, so only an actual True counts.
+        startIsInFlight = self.chargeSequencer.getState(slotAddress) == CHARGE_SEQUENCE_STATE.STARTING_CHARGE
+        mustPreemptStart = startIsInFlight and (batteryIsDamaged == True or forcedStop)
+        chargerIsOn = batteryInSlot and batteryBmsIsOn and batteryRelayChannelIsOn
+
+        if (not chargerIsOn) and (not mustPreemptStart):
             return None
         
-        elif (batteryInSlot and batteryBmsIsOn and batteryRelayChannelIsOn) and (batteryIsWaitingForAllData or batteryIsDamaged or forcedStop):
-            self.SIGNALS_DICT_FINISH_CHARGE[slotAddress].emit(True)
-            self.setSlotSolenoidState(slotAddress, SOLENOID_NAME.BMS,    0)
-            self.setRelayChannelState(CHANNEL_NAME(slotAddress.value-1), 0,  delay=10000)
-            self.setSlotSolenoidState(slotAddress, SOLENOID_NAME.BMS,    1,  delay=11000)
-            QTimer.singleShot(12000, partial(self.SIGNALS_DICT_FINISH_CHARGE[slotAddress].emit, False))
+        elif mustPreemptStart or (batteryIsWaitingForAllData or batteryIsDamaged or forcedStop):
+            # It preempts any start or finish of the charge still in flight on the slot.
+            steps = self.getChargeSequenceSteps(slotAddress, 0, self.FORCED_STOP_RELAY_DELAY, self.FORCED_STOP_BMS_DELAY)
+            if not self.chargeSequencer.start(slotAddress, CHARGE_SEQUENCE_STATE.FORCING_STOP, self.currentGlobalTime, steps,
+                                              self.FORCED_STOP_BUSY_TIME, self.SIGNALS_DICT_FINISH_CHARGE[slotAddress].emit):
+                return None # (The charge is already being forcibly stopped.)
 
             msg = f"WARNING: Forcibly stopping possible charge due to the following states: batteryIsWaitingForAllData=={batteryIsWaitingForAllData}"
             msg = f"{msg}, batteryIsDamaged=={batteryIsDamaged} and forcedStop=={forcedStop}. FORCIBLY STOPPING THE CHARGE PROCESS NOW."
@@ -375,18 +566,24 @@ class ControlCenter:
 
         elif batteryIsAddressable and batteryRelayChannelIsOn and batteryisChargedEnough and (not batteryIsBusyWithChargeProcess):
             # When the battery has finished its charging process, we shut down the charger in the correct way.
-            self.SIGNALS_DICT_FINISH_CHARGE[slotAddress].emit(True)
-            self.setSlotSolenoidState(slotAddress, SOLENOID_NAME.BMS,    0)
-            self.setRelayChannelState(CHANNEL_NAME(slotAddress.value-1), 0)
-            self.setSlotSolenoidState(slotAddress, SOLENOID_NAME.BMS,    1)
-            QTimer.singleShot(6000, partial(self.SIGNALS_DICT_FINISH_CHARGE[slotAddress].emit, False))
-            print(f"finishChargeOfSlotBatteryIfAllowable was triggered on slot: {slotAddress}")
+            steps = self.getChargeSequenceSteps(slotAddress, 0, self.CHARGE_SEQUENCE_STEP_DELAY, 2*self.CHARGE_SEQUENCE_STEP_DELAY)
+            if self.chargeSequencer.start(slotAddress, CHARGE_SEQUENCE_STATE.FINISHING_CHARGE, self.currentGlobalTime, steps,
+                                          self.CHARGE_SEQUENCE_BUSY_TIME, self.SIGNALS_DICT_FINISH_CHARGE[slotAddress].emit):
+                print(f"finishChargeOfSlotBatteryIfAllowable was triggered on slot: {slotAddress}")
             return None
         
         return None
         
     
 
+    def getChargeSequenceSteps(self, slotAddress : MODULE_ADDRESS, relayChannelState : bool, relayDelay : int, bmsOnDelay : int)->list:
+        # BMS off, then the charger's relay channel switched, then BMS back on, as (offset [ms], name, callback).
+        relayChannelName = CHANNEL_NAME(slotAddress.value-1)
+        return [(0,          "BMS_OFF",                                       partial(self.reconciler.setSlotSolenoidState, slotAddress, SOLENOID_NAME.BMS, 0)),
+                (relayDelay, f"RELAY_{'ON' if relayChannelState else 'OFF'}", partial(self.reconciler.setRelayChannelState, relayChannelName, relayChannelState)),
+                (bmsOnDelay, "BMS_ON",                                        partial(self.reconciler.setSlotSolenoidState, slotAddress, SOLENOID_NAME.BMS, 1))]
+
+
     def startChargeOfSlotBatteriesIfAllowable(self):
         for slotAddress in self.SLOT_ADDRESSES:
             self.startChargeOfSlotBatteryIfAllowable(slotAddress)
@@ -1,9 +1,10 @@
+import time
 import numpy as np
 from array import array
-from typing import List
+from typing import List, Callable
 from enum import Enum, unique
 from collections import deque
-from PyQt5.QtCore import pyqtSignal, QObject
+from BSS_control.signals import Signal
 
 from BSS_control.CanUtils import (
     can_frame,
@@ -13,8 +14,8 @@ from BSS_control.CanUtils import (
     ArrayOfBool)
 
 
-class EightChannelRelaySignals(QObject):
-    addCanMsgToQueue_eightChannelRelay = pyqtSignal(str)
+class EightChannelRelaySignals:
+    addCanMsgToQueue_eightChannelRelay = Signal(str)
 
 class CHANNEL_NAME(Enum):
     CHANNEL0 = 0
@@ -28,17 +29,21 @@ class CHANNEL_NAME(Enum):
 
 class EightChannelRelay:
     DEQUE_MAXLEN = 5
+    STALENESS_DEADLINE = 1.0 #[s] (The module sends its states every 50 ms.)
     SIGNALS = EightChannelRelaySignals()
     CONTROL_CENTER_ADDRESS = MODULE_ADDRESS.CONTROL_CENTER
     EIGHT_CHANNEL_RELAY_ADDRESS = MODULE_ADDRESS.EIGHT_CHANNEL_RELAY
 
-    def __init__(self):
+    def __init__(self, clock : Callable[[], float] = time.monotonic):
         self.buffers = {name:deque(maxlen=self.DEQUE_MAXLEN) for name in CHANNEL_NAME}
         self.currentGlobalTime = 0
+        self.clock = clock
+        self.lastReceived = np.nan # Receive time of the latest states, from 'clock'.
         return None
 
     def updateStatesFromCanMsg(self, canMsg : can_frame)->None:
         if canMsg.activityCode == ACTIVITY_CODE.net2rpy_STATES_INFO_OF_EIGHT_CHANNEL_RELAY_MODULE:
+            self.lastReceived = self.clock()
             for name in CHANNEL_NAME:
                 self.buffers[name].append(canMsg.data[name.value])
         return None
@@ -47,8 +52,15 @@ class EightChannelRelay:
         self.currentGlobalTime = newCurrentGlobalTime
         return None
 
+    @property
+    def isFresh(self)->bool:
+        return self.clock() - self.lastReceived <= self.STALENESS_DEADLINE
+
     @property
     def channelsStates(self)->ArrayOfBool | List[float]:
+        # Votes over samples older than STALENESS_DEADLINE aren't the current states.
+        if not self.isFresh:
+            return [np.nan for _ in range(8)]
         try:
             res = array("B", [bool(round(np.mean(self.buffers[name]))) for name in CHANNEL_NAME])
         except ValueError:
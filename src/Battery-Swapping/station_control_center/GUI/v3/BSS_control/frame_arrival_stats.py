@@ -0,0 +1,68 @@
+import numpy as np
+from math import sqrt
+
+
+
+class FrameArrivalStats:
+    """
+    Inter-arrival statistics of the frames received from one module: number of frames, receive time
+    of the latest one, longest interval, and exponentially weighted mean and standard deviation of
+    the intervals (so that they follow the module's current rate).
+
+    They tell a silent module from a quiet one: a module is silent once it has gone without sending
+    for longer than SILENCE_FACTOR times its usual interval, plus some jitter margin, i.e, a module
+    that always sends few frames isn't mistaken for one that stopped sending.
+    """
+    SMOOTHING = 0.05 # Weight of every new interval in the running mean/variance.
+    SILENCE_FACTOR = 5
+    MIN_SILENCE = 0.5 #[s] (Floor of the silence threshold, as bursty modules can have very short intervals.)
+
+    def __init__(self):
+        self.numFrames = 0
+        self.lastArrival = np.nan #[s]
+        self.meanInterval = np.nan #[s]
+        self.intervalVariance = 0.0 #[s²]
+        self.maxInterval = 0.0 #[s]
+        return None
+
+    def update(self, now : float)->None:
+        if self.numFrames:
+            interval = now - self.lastArrival
+            if self.numFrames == 1:
+                self.meanInterval = interval
+            else:
+                # Exponentially weighted (West's) update of the mean and the variance.
+                delta = interval - self.meanInterval
+                self.meanInterval += self.SMOOTHING*delta
+                self.intervalVariance = (1 - self.SMOOTHING)*(self.intervalVariance + self.SMOOTHING*delta*delta)
+            if interval > self.maxInterval:
+                self.maxInterval = interval
+        self.lastArrival = now
+        self.numFrames += 1
+        return None
+
+    @property
+    def intervalStd(self)->float:
+        return sqrt(self.intervalVariance)
+
+    @property
+    def silenceThreshold(self)->float:
+        return max(self.SILENCE_FACTOR*self.meanInterval + 4*self.intervalStd, self.MIN_SILENCE)
+
+    def getAge(self, now : float)->float:
+        # Time [s] since the latest frame (nan if none was received yet).
+        return now - self.lastArrival
+
+    def isSilent(self, now : float)->bool|float:
+        # nan until the module's rate is known (i.e, before its 2nd frame).
+        if self.numFrames < 2:
+            return np.nan
+        return self.getAge(now) > self.silenceThreshold
+
+    def asDict(self, now : float)->dict:
+        return {"numFrames"    : self.numFrames,
+                "age"          : self.getAge(now),
+                "meanInterval" : self.meanInterval,
+                "intervalStd"  : self.intervalStd,
+                "maxInterval"  : self.maxInterval,
+                "isSilent"     : self.isSilent(now)}
@@ -0,0 +1,47 @@
+import numpy as np
+from bisect import bisect_right
+
+
+
+class IoLatencyStats:
+    """
+    Latency and CPU cost of the operations of an I/O path (e.g, the reads of a transport): number of
+    operations and bytes, mean/max latency, a histogram of the latencies and the CPU time they took.
+    What 'latency' stands for is up to the I/O path (see the transports and AsyncRfidReader).
+    """
+    LATENCY_BIN_EDGES = (0, 0.1, 0.5, 1, 5, 10, 50, 100) #[ms] (Lower edges.)
+
+    def __init__(self):
+        self.numOps = 0
+        self.numBytes = 0
+        self.latencySum = 0.0 #[ms]
+        self.maxLatency = 0.0 #[ms]
+        self.cpuTime = 0.0 #[ms]
+        self.latencyHistogram = [0]*len(self.LATENCY_BIN_EDGES)
+        return None
+
+    def update(self, latency : float, cpuTime : float = 0.0, numBytes : int = 0)->None:
+        self.numOps += 1
+        self.numBytes += numBytes
+        self.latencySum += latency
+        self.maxLatency = max(self.maxLatency, latency)
+        self.cpuTime += cpuTime
+        self.latencyHistogram[max(bisect_right(self.LATENCY_BIN_EDGES, latency) - 1, 0)] += 1
+        return None
+
+    @property
+    def meanLatency(self)->float:
+        return self.latencySum/self.numOps if self.numOps else np.nan
+
+    @property
+    def meanCpuTime(self)->float:
+        return self.cpuTime/self.numOps if self.numOps else np.nan
+
+    def asDict(self)->dict:
+        return {"numOps"           : self.numOps,
+                "numBytes"         : self.numBytes,
+                "meanLatency"      : self.meanLatency,
+                "maxLatency"       : self.maxLatency,
+                "cpuTime"          : self.cpuTime,
+                "meanCpuTime"      : self.meanCpuTime,
+                "latencyHistogram" : dict(zip(self.LATENCY_BIN_EDGES, self.latencyHistogram))}
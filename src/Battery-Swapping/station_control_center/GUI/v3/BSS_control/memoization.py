@@ -0,0 +1,60 @@
+import warnings
+from functools import wraps
+from math import isnan
+
+
+
+class GenerationMemoized:
+    """
+    Base class for objects whose derived states are expensive to compute and read many times
+    between input changes. Every method that mutates an input must call 'bumpGeneration'; properties
+    decorated with 'memoizedProperty' are then computed at most once per generation.
+
+    With DEBUG_MEMOIZATION set, every cache hit is cross-checked against a fresh computation and
+    mismatches (i.e, a mutator that forgot to bump the generation) are warned about and counted.
+    """
+    DEBUG_MEMOIZATION = False
+
+    def __init__(self):
+        self.generation = 0
+        self.memoizedValues = {}
+        self.memoizationMismatches = 0
+        return None
+
+    def bumpGeneration(self)->None:
+        self.generation += 1
+        return None
+
+
+def isSameValue(value0, value1)->bool:
+    if isinstance(value0, dict) and isinstance(value1, dict):
+        return value0.keys() == value1.keys() and all(isSameValue(value0[key], value1[key]) for key in value0)
+    try:
+        if isnan(value0) and isnan(value1):
+            return True
+    except TypeError:
+        pass
+    return bool(value0 == value1)
+
+
+def memoizedProperty(func):
+    name = func.__name__
+
+    @wraps(func)
+    def getter(self):
+        entry = self.memoizedValues.get(name)
+        if entry is not None and entry[0] == self.generation:
+            if self.DEBUG_MEMOIZATION:
+                freshValue = func(self)
+                if not isSameValue(entry[1], freshValue):
+                    self.memoizationMismatches += 1
+                    warnings.warn(f"WARNING: Stale memoized value of {type(self).__name__}.{name}: {entry[1]} != {freshValue}")
+            return entry[1]
+
+        value = func(self)
+        # 'func' may itself bump the generation (e.g, when it latches a state), in which case the value
+        # is stored under the new generation: it must then already account for the latched state.
+        self.memoizedValues[name] = (self.generation, value)
+        return value
+
+    return property(getter)
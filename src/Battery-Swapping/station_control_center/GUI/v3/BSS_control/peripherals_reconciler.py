@@ -0,0 +1,184 @@
+from typing import List, Dict
+
+from BSS_control.CanUtils import MODULE_ADDRESS
+from BSS_control.eight_channel_relay import CHANNEL_NAME
+from BSS_control.battery_slot import (
+    LED_STRIP_STATE,
+    SOLENOID_NAME)
+
+
+
+class PeripheralsReconciler:
+    """
+    Keeps the desired state of every slot peripheral (LED strip and solenoids) and of every
+    relay channel, and only sends the commands needed to make the observed state (i.e, the
+    debounced CAN feedback of the modules) converge to it. A command is sent right away when
+    the desired state changes. If the change is not confirmed by the feedback within
+    RESEND_TIMEOUT, the command is sent again.
+    """
+    RESEND_TIMEOUT = 2000 #[ms]
+    LED_STRIP = "LED_STRIP"
+
+    def __init__(self, modules, slotAddresses : List[MODULE_ADDRESS], eightChannelRelayAddress : MODULE_ADDRESS):
+        self.modules = modules
+        self.slotAddresses = slotAddresses
+        self.eightChannelRelayAddress = eightChannelRelayAddress
+        self.currentGlobalTime = 0
+
+        slotTargets = [self.LED_STRIP] + list(SOLENOID_NAME)
+        self.desiredStates   = {address : {target : None for target in slotTargets} for address in slotAddresses}
+        self.commandedStates = {address : {target : None for target in slotTargets} for address in slotAddresses}
+        self.commandTimes    = {address : {target : 0    for target in slotTargets} for address in slotAddresses}
+
+        for tables in [self.desiredStates, self.commandedStates]:
+            tables[eightChannelRelayAddress] = {name : None for name in CHANNEL_NAME}
+        self.commandTimes[eightChannelRelayAddress] = {name : 0 for name in CHANNEL_NAME}
+
+        # STATS
+        self.framesSent = 0
+        self.framesResent = 0
+        self.commandsSkipped = 0
+        return None
+
+    def updateCurrentGlobalTime(self, newCurrentGlobalTime : float)->None:
+        self.currentGlobalTime = newCurrentGlobalTime
+        return None
+
+
+    def getObservedStates(self, address : MODULE_ADDRESS)->Dict:
+        if address == self.eightChannelRelayAddress:
+            channelsStates = self.modules[address].channelsStates
+            return {name : channelsStates[name.value] for name in CHANNEL_NAME}
+
+        res = {self.LED_STRIP : self.modules[address].ledStripState}
+        solenoidsStates = self.modules[address].solenoidsStates
+        for name in SOLENOID_NAME:
+            try: res[name] = solenoidsStates[name.value]
+            except TypeError: res[name] = solenoidsStates
+        return res
+
+    def isCommandNeeded(self, address : MODULE_ADDRESS, target, observedState)->bool:
+        desiredState = self.desiredStates[address][target]
+        commandedState = self.commandedStates[address][target]
+
+        if desiredState is None:
+            res = False
+        elif desiredState != commandedState:
+            res = not (commandedState is None and observedState == desiredState)
+        else:
+            res = (observedState != desiredState) and (self.currentGlobalTime - self.commandTimes[address][target] > self.RESEND_TIMEOUT)
+        return res
+
+    def markAsCommanded(self, address : MODULE_ADDRESS, targets : List)->None:
+        if all(self.commandedStates[address][target] == self.desiredStates[address][target] for target in targets):
+            self.framesResent += 1
+        for target in targets:
+            self.commandedStates[address][target] = self.desiredStates[address][target]
+            self.commandTimes[address][target] = self.currentGlobalTime
+        self.framesSent += 1
+        return None
+
+
+    def reconcileSlot(self, slotAddress : MODULE_ADDRESS)->int:
+        observedStates = self.getObservedStates(slotAddress)
+        desiredStates = self.desiredStates[slotAddress]
+        numFramesSent = 0
+
+        if self.isCommandNeeded(slotAddress, self.LED_STRIP, observedStates[self.LED_STRIP]):
+            self.markAsCommanded(slotAddress, [self.LED_STRIP])
+            self.modules[slotAddress].setLedStripState(desiredStates[self.LED_STRIP])
+            numFramesSent += 1
+
+        solenoidsToCommand = [name for name in SOLENOID_NAME if self.isCommandNeeded(slotAddress, name, observedStates[name])]
+        allSolenoidsAreKnown = all(desiredStates[name] is not None for name in SOLENOID_NAME)
+
+        if len(solenoidsToCommand) > 1 and allSolenoidsAreKnown:
+            self.markAsCommanded(slotAddress, list(SOLENOID_NAME))
+            self.modules[slotAddress].setSolenoidsStates([desiredStates[name] for name in SOLENOID_NAME])
+            numFramesSent += 1
+        else:
+            for name in solenoidsToCommand:
+                self.markAsCommanded(slotAddress, [name])
+                self.modules[slotAddress].setSolenoidState(name, desiredStates[name])
+                numFramesSent += 1
+        return numFramesSent
+
+    def reconcileRelay(self)->int:
+        address = self.eightChannelRelayAddress
+        observedStates = self.getObservedStates(address)
+        desiredStates = self.desiredStates[address]
+        numFramesSent = 0
+
+        channelsToCommand = [name for name in CHANNEL_NAME if self.isCommandNeeded(address, name, observedStates[name])]
+        allChannelsAreKnown = all(desiredStates[name] is not None for name in CHANNEL_NAME)
+
+        if len(channelsToCommand) > 1 and allChannelsAreKnown:
+            self.markAsCommanded(address, list(CHANNEL_NAME))
+            self.modules[address].setChannelStates([desiredStates[name] for name in CHANNEL_NAME])
+            numFramesSent += 1
+        else:
+            for name in channelsToCommand:
+                self.markAsCommanded(address, [name])
+                self.modules[address].setChannelState(name, desiredStates[name])
+                numFramesSent += 1
+        return numFramesSent
+
+    def reconcile(self)->None:
+        for slotAddress in self.slotAddresses:
+            self.reconcileSlot(slotAddress)
+        self.reconcileRelay()
+        return None
+
+    def getUnconfirmedTargets(self)->List[tuple]:
+        # (address, target) of every desired state that the feedback of the modules doesn't show (yet).
+        res = []
+        for address, desiredStates in self.desiredStates.items():
+            observedStates = self.getObservedStates(address)
+            res += [(address, target) for target, desiredState in desiredStates.items()
+                    if desiredState is not None and observedStates[target] != desiredState]
+        return res
+
+
+    def setSlotLedStripState(self, slotAddress : MODULE_ADDRESS, state : LED_STRIP_STATE)->None:
+        self.desiredStates[slotAddress][self.LED_STRIP] = state
+        if self.reconcileSlot(slotAddress) == 0:
+            self.commandsSkipped += 1
+        return None
+
+    def setSlotSolenoidState(self, slotAddress : MODULE_ADDRESS, name : SOLENOID_NAME, state : bool)->None:
+        self.desiredStates[slotAddress][name] = int(state)
+        if self.reconcileSlot(slotAddress) == 0:
+            self.commandsSkipped += 1
+        return None
+
+    def setSlotSolenoidsStates(self, slotAddress : MODULE_ADDRESS, states : List[bool])->None:
+        if len(states)!=3:
+            raise ValueError("'states' must be a list/array of length 3")
+        for name in SOLENOID_NAME:
+            self.desiredStates[slotAddress][name] = int(states[name.value])
+        if self.reconcileSlot(slotAddress) == 0:
+            self.commandsSkipped += 1
+        return None
+
+    def setRelayChannelState(self, name : CHANNEL_NAME, state : bool)->None:
+        self.desiredStates[self.eightChannelRelayAddress][name] = int(state)
+        if self.reconcileRelay() == 0:
+            self.commandsSkipped += 1
+        return None
+
+    def setRelayChannelStates(self, states : List[bool])->None:
+        if len(states)!=8:
+            raise ValueError("'states' must be a list/array of length 8")
+        for name in CHANNEL_NAME:
+            self.desiredStates[self.eightChannelRelayAddress][name] = int(states[name.value])
+        if self.reconcileRelay() == 0:
+            self.commandsSkipped += 1
+        return None
+
+    @property
+    def stats(self)->Dict[str, int]:
+        return {
+            "framesSent"      : self.framesSent,
+            "framesResent"    : self.framesResent,
+            "commandsSkipped" : self.commandsSkipped
+        }
@@ -0,0 +1,88 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from BSS_control.signals import Signal
+from BSS_control.io_stats import IoLatencyStats
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None
+
+try:
+    from mfrc522 import SimpleMFRC522
+except ImportError:
+    SimpleMFRC522 = None
+
+
+
+class AsyncRfidReaderSignals:
+    rfidReadResults = Signal(int)
+
+
+class AsyncRfidReader:
+    """
+    Reads RFID cards from the MFRC522 module on the station daemon's event loop, rather than from a
+    thread spinning on read_id_no_block. The reader is polled every POLL_PERIOD and
+    each poll (a few SPI transactions, which block) runs on a single-thread executor, so at most one
+    poll is in flight, the event loop never waits on the SPI bus and nothing runs between polls.
+
+    Results are emitted as the card's id, or -1 if the read failed.
+    readStats: time [ms] a poll took, from its submission to the executor until its result was back, and
+    the CPU time of the executor's thread for it.
+    """
+    SIGNALS = AsyncRfidReaderSignals()
+    POLL_PERIOD = 0.1 #[s] (Bounds the time until a card is noticed.)
+
+    def __init__(self, pollPeriod : float = POLL_PERIOD):
+        self.pollPeriod = pollPeriod
+        self.keepRunning = True
+        self.cardReader = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rfid")
+        self.readStats = IoLatencyStats()
+        return None
+
+    def open(self)->bool:
+        if SimpleMFRC522 is None or GPIO is None:
+            print("RFID LAUNCH FAILURE: mfrc522/RPi.GPIO are not installed")
+            return False
+        try:
+            self.cardReader = SimpleMFRC522()
+        except (RuntimeError, OSError) as e:
+            print(f"RFID LAUNCH FAILURE: {e}")
+            return False
+        print("RFID LAUNCH SUCCESS")
+        return True
+
+    async def run(self)->None:
+        # Polls are started on deadlines, so a slow one doesn't delay the next by more than itself.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while self.keepRunning:
+            start = time.perf_counter()
+            cardId, cpuTime = await loop.run_in_executor(self.executor, self.readCardId)
+            self.readStats.update(1000*(time.perf_counter() - start), cpuTime)
+            if cardId:
+                self.SIGNALS.rfidReadResults.emit(cardId)
+            deadline = max(deadline + self.pollPeriod, loop.time())
+            await asyncio.sleep(deadline - loop.time())
+        return None
+
+    def readCardId(self)->tuple:
+        # (Runs on the executor's thread.)
+        cpuStart = time.thread_time()
+        try:
+            cardId = self.cardReader.read_id_no_block()
+        except Exception:
+            cardId = -1
+        return cardId, 1000*(time.thread_time() - cpuStart)
+
+    def close(self)->None:
+        self.keepRunning = False
+        # (A poll in flight is let finish before the GPIOs are released.)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.cardReader is not None:
+            GPIO.cleanup()
+            self.cardReader = None
+        print("SHUTTING RFID READER DOWN")
+        return None
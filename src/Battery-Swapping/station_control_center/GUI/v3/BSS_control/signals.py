@@ -0,0 +1,48 @@
+from weakref import WeakMethod
+from typing import Callable
+
+
+
+class Signal:
+    """
+    Stand-in for pyqtSignal, so that the model (ControlCenter, BatterySlot, EightChannelRelay) doesn't
+    depend on Qt and can run in the headless daemon. Connected callables are called synchronously, in
+    the order they were connected, by 'emit' (i.e, like a direct connection): emitting from another
+    thread is up to the caller (e.g, through loop.call_soon_threadsafe or a Qt signal).
+
+    As with pyqtSignal, a connection to a bound method doesn't keep its object alive.
+    """
+    __slots__ = ("types", "slots")
+
+    def __init__(self, *types : type):
+        self.types = types # (Only informative, as in pyqtSignal.)
+        self.slots = []
+        return None
+
+    def connect(self, slot : Callable)->None:
+        self.slots.append(WeakMethod(slot) if hasattr(slot, "__self__") and hasattr(slot, "__func__") else slot)
+        return None
+
+    def disconnect(self, slot : Callable | None = None)->None:
+        # Without a slot, every connection is dropped.
+        if slot is None:
+            self.slots.clear()
+        else:
+            self.slots = [connection for connection in self.slots if self.resolve(connection) != slot]
+        return None
+
+    def emit(self, *args)->None:
+        isAnyDead = False
+        for connection in tuple(self.slots):
+            slot = self.resolve(connection)
+            if slot is None:
+                isAnyDead = True
+            else:
+                slot(*args)
+        if isAnyDead:
+            self.slots = [connection for connection in self.slots if self.resolve(connection) is not None]
+        return None
+
+    @staticmethod
+    def resolve(connection)->Callable | None:
+        return connection() if isinstance(connection, WeakMethod) else connection
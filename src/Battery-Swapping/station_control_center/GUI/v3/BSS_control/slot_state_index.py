@@ -0,0 +1,93 @@
+from typing import Dict, List, Tuple, Hashable
+from BSS_control.CanUtils import MODULE_ADDRESS
+
+
+
+class SlotStatesQuery:
+    """
+    A precompiled 'statesToMatch' query (see ControlCenter.getSlotsThatMatchStates): the keywords the
+    index doesn't know about are dropped once, at compile time, instead of on every call.
+    """
+    __slots__ = ("criteria",)
+
+    def __init__(self, criteria : Tuple[Tuple[str, Hashable], ...]):
+        self.criteria = criteria
+        return None
+
+    @classmethod
+    def compile(cls, statesToMatch : dict, statesLogic : Dict[str, Tuple[bool, str]]):
+        return cls(tuple((keyword, value) for keyword, value in statesToMatch.items() if keyword in statesLogic))
+
+    def __repr__(self)->str:
+        return f"SlotStatesQuery({dict(self.criteria)})"
+
+
+class SlotStateIndex:
+    """
+    Keeps, for every state keyword, a bitmask of the slots that currently hold each value of that state
+    (bit i <=> slotAddresses[i]), so that a query with several criteria is just a bitwise AND of masks.
+
+    The index is maintained lazily and incrementally: when a keyword is queried, only the slots whose
+    module (i.e, BatterySlot or Battery) has bumped its generation since that keyword was last refreshed
+    are re-read. Slots holding nan (or any value that isn't equal to itself) belong to no mask, which
+    is what the '==' comparisons of the linear filter used to do.
+
+    'statesLogic' maps every keyword to (isSlotAttr, attrName), like ControlCenter.STATES_TO_MATCH_LOGIC.
+    """
+    def __init__(self, modules : dict, slotAddresses : List[MODULE_ADDRESS], statesLogic : Dict[str, Tuple[bool, str]]):
+        self.statesLogic = statesLogic
+        self.slotAddresses = list(slotAddresses)
+        self.slots = [modules[slotAddress] for slotAddress in self.slotAddresses]
+        self.batteries = [slot.battery for slot in self.slots]
+        self.allSlotsMask = (1 << len(self.slotAddresses)) - 1
+
+        numSlots = len(self.slotAddresses)
+        self.masks = {keyword : {} for keyword in statesLogic}                      # keyword -> {value : mask}
+        self.values = {keyword : [None]*numSlots for keyword in statesLogic}        # keyword -> value of every slot
+        self.generations = {keyword : [None]*numSlots for keyword in statesLogic}   # keyword -> generation seen per slot
+        self.slotsFromMask = {}
+        return None
+
+    def refresh(self, keyword : str)->None:
+        isSlotAttr, attrName = self.statesLogic[keyword]
+        modules = self.slots if isSlotAttr else self.batteries
+        masks, values, generations = self.masks[keyword], self.values[keyword], self.generations[keyword]
+
+        for i, module in enumerate(modules):
+            if generations[i] == module.generation:
+                continue
+
+            value = getattr(module, attrName)
+            # Reading a state may latch another one (e.g, isDamaged), so the generation is taken afterwards.
+            generations[i] = module.generation
+            oldValue = values[i]
+            if oldValue is value or oldValue == value:
+                continue
+
+            bit = 1 << i
+            if oldValue is not None and oldValue == oldValue:
+                masks[oldValue] &= ~bit
+                if not masks[oldValue]:
+                    del masks[oldValue]
+            if value == value:
+                masks[value] = masks.get(value, 0) | bit
+            values[i] = value
+        return None
+
+    def getMask(self, keyword : str, value : Hashable)->int:
+        self.refresh(keyword)
+        try:
+            return self.masks[keyword].get(value, 0)
+        except TypeError: # Unhashable values can't be equal to any state.
+            return 0
+
+    def match(self, query : SlotStatesQuery)->List[MODULE_ADDRESS]:
+        mask = self.allSlotsMask
+        for keyword, value in query.criteria:
+            if not mask:
+                break
+            mask &= self.getMask(keyword, value)
+
+        if mask not in self.slotsFromMask:
+            self.slotsFromMask[mask] = [slotAddress for i, slotAddress in enumerate(self.slotAddresses) if mask & (1 << i)]
+        return list(self.slotsFromMask[mask])
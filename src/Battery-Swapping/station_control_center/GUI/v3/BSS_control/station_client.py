@@ -0,0 +1,218 @@
+import time
+import warnings
+from typing import Callable, List
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtNetwork import QLocalSocket
+from BSS_control.tick_drift_stats import TickDriftStats
+from BSS_control.battery_slot import SOLENOID_NAME, LED_STRIP_STATE
+from BSS_control.eight_channel_relay import CHANNEL_NAME
+from BSS_control.CanUtils import MODULE_ADDRESS
+from BSS_control.station_ipc import (
+    DEFAULT_SOCKET_PATH,
+    StationMirror,
+    encodeMessage,
+    decodeMessage)
+
+
+
+class StationClientSignals(QObject):
+    limitSwitchStateChanged = pyqtSignal(int, bool, float)
+    rfidReadResults = pyqtSignal(int)
+    stationReady = pyqtSignal(dict)
+    connectionStateChanged = pyqtSignal(bool)
+
+
+class StationClient(StationMirror):
+    """
+    The GUI's handle on the station daemon (see station_daemon.py), standing in for the ControlCenter:
+    reads are served by the mirror of the daemon's latest snapshot, and commands are sent without
+    waiting for the daemon, so nothing in the GUI ever blocks on it. The socket is reconnected on its
+    own whenever the daemon goes away (e.g, it's restarted).
+    """
+    SIGNALS = StationClientSignals()
+    RECONNECT_PERIOD = 1000 #[ms]
+    RX_BUFFER_MAXLEN = 4*1024*1024 #[bytes]
+
+    def __init__(self, socketPath : str = DEFAULT_SOCKET_PATH, clock : Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.socketPath = socketPath
+        self.clock = clock
+        self.clockOrigin = clock()
+        self.tickStats = {}
+        self.rxBuffer = bytearray()
+        self.nextRequestId = 0
+        self.pendingReplies = {}
+
+        self.socket = QLocalSocket()
+        self.socket.connected.connect(self.onConnected)
+        self.socket.disconnected.connect(self.onDisconnected)
+        self.socket.error.connect(self.onError)
+        self.socket.readyRead.connect(self.readAvailable)
+        self.connectToDaemon()
+        return None
+
+    #%% CONNECTION
+    def connectToDaemon(self)->None:
+        if self.socket.state() == QLocalSocket.UnconnectedState:
+            self.socket.connectToServer(self.socketPath)
+        return None
+
+    def isConnected(self)->bool:
+        return self.socket.state() == QLocalSocket.ConnectedState
+
+    def close(self)->None:
+        # (Disconnected first: the socket must not try to reconnect, nor signal, while the app is closing.)
+        self.socket.disconnected.disconnect(self.onDisconnected)
+        self.socket.error.disconnect(self.onError)
+        self.socket.abort()
+        return None
+
+    def onConnected(self)->None:
+        print(f"STATION DAEMON CONNECTION SUCCESS: {self.socketPath}")
+        self.request("subscribe", callback=self.applySnapshot)
+        self.SIGNALS.connectionStateChanged.emit(True)
+        return None
+
+    def onDisconnected(self)->None:
+        warnings.warn("WARNING: Connection to the station daemon lost")
+        self.rxBuffer.clear()
+        self.pendingReplies.clear()
+        self.SIGNALS.connectionStateChanged.emit(False)
+        QTimer.singleShot(self.RECONNECT_PERIOD, self.connectToDaemon)
+        return None
+
+    def onError(self, error)->None:
+        # (A failed connection attempt doesn't emit 'disconnected'.)
+        if not self.isConnected() and error != QLocalSocket.PeerClosedError:
+            QTimer.singleShot(self.RECONNECT_PERIOD, self.connectToDaemon)
+        return None
+
+    #%% MESSAGES
+    def request(self, method : str, params : list = (), callback : Callable | None = None)->None:
+        # Replies (and errors) are handed to 'callback' later on. Without one, none is asked for.
+        if not self.isConnected():
+            warnings.warn(f"WARNING: '{method}' not sent, the station daemon is not connected")
+            return None
+        message = {"method" : method, "params" : list(params)}
+        if callback is not None:
+            self.nextRequestId += 1
+            message["id"] = self.nextRequestId
+            self.pendingReplies[self.nextRequestId] = callback
+        self.socket.write(encodeMessage(message))
+        return None
+
+    def readAvailable(self)->None:
+        self.rxBuffer += bytes(self.socket.readAll())
+        end = self.rxBuffer.rfind(b"\n")
+        if end < 0:
+            if len(self.rxBuffer) > self.RX_BUFFER_MAXLEN:
+                self.rxBuffer.clear()
+            return None
+
+        lines = self.rxBuffer[:end].split(b"\n")
+        del self.rxBuffer[:end+1]
+        # Only the latest of the snapshots that piled up is worth applying.
+        latestSnapshot = None
+        for line in lines:
+            try:
+                message = decodeMessage(line)
+            except ValueError:
+                warnings.warn("WARNING: Malformed message from the station daemon")
+                continue
+            if message.get("event") == "snapshot":
+                latestSnapshot = message["params"][0]
+            elif message.get("event") == "limitSwitchStateChanged":
+                if latestSnapshot is not None:
+                    self.applySnapshot(latestSnapshot)
+                    latestSnapshot = None
+                self.SIGNALS.limitSwitchStateChanged.emit(*message["params"])
+            elif message.get("event") == "rfidReadResults":
+                self.SIGNALS.rfidReadResults.emit(*message["params"])
+            elif message.get("event") == "stationReady":
+                self.SIGNALS.stationReady.emit(*message["params"])
+            elif "id" in message:
+                self.handleReply(message)
+        if latestSnapshot is not None:
+            self.applySnapshot(latestSnapshot)
+        return None
+
+    def handleReply(self, message : dict)->None:
+        callback = self.pendingReplies.pop(message["id"], None)
+        if "error" in message:
+            warnings.warn(f"WARNING: Station daemon error: {message['error']}")
+        elif callback is not None:
+            callback(message["result"])
+        return None
+
+    #%% GLOBAL TIME
+    def getGlobalTime(self)->float:
+        # Time [ms] elapsed since the client was created (the GUI's own time, the daemon keeps its own).
+        return 1000*(self.clock() - self.clockOrigin)
+
+    def recordTick(self, period : int)->float:
+        now = self.getGlobalTime()
+        if period not in self.tickStats:
+            self.tickStats[period] = TickDriftStats(period)
+        self.tickStats[period].update(now)
+        return now
+
+    def getTickStats(self)->dict:
+        return {period : stats.asDict() for period, stats in self.tickStats.items()}
+
+    #%% COMMANDS (same signatures as the ControlCenter's, executed by the daemon)
+    def setSlotSolenoidState(self, slotAddress : MODULE_ADDRESS, name : SOLENOID_NAME, state : bool, delay : int = 0)->None:
+        self.request("setSlotSolenoidState", [slotAddress, name, state, delay])
+        return None
+
+    def setSlotSolenoidsStates(self, slotAddress : MODULE_ADDRESS, states : List[bool], delay : int = 0)->None:
+        self.request("setSlotSolenoidsStates", [slotAddress, states, delay])
+        return None
+
+    def setSlotLedStripState(self, slotAddress : MODULE_ADDRESS, state : LED_STRIP_STATE, delay : int = 0)->None:
+        self.request("setSlotLedStripState", [slotAddress, state, delay])
+        return None
+
+    def setRelayChannelState(self, name : CHANNEL_NAME, state : bool, delay : int = 0)->None:
+        self.request("setRelayChannelState", [name, state, delay])
+        return None
+
+    def setRelayChannelStates(self, states : List[bool], delay : int = 0)->None:
+        self.request("setRelayChannelStates", [states, delay])
+        return None
+
+    def secureAllSlots(self)->None:
+        self.request("secureAllSlots")
+        return None
+
+    def turnOnLedStripsBasedOnState(self)->None:
+        self.request("turnOnLedStripsBasedOnState")
+        return None
+
+    def turnOnLedStripsBasedOnState_Entry(self)->None:
+        self.request("turnOnLedStripsBasedOnState_Entry")
+        return None
+
+    def turnOnLedStripsBasedOnState_Egress(self)->MODULE_ADDRESS | None:
+        # The slot is selected here, from the mirror, since the GUI needs it right away (and must
+        # unlock the very slot that is lit).
+        slotsWithDeliverableBatteriesToUser = self.getDeliverableSlots()
+        selectedSlotAddress = slotsWithDeliverableBatteriesToUser[0] if slotsWithDeliverableBatteriesToUser else None
+        for slotAddress in self.SLOT_ADDRESSES:
+            self.setSlotLedStripState(slotAddress, LED_STRIP_STATE.GREEN if slotAddress == selectedSlotAddress else LED_STRIP_STATE.OFF)
+        return selectedSlotAddress
+
+    def turnOffAllLedStrips(self)->None:
+        self.request("turnOffAllLedStrips")
+        return None
+
+    def turnOnBmsSolenoidsWhereWise(self)->None:
+        self.request("turnOnBmsSolenoidsWhereWise")
+        return None
+
+    def turnOffAllBmsSolenoidsIfPossible(self)->None:
+        self.request("turnOffAllBmsSolenoidsIfPossible")
+        return None
+
+    def hardwareSetup(self)->None:
+        self.request("hardwareSetup")
+        return None
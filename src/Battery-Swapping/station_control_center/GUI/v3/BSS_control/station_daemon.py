@@ -0,0 +1,344 @@
+"""
+Headless control daemon of the station: one asyncio event loop owns the CAN transport, the
+ControlCenter and its timers, and runs the station on its own (boot, global timer tick, charge
+policy). The GUI is just a client of it over a local socket (see station_ipc.py
+and station_client.py), so the station keeps charging while the GUI is missing, hung or restarting.
+
+The RFID card reader is read here too (--rfid), and its reads are forwarded to the clients.
+
+Example:
+    python -m BSS_control.station_daemon --transport serial --port /dev/ttyUSB0 --rfid
+    python -m BSS_control.station_daemon --transport emulator --scenario FULL_STATION
+"""
+import os
+import time
+import socket
+import signal
+import asyncio
+import argparse
+import traceback
+from typing import List
+from concurrent.futures import ThreadPoolExecutor
+
+from BSS_control.control_center import ControlCenter
+from BSS_control.battery_slot import BatterySlot
+from BSS_control.rfid_reader import AsyncRfidReader
+from BSS_control.boot_coordinator import BootCoordinator
+from BSS_control.station_emulator import StationEmulator
+from BSS_control.async_transports import (
+    AsyncCanTransport,
+    AsyncSerialBridgeTransport,
+    AsyncSocketCanTransport,
+    AsyncEmulatorTransport)
+from BSS_control.station_ipc import (
+    DEFAULT_SOCKET_PATH,
+    encodeMessage,
+    decodeMessage,
+    getStationSnapshot)
+
+
+# The telemetry history (and the charge time tables fitted on it) is station data, so it's kept out of the
+# source tree: in the user's data directory, unless BSS_TELEMETRY_HISTORY or --telemetry-history say otherwise.
+DEFAULT_TELEMETRY_HISTORY_DIRECTORY = os.environ.get("BSS_TELEMETRY_HISTORY",
+    os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "bss_control", "telemetry_history"))
+
+
+class StationDaemon:
+    """
+    Runs the station from a single event loop: the transport's reads, the global timer tick and the
+    requests of the clients are all handled there, one at a time, so the ControlCenter needs no locking.
+    Clients that subscribe get a snapshot of the station after every tick (see station_ipc.py), and
+    a "stationReady" event (with the boot's report) once the BootCoordinator deems the station ready.
+    Charging only starts then.
+    """
+    TICK_PERIOD = 250 #[ms]
+    CHARGE_POLICY_PERIOD = 30000 #[ms]
+    CHARGE_FINISH_DELAY = 15000 #[ms] (After every charge start round.)
+    MAX_CLIENT_BACKLOG = 256*1024 #[bytes] (Events are dropped for a client that doesn't read them.)
+
+    # ControlCenter methods that clients may call (anything else is refused).
+    CLIENT_METHODS = frozenset((
+        "setSlotSolenoidState",
+        "setSlotSolenoidsStates",
+        "setSlotLedStripState",
+        "setRelayChannelState",
+        "setRelayChannelStates",
+        "secureAllSlots",
+        "turnOnLedStripsBasedOnState",
+        "turnOnLedStripsBasedOnState_Entry",
+        "turnOnLedStripsBasedOnState_Egress",
+        "turnOffAllLedStrips",
+        "turnOnBmsSolenoidsWhereWise",
+        "turnOffAllBmsSolenoidsIfPossible",
+        "hardwareSetup",
+        "startChargeOfSlotBatteryIfAllowable",
+        "finishChargeOfSlotBatteryIfAllowable",
+        "startChargeOfSlotBatteriesIfAllowable",
+        "finishChargeOfSlotBatteriesIfAllowable",
+        "cancelChargeSequence",
+        "getChargeSequenceStatus",
+        "getInFlightChargeSteps",
+        "getSlotsThatMatchStates",
+        "getDeliverableSlots",
+        "getStationMaxTemperature",
+        "getFrameArrivalStats",
+        "getSilentModules",
+        "getTickStats"))
+
+    def __init__(self, transport : AsyncCanTransport, socketPath : str = DEFAULT_SOCKET_PATH, telemetryHistoryDirectory : str | None = None,
+                 rfidReader : AsyncRfidReader | None = None):
+        self.startTime = time.monotonic()
+        self.cpuStartTime = time.process_time()
+        self.transport = transport
+        self.rfidReader = rfidReader
+        self.socketPath = socketPath
+        # (A single thread, so that fits of the charge time estimator never overlap.)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="control_center")
+        self.controlCenter = ControlCenter(telemetryHistoryDirectory, executor=self.executor)
+        self.transport.connectToControlCenter(self.controlCenter)
+        BatterySlot.SIGNALS.limitSwitchStateChanged.connect(self.publishLimitSwitchStateChanged)
+        AsyncRfidReader.SIGNALS.rfidReadResults.connect(self.publishRfidReadResults)
+
+        self.server = None
+        self.stopped = None
+        self.tasks = []
+        self.clients = set()
+        self.subscribers = set()
+        self.droppedEvents = 0
+        self.boot = BootCoordinator(self.controlCenter)
+        self.nextChargePolicyTime = None
+        return None
+
+    #%% LIFETIME
+    async def run(self)->bool:
+        # Serves clients right away, the transport is opened after (a serial handshake takes a while).
+        loop = asyncio.get_running_loop()
+        self.stopped = loop.create_future()
+        if not await self.startServer():
+            return False
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.stop)
+        self.tasks.append(asyncio.create_task(self.controlLoop()))
+        print(f"STATION DAEMON LAUNCH SUCCESS: {self.socketPath} ({1000*(time.monotonic() - self.startTime):.0f} ms)")
+
+        # (The station can go on charging without the card reader, so its failure isn't fatal.)
+        if self.rfidReader is not None and self.rfidReader.open():
+            self.tasks.append(asyncio.create_task(self.rfidReader.run()))
+
+        transportIsOpen = await self.transport.open()
+        if transportIsOpen:
+            self.boot.linkOpened()
+            self.tasks.append(asyncio.create_task(self.transport.run()))
+            self.tasks[-1].add_done_callback(lambda task: self.stop())
+        else:
+            self.stop()
+
+        await self.stopped
+        await self.shutdown()
+        return transportIsOpen
+
+    async def startServer(self)->bool:
+        if os.path.exists(self.socketPath):
+            # A socket nobody listens to is left over from a daemon that died: it's replaced.
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socketPath)
+                print(f"STATION DAEMON LAUNCH FAILURE: another daemon is serving {self.socketPath}")
+                return False
+            except OSError:
+                os.unlink(self.socketPath)
+            finally:
+                probe.close()
+        self.server = await asyncio.start_unix_server(self.serveClient, path=self.socketPath)
+        return True
+
+    def stop(self)->None:
+        if self.stopped is not None and not self.stopped.done():
+            self.stopped.set_result(None)
+        return None
+
+    async def shutdown(self)->None:
+        print("SHUTTING STATION DAEMON DOWN")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.transport.close()
+        if self.rfidReader is not None:
+            self.rfidReader.close()
+        if self.server is not None:
+            self.server.close()
+            for writer in tuple(self.clients):
+                writer.close()
+            await self.server.wait_closed()
+            if os.path.exists(self.socketPath):
+                os.unlink(self.socketPath)
+        # (A fit in flight is let finish, so that its tables are saved.)
+        self.executor.shutdown(wait=True)
+        return None
+
+    #%% CONTROL LOOP
+    async def controlLoop(self)->None:
+        # Ticks are scheduled on deadlines, so they don't drift. After a stall the missed ones are
+        # skipped (and counted by ControlCenter.recordTick) instead of being run in a burst.
+        loop = asyncio.get_running_loop()
+        period = self.TICK_PERIOD/1000
+        deadline = loop.time()
+        while True:
+            deadline += period
+            await asyncio.sleep(max(deadline - loop.time(), 0))
+            if loop.time() - deadline > period:
+                deadline = loop.time()
+            try:
+                self.tick()
+            except Exception:
+                # A bug in one tick mustn't leave the station without control.
+                traceback.print_exc()
+
+    def tick(self)->None:
+        controlCenter = self.controlCenter
+        now = controlCenter.recordTick(self.TICK_PERIOD)
+        controlCenter.updateCurrentGlobalTime(now)
+        if not self.boot.isReady and self.boot.update(now):
+            self.nextChargePolicyTime = now
+            self.publish("stationReady", [self.boot.getReport()])
+        if self.boot.isReady and now >= self.nextChargePolicyTime:
+            self.runChargePolicy()
+            self.nextChargePolicyTime = now + self.CHARGE_POLICY_PERIOD
+        controlCenter.reconcilePeripherals()
+        controlCenter.sendCanMsg()
+        if self.subscribers:
+            self.publish("snapshot", [getStationSnapshot(controlCenter)])
+        return None
+
+    def runChargePolicy(self)->None:
+        self.controlCenter.startChargeOfSlotBatteriesIfAllowable()
+        self.controlCenter.callLater(self.CHARGE_FINISH_DELAY, self.controlCenter.finishChargeOfSlotBatteriesIfAllowable)
+        return None
+
+    #%% CLIENTS
+    async def serveClient(self, reader : asyncio.StreamReader, writer : asyncio.StreamWriter)->None:
+        self.clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.handleRequest(line, writer)
+        except (ConnectionError, ValueError):
+            # (ValueError: a line longer than the reader's limit.)
+            pass
+        finally:
+            self.clients.discard(writer)
+            self.subscribers.discard(writer)
+            writer.close()
+        return None
+
+    def handleRequest(self, line : bytes, writer : asyncio.StreamWriter)->None:
+        try:
+            request = decodeMessage(line)
+            requestId = request.get("id")
+            method = request["method"]
+            params = request.get("params", [])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.send(writer, {"id" : None, "error" : f"Malformed request: {e}"})
+            return None
+
+        try:
+            if method == "subscribe":
+                self.subscribers.add(writer)
+                reply = {"id" : requestId, "result" : getStationSnapshot(self.controlCenter)}
+            elif method == "getSnapshot":
+                reply = {"id" : requestId, "result" : getStationSnapshot(self.controlCenter)}
+            elif method == "getBootReport":
+                reply = {"id" : requestId, "result" : self.boot.getReport()}
+            elif method == "getDaemonStats":
+                reply = {"id" : requestId, "result" : self.getDaemonStats()}
+            elif method in self.CLIENT_METHODS:
+                reply = {"id" : requestId, "result" : getattr(self.controlCenter, method)(*params)}
+            else:
+                reply = {"id" : requestId, "error" : f"Unknown method '{method}'"}
+        except Exception as e:
+            reply = {"id" : requestId, "error" : f"{type(e).__name__}: {e}"}
+
+        if requestId is not None:
+            self.send(writer, reply)
+        if method == "subscribe" and self.boot.isReady:
+            # (A client that (re)connects after the boot learns it right after its snapshot.)
+            self.send(writer, {"event" : "stationReady", "params" : [self.boot.getReport()]})
+        return None
+
+    def send(self, writer : asyncio.StreamWriter, message : dict, isDroppable : bool = False)->None:
+        if writer.is_closing():
+            return None
+        if isDroppable and writer.transport.get_write_buffer_size() > self.MAX_CLIENT_BACKLOG:
+            self.droppedEvents += 1
+            return None
+        writer.write(encodeMessage(message))
+        return None
+
+    def publish(self, event : str, params : list)->None:
+        message = {"event" : event, "params" : params}
+        for writer in tuple(self.subscribers):
+            self.send(writer, message, isDroppable=True)
+        return None
+
+    def publishLimitSwitchStateChanged(self, slotAddressValue : int, state : bool, timestamp : float)->None:
+        # Preceded by a snapshot, so that clients handle the event with the states it changed (as they
+        # would with the ControlCenter itself), not with those of the last tick.
+        if self.subscribers:
+            self.publish("snapshot", [getStationSnapshot(self.controlCenter)])
+            self.publish("limitSwitchStateChanged", [slotAddressValue, state, timestamp])
+        return None
+
+    def publishRfidReadResults(self, cardId : int)->None:
+        if self.subscribers:
+            self.publish("rfidReadResults", [cardId])
+        return None
+
+    def getDaemonStats(self)->dict:
+        uptime = 1000*(time.monotonic() - self.startTime) #[ms]
+        cpuTime = 1000*(time.process_time() - self.cpuStartTime) #[ms] (All threads of the daemon.)
+        return {"uptime"         : uptime,
+                "cpuTime"        : cpuTime,
+                "cpuUsage"       : cpuTime/uptime,
+                "transport"      : type(self.transport).__name__,
+                "framesReceived" : self.transport.framesReceived,
+                "framesRejected" : self.transport.framesRejected,
+                "framesDropped"  : self.transport.framesDropped,
+                "transportIo"    : self.transport.getIoStats(),
+                "rfidIo"         : None if self.rfidReader is None else self.rfidReader.readStats.asDict(),
+                "clients"        : len(self.clients),
+                "subscribers"    : len(self.subscribers),
+                "droppedEvents"  : self.droppedEvents,
+                "boot"           : self.boot.getReport(),
+                "tickStats"      : self.controlCenter.getTickStats()}
+
+
+#%%                   COMMAND LINE INTERFACE
+
+def makeTransport(args : argparse.Namespace)->AsyncCanTransport:
+    if args.transport == "socketcan":
+        return AsyncSocketCanTransport(channel=args.channel)
+    elif args.transport == "emulator":
+        emulator = StationEmulator()
+        emulator.loadScenario(args.scenario)
+        return AsyncEmulatorTransport(emulator)
+    return AsyncSerialBridgeTransport(port=args.port)
+
+def main(argv : List[str] | None = None)->int:
+    parser = argparse.ArgumentParser(description="Headless control daemon of the battery swapping station.")
+    parser.add_argument("--transport", choices=("serial", "socketcan", "emulator"), default="serial")
+    parser.add_argument("--port", default="/dev/ttyUSB0", help="Serial port of the bridge module (serial transport).")
+    parser.add_argument("--channel", default="can0", help="CAN interface (socketcan transport).")
+    parser.add_argument("--scenario", default="FULL_STATION", help="Scenario of the emulated station (emulator transport).")
+    parser.add_argument("--rfid", action="store_true", help="Read the MFRC522 RFID card reader.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Path of the socket served to clients.")
+    parser.add_argument("--telemetry-history", default=DEFAULT_TELEMETRY_HISTORY_DIRECTORY, help="Directory of the telemetry history ('' to disable it).")
+    args = parser.parse_args(argv)
+
+    daemon = StationDaemon(makeTransport(args), args.socket, args.telemetry_history or None, AsyncRfidReader() if args.rfid else None)
+    return 0 if asyncio.run(daemon.run()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
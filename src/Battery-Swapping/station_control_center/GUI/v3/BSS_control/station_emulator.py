@@ -0,0 +1,615 @@
+"""
+Software emulator of the station's global CAN network, used for load testing the control center
+without a physical station. It reproduces the firmware of the battery slot modules (battery_slot.ino),
+of the eight-channel relay module (eight_channel_relay.ino) and of the serial bridge
+(serial_coms_interface_module.ino): same frames, same rates and same reaction to the rpy2net_*
+commands. Batteries are simulated behind each slot's BMS solenoid and scenarios (battery insertion,
+BMS CAN-bus errors, overheating, ...) can be scripted on top.
+
+The emulator can be plugged into the control center in two ways:
+    - EmulatedSerialBridge: one pty per bridge, to be opened by AsyncSerialBridgeTransport(port=...)
+      (python -m BSS_control.station_daemon --transport serial --port ...).
+    - AsyncEmulatorTransport (async_transports.py): a loopback transport handing can_frames straight to
+      the ControlCenter, on the station daemon's event loop
+      (python -m BSS_control.station_daemon --transport emulator --scenario ...).
+
+Example:
+    python -m BSS_control.station_emulator --slots 1 4 5 8 --bridges 1 --scenario BATTERY_INSERTION
+"""
+import os
+import pty
+import tty
+import time
+import heapq
+import random
+import select
+from itertools import count
+from typing import List, Dict, Callable
+
+from BSS_control.battery import BATTERY_WARNINGS
+from BSS_control.battery_slot import (
+    LED_STRIP_STATE,
+    SOLENOID_NAME)
+
+from BSS_control.CanUtils import (
+    can_frame,
+    CanStr,
+    PRIORITY_LEVEL,
+    MODULE_ADDRESS,
+    ACTIVITY_CODE,
+    BIN_FRAME_DELIMITER,
+    BIN_MODE_REQUEST,
+    BIN_MODE_ACK,
+    BIN_MODE_ADVERTISEMENT)
+
+
+
+BATTERY_DATA_ACTIVITY_CODES = [ACTIVITY_CODE(ACTIVITY_CODE.net2rpy_BATTERY_DATA_0.value + i) for i in range(11)]
+
+
+#%%                   DEFINITION OF EMULATED BATTERY
+
+class EmulatedBattery:
+    """
+    Crude model of a 10s Li-ion pack and its BMS, good enough to produce plausible
+    BATTERY_DATA_0..10 frames: constant-current charge at MAX_CHARGING_CURRENT tapering off
+    above TAPER_SOC, thermal drift towards a current-dependent temperature and the BMS' own
+    over-temperature warning/protection.
+
+    BATTERY_DATA frames layout (as decoded by Battery.updateStatesFromCanMsg):
+        - DATA_0 : voltage*10 (uint16 LE), (current + 3200)*10 (uint16 LE), soc, warnings 0..23.
+        - DATA_1 : warnings 24..28, warnings 29..31.
+        - DATA_2..8 : cell voltages in [mV] (uint16 LE), 4 per frame.
+        - DATA_9 : NTC1..4 + 40 in data[4..7].
+        - DATA_10 : NTC5, NTC6, MOSFET + 40 in data[0..2].
+    """
+    NUM_CELLS = 10
+    NUM_NTCS = 6
+    MIN_VOLTAGE = 30.0 #[V]
+    MAX_VOLTAGE = 42.1 #[V]
+    MAX_CHARGING_CURRENT = 12 #[A]
+    MIN_CHARGING_CURRENT = 0.5 #[A]
+    TAPER_SOC = 90 #[%]
+    SECONDS_PER_SOC_PERCENTAGE_INCREASE = 76.5 #[s/%] (At MAX_CHARGING_CURRENT)
+    AMBIENT_TEMPERATURE = 25 #[°C]
+    TEMPERATURE_RISE_AT_MAX_CURRENT = 10 #[°C]
+    THERMAL_TIME_CONSTANT = 120 #[s]
+    HIGH_TEMPERATURE_WARNING = 55 #[°C]
+    HIGH_TEMPERATURE_PROTECTION = 65 #[°C]
+
+    def __init__(self, soc : float = 50, seed : int = 0):
+        rng = random.Random(seed)
+        self.soc = soc
+        self.current = 0.0
+        self.cellOffsets = [rng.uniform(-0.01, 0.01) for _ in range(self.NUM_CELLS)] #[V]
+        self.temperatures = [self.AMBIENT_TEMPERATURE + rng.uniform(-1, 1) for _ in range(self.NUM_NTCS)]
+        self.mosfetTemperature = self.AMBIENT_TEMPERATURE
+        self.temperatureOffset = 0
+        self.forcedWarnings = set()
+        self.hasCanBusFailure = False
+        return None
+
+    @property
+    def voltage(self)->float:
+        voltage = self.MIN_VOLTAGE + (self.MAX_VOLTAGE - self.MIN_VOLTAGE)*self.soc/100
+        return voltage + 0.02*self.current
+
+    @property
+    def cellVoltages(self)->List[float]:
+        return [self.voltage/self.NUM_CELLS + offset for offset in self.cellOffsets]
+
+    @property
+    def maxTemperature(self)->float:
+        return max(self.temperatures + [self.mosfetTemperature])
+
+    @property
+    def warnings(self)->set:
+        warnings = set(self.forcedWarnings)
+        if self.maxTemperature >= self.HIGH_TEMPERATURE_WARNING:
+            warnings.add(BATTERY_WARNINGS.CHARGING_HIGH_TEMPERATURE_WARNING)
+        if self.maxTemperature >= self.HIGH_TEMPERATURE_PROTECTION:
+            warnings.add(BATTERY_WARNINGS.CHARGING_HIGH_TEMPERATURE_PROTECTION)
+        return warnings
+
+    def step(self, dt : float, isPlugged : bool)->None:
+        # dt is given in [s].
+        if isPlugged and BATTERY_WARNINGS.CHARGING_HIGH_TEMPERATURE_PROTECTION not in self.warnings:
+            if self.soc < self.TAPER_SOC:
+                self.current = self.MAX_CHARGING_CURRENT
+            else:
+                taper = (100 - self.soc)/(100 - self.TAPER_SOC)
+                self.current = max(self.MIN_CHARGING_CURRENT, self.MAX_CHARGING_CURRENT*taper)
+        else:
+            self.current = 0.0
+
+        if self.soc < 100:
+            socRate = (self.current/self.MAX_CHARGING_CURRENT)/self.SECONDS_PER_SOC_PERCENTAGE_INCREASE
+            self.soc = min(100, self.soc + socRate*dt)
+
+        targetTemperature = self.AMBIENT_TEMPERATURE + self.temperatureOffset
+        targetTemperature += self.TEMPERATURE_RISE_AT_MAX_CURRENT*self.current/self.MAX_CHARGING_CURRENT
+        alpha = min(1, dt/self.THERMAL_TIME_CONSTANT)
+        self.temperatures = [temperature + alpha*(targetTemperature - temperature) for temperature in self.temperatures]
+        self.mosfetTemperature += alpha*(targetTemperature + 2 - self.mosfetTemperature)
+        return None
+
+    def getBatteryStates(self)->List[bytearray]:
+        batteryStates = [bytearray(8) for _ in range(11)]
+
+        voltage = round(10*self.voltage)
+        current = round(10*(self.current + 3200))
+        warningBits = sum(1 << warning.value for warning in self.warnings)
+        batteryStates[0][0:2] = voltage.to_bytes(2, "little")
+        batteryStates[0][2:4] = current.to_bytes(2, "little")
+        batteryStates[0][4] = int(self.soc)
+        batteryStates[0][5:8] = (warningBits & 0xFFFFFF).to_bytes(3, "little")
+        batteryStates[1][0] = (warningBits >> 24) & 0b11111
+        batteryStates[1][1] = (warningBits >> 29) & 0b111
+
+        for i, cellVoltage in enumerate(self.cellVoltages):
+            j, k = divmod(i, 4)
+            batteryStates[2+j][2*k:2*k+2] = round(1000*cellVoltage).to_bytes(2, "little")
+
+        temperatures = [min(255, max(0, round(temperature) + 40)) for temperature in self.temperatures + [self.mosfetTemperature]]
+        batteryStates[9][4:8] = bytes(temperatures[0:4])
+        batteryStates[10][0:3] = bytes(temperatures[4:7])
+        return batteryStates
+
+
+#%%                   DEFINITION OF EMULATED MODULES
+
+class EmulatedBatterySlotModule:
+    """
+    Mirrors battery_slot.ino: peripherals states are sent every SEND_PERIPHERALS_STATES_TIMEOUT and
+    the last BMS states are relayed every RELAY_BATTERY_STATES_TIMEOUT, as long as a battery is in
+    the slot, its BMS is on and no battery CAN-bus error has been latched. All times are given in [ms].
+    """
+    RELAY_BATTERY_STATES_TIMEOUT = 50
+    SEND_PERIPHERALS_STATES_TIMEOUT = 50
+    BATTERY_CAN_BUS_ERROR_STATE_TIMEOUT = 4000
+    BMS_BROADCAST_PERIOD = 100
+
+    def __init__(self, moduleAddress : MODULE_ADDRESS, now : float = 0):
+        self.moduleAddress = moduleAddress
+        self.battery = None
+        self.ledStripState = LED_STRIP_STATE.OFF.value
+        self.solenoidsStates = [0, 0, 0]
+        self.batteryStates = [bytearray(8) for _ in range(11)]
+        self.batteryCanBusErrorState = 0
+        self.batteryCanBusErrorStateTimer = now
+        self.relayBatteryStatesTimer = now
+        self.sendPeripheralsStatesTimer = now
+        self.bmsBroadcastTimer = now
+        return None
+
+    @property
+    def limitSwitchState(self)->int:
+        return int(self.battery is not None)
+
+    def resetBatteryCanBusErrorAndTimer(self, now : float)->None:
+        self.batteryCanBusErrorState = 0
+        self.batteryCanBusErrorStateTimer = now
+        return None
+
+    def updateBatteryCanBusErrorState(self, now : float)->None:
+        if not self.limitSwitchState or not self.solenoidsStates[SOLENOID_NAME.BMS.value]:
+            self.resetBatteryCanBusErrorAndTimer(now)
+        elif now - self.batteryCanBusErrorStateTimer > self.BATTERY_CAN_BUS_ERROR_STATE_TIMEOUT:
+            self.batteryCanBusErrorState = 1
+        else:
+            self.batteryCanBusErrorState = 0
+        return None
+
+    def canRelayBatteryStates(self)->bool:
+        return self.limitSwitchState and self.solenoidsStates[SOLENOID_NAME.BMS.value] and not self.batteryCanBusErrorState
+
+    def getBatteryStates(self, now : float)->None:
+        self.updateBatteryCanBusErrorState(now)
+        if not self.canRelayBatteryStates() or now - self.bmsBroadcastTimer < self.BMS_BROADCAST_PERIOD:
+            return None
+
+        self.bmsBroadcastTimer = now
+        if not self.battery.hasCanBusFailure:
+            self.batteryStates = self.battery.getBatteryStates()
+            self.resetBatteryCanBusErrorAndTimer(now)
+        return None
+
+    def createCanMsg(self, priorityLevel : PRIORITY_LEVEL, activityCode : ACTIVITY_CODE, data)->can_frame:
+        return can_frame.from_canIdParams(priorityLevel, activityCode, MODULE_ADDRESS.CONTROL_CENTER, self.moduleAddress, data)
+
+    def net2rpy_relayBatteryStates(self, now : float)->List[can_frame]:
+        self.updateBatteryCanBusErrorState(now)
+        if not self.canRelayBatteryStates():
+            return []
+
+        res = []
+        for j, activityCode in enumerate(BATTERY_DATA_ACTIVITY_CODES):
+            if   j == 0: priorityLevel = PRIORITY_LEVEL.MEDIUM_HIGH
+            elif j == 1: priorityLevel = PRIORITY_LEVEL.MEDIUM_LOW
+            else:        priorityLevel = PRIORITY_LEVEL.LOW_
+            res.append(self.createCanMsg(priorityLevel, activityCode, bytes(self.batteryStates[j])))
+        return res
+
+    def net2rpy_sendPeripheralsStates(self, now : float)->can_frame:
+        self.updateBatteryCanBusErrorState(now)
+        data = [self.limitSwitchState, self.ledStripState] + self.solenoidsStates + [self.batteryCanBusErrorState, 0, 0]
+        return self.createCanMsg(PRIORITY_LEVEL.MEDIUM_HIGH, ACTIVITY_CODE.net2rpy_PERIPHERALS_STATES_OF_BATTERY_SLOT_MODULE, data)
+
+    def step(self, now : float)->List[can_frame]:
+        res = []
+        self.getBatteryStates(now)
+        if now - self.relayBatteryStatesTimer > self.RELAY_BATTERY_STATES_TIMEOUT:
+            res.extend(self.net2rpy_relayBatteryStates(now))
+            self.relayBatteryStatesTimer = now
+        if now - self.sendPeripheralsStatesTimer > self.SEND_PERIPHERALS_STATES_TIMEOUT:
+            res.append(self.net2rpy_sendPeripheralsStates(now))
+            self.sendPeripheralsStatesTimer = now
+        return res
+
+    def executeCommand(self, canMsg : can_frame, now : float)->None:
+        activityCode, data = canMsg.activityCode, canMsg.data
+
+        if activityCode == ACTIVITY_CODE.rpy2net_SET_SOLENOID_STATE_OF_BATTERY_SLOT_MODULE:
+            if data[0] < 3: self.solenoidsStates[data[0]] = int(bool(data[1]))
+        elif activityCode == ACTIVITY_CODE.rpy2net_SET_SOLENOIDS_STATES_OF_BATTERY_SLOT_MODULE:
+            self.solenoidsStates = [int(bool(data[i])) for i in range(3)]
+        elif activityCode == ACTIVITY_CODE.rpy2net_FLIP_SOLENOID_STATE_OF_BATTERY_SLOT_MODULE:
+            if data[0] < 3: self.solenoidsStates[data[0]] ^= 1
+        elif activityCode == ACTIVITY_CODE.rpy2net_FLIP_SOLENOIDS_STATES_OF_BATTERY_SLOT_MODULE:
+            self.solenoidsStates = [state ^ int(bool(data[i])) for i, state in enumerate(self.solenoidsStates)]
+        elif activityCode == ACTIVITY_CODE.rpy2net_SET_LED_STRIP_STATE_OF_BATTERY_SLOT_MODULE:
+            # Unknown colours are ignored, just like the firmware's switch does.
+            if data[0] < len(LED_STRIP_STATE): self.ledStripState = data[0]
+        elif activityCode == ACTIVITY_CODE.rpy2net_RESET_BATTERY_CAN_BUS_ERROR_STATE_AND_TIMER:
+            self.resetBatteryCanBusErrorAndTimer(now)
+        return None
+
+
+class EmulatedEightChannelRelayModule:
+    """
+    Mirrors eight_channel_relay.ino: channels states are sent every SEND_CHANNELS_STATES_TIMEOUT [ms].
+    """
+    SEND_CHANNELS_STATES_TIMEOUT = 50
+    moduleAddress = MODULE_ADDRESS.EIGHT_CHANNEL_RELAY
+
+    def __init__(self, now : float = 0):
+        self.channelsStates = [0]*8
+        self.sendChannelsStatesTimer = now
+        return None
+
+    def step(self, now : float)->List[can_frame]:
+        if now - self.sendChannelsStatesTimer <= self.SEND_CHANNELS_STATES_TIMEOUT:
+            return []
+        self.sendChannelsStatesTimer = now
+        return [can_frame.from_canIdParams(PRIORITY_LEVEL.MEDIUM,
+                                           ACTIVITY_CODE.net2rpy_STATES_INFO_OF_EIGHT_CHANNEL_RELAY_MODULE,
+                                           MODULE_ADDRESS.CONTROL_CENTER,
+                                           self.moduleAddress,
+                                           bytes(self.channelsStates))]
+
+    def executeCommand(self, canMsg : can_frame, now : float)->None:
+        activityCode, data = canMsg.activityCode, canMsg.data
+
+        if activityCode == ACTIVITY_CODE.rpy2net_SET_STATE_OF_EIGHT_CHANNEL_RELAY_MODULE:
+            if data[0] < 8: self.channelsStates[data[0]] = int(bool(data[1]))
+        elif activityCode == ACTIVITY_CODE.rpy2net_SET_STATES_OF_EIGHT_CHANNEL_RELAY_MODULE:
+            self.channelsStates = [int(bool(value)) for value in data]
+        elif activityCode == ACTIVITY_CODE.rpy2net_FLIP_STATE_OF_EIGHT_CHANNEL_RELAY_MODULE:
+            if data[0] < 8: self.channelsStates[data[0]] ^= 1
+        elif activityCode == ACTIVITY_CODE.rpy2net_FLIP_STATES_OF_EIGHT_CHANNEL_RELAY_MODULE:
+            self.channelsStates = [state ^ int(bool(value)) for state, value in zip(self.channelsStates, data)]
+        return None
+
+
+#%%                   DEFINITION OF EMULATED STATION
+
+class StationEmulator:
+    """
+    Emulated global CAN network: battery slot modules at 'slotAddresses' (any subset of SLOT1..SLOT8)
+    plus the eight-channel relay module, whose channel i powers the charger of SLOTi+1. Time is driven
+    from outside through 'step(now)' (in [ms]), so the emulator can run against the wall clock or,
+    for repeatable benchmarks, against a simulated one. 'timeScale' only speeds up the battery model
+    (e.g, to go through a whole charge in minutes), frames are always sent at the firmware's rates.
+    """
+    SLOT_ADDRESSES = [MODULE_ADDRESS(i) for i in [1,4,5,8]]
+
+    def __init__(self, slotAddresses : List[MODULE_ADDRESS] = None, timeScale : float = 1.0, seed : int = 0, now : float = 0):
+        slotAddresses = self.SLOT_ADDRESSES if slotAddresses is None else slotAddresses
+        self.timeScale = timeScale
+        self.seed = seed
+        self.now = now
+        self.relay = EmulatedEightChannelRelayModule(now)
+        self.slots = {address : EmulatedBatterySlotModule(address, now) for address in slotAddresses}
+        self.modules = {address : slot for address, slot in self.slots.items()}
+        self.modules[self.relay.moduleAddress] = self.relay
+
+        # Modules don't boot at the exact same time, so their periodic frames are spread out.
+        for i, slot in enumerate(self.slots.values()):
+            slot.relayBatteryStatesTimer -= 7*i
+            slot.sendPeripheralsStatesTimer -= 7*i + 3
+
+        self.events = []
+        self.eventsSequence = count()
+
+        # STATS
+        self.framesSent = 0
+        self.commandsExecuted = 0
+        return None
+
+    def schedule(self, delay : float, action : Callable, *args)->None:
+        heapq.heappush(self.events, (self.now + delay, next(self.eventsSequence), action, args))
+        return None
+
+    def runDueEvents(self, now : float)->None:
+        while self.events and self.events[0][0] <= now:
+            _, _, action, args = heapq.heappop(self.events)
+            action(*args)
+        return None
+
+    def step(self, now : float)->List[can_frame]:
+        dt = max(0, now - self.now)*self.timeScale/1000
+        self.now = now
+        self.runDueEvents(now)
+
+        res = []
+        for address, slot in self.slots.items():
+            if slot.battery is not None:
+                isPlugged = self.relay.channelsStates[address.value-1] and slot.solenoidsStates[SOLENOID_NAME.BMS.value]
+                slot.battery.step(dt, bool(isPlugged))
+            res.extend(slot.step(now))
+        res.extend(self.relay.step(now))
+        self.framesSent += len(res)
+        return res
+
+    def executeCanMsg(self, canMsg : can_frame)->None:
+        try:
+            destinationAddress = canMsg.destinationAddress
+        except ValueError:
+            return None
+        if destinationAddress in self.modules:
+            self.modules[destinationAddress].executeCommand(canMsg, self.now)
+            self.commandsExecuted += 1
+        return None
+
+    def executeCanStr(self, canStr : CanStr)->None:
+        self.executeCanMsg(can_frame.from_canStr(canStr))
+        return None
+
+
+    # SCENARIO ACTIONS
+    def insertBattery(self, slotAddress : MODULE_ADDRESS, soc : float = 50)->None:
+        self.slots[slotAddress].battery = EmulatedBattery(soc, seed=self.seed + slotAddress.value)
+        return None
+
+    def removeBattery(self, slotAddress : MODULE_ADDRESS)->None:
+        self.slots[slotAddress].battery = None
+        return None
+
+    def setBmsCanBusFailure(self, slotAddress : MODULE_ADDRESS, hasCanBusFailure : bool = True)->None:
+        self.slots[slotAddress].battery.hasCanBusFailure = hasCanBusFailure
+        return None
+
+    def setBatteryTemperatureOffset(self, slotAddress : MODULE_ADDRESS, temperatureOffset : float)->None:
+        self.slots[slotAddress].battery.temperatureOffset = temperatureOffset
+        return None
+
+    def setBatteryWarnings(self, slotAddress : MODULE_ADDRESS, warnings : List[BATTERY_WARNINGS])->None:
+        self.slots[slotAddress].battery.forcedWarnings = set(warnings)
+        return None
+
+    def loadScenario(self, name : str)->None:
+        SCENARIOS[name](self)
+        return None
+
+
+#%%                   DEFINITION OF SCENARIOS
+
+# Each scenario schedules its events relative to the moment it is loaded. Times are given in [ms].
+
+def scenario_full_station(emulator : StationEmulator)->None:
+    for i, slotAddress in enumerate(emulator.slots):
+        emulator.insertBattery(slotAddress, soc = 20 + 70*i/max(1, len(emulator.slots)-1))
+    return None
+
+def scenario_battery_insertion(emulator : StationEmulator)->None:
+    for i, slotAddress in enumerate(emulator.slots):
+        emulator.schedule(2000 + 3000*i, emulator.insertBattery, slotAddress, 30)
+    return None
+
+def scenario_battery_removal(emulator : StationEmulator)->None:
+    scenario_full_station(emulator)
+    for i, slotAddress in enumerate(emulator.slots):
+        emulator.schedule(5000 + 3000*i, emulator.removeBattery, slotAddress)
+    return None
+
+def scenario_bms_can_bus_error(emulator : StationEmulator)->None:
+    scenario_full_station(emulator)
+    slotAddress = next(iter(emulator.slots))
+    emulator.schedule(5000,  emulator.setBmsCanBusFailure, slotAddress, True)
+    emulator.schedule(30000, emulator.setBmsCanBusFailure, slotAddress, False)
+    return None
+
+def scenario_overheating(emulator : StationEmulator)->None:
+    scenario_full_station(emulator)
+    slotAddress = next(iter(emulator.slots))
+    emulator.schedule(5000,   emulator.setBatteryTemperatureOffset, slotAddress, 45)
+    emulator.schedule(300000, emulator.setBatteryTemperatureOffset, slotAddress, 0)
+    return None
+
+SCENARIOS : Dict[str, Callable[[StationEmulator], None]] = {
+    "FULL_STATION"      : scenario_full_station,
+    "BATTERY_INSERTION" : scenario_battery_insertion,
+    "BATTERY_REMOVAL"   : scenario_battery_removal,
+    "BMS_CAN_BUS_ERROR" : scenario_bms_can_bus_error,
+    "OVERHEATING"       : scenario_overheating,
+}
+
+
+#%%                   DEFINITION OF TRANSPORTS
+
+class EmulatedSerialBridge:
+    """
+    Mirrors serial_coms_interface_module.ino on the master side of a pty: frames addressed to the
+    control center are written as CAN strings (or as COBS binary frames once "#BIN" has been
+    requested) and commands read from the pty are put on the emulated network. AsyncSerialBridgeTransport
+    must be pointed at 'port'. Unlike the real link, the pty is not limited to 115200 baud; frames
+    that don't fit in the pty's buffer are dropped (and counted), like a full UART TX buffer would.
+    Binary mode is advertised every BIN_MODE_ADVERTISEMENT_PERIOD until anything is read from the pty.
+    """
+    COBS_FRAME_MAXLEN = 14
+    BIN_MODE_ADVERTISEMENT_PERIOD = 1.0 #[s]
+
+    def __init__(self):
+        self.masterFd, self.slaveFd = pty.openpty()
+        tty.setraw(self.slaveFd)
+        os.set_blocking(self.masterFd, False)
+        self.port = os.ttyname(self.slaveFd)
+        self.binaryMode = False
+        self.hostHasSpoken = False
+        self.binModeAdvertisementTime = None
+        self.rxBuffer = bytearray()
+        self.framesDropped = 0
+        return None
+
+    def fileno(self)->int:
+        return self.masterFd
+
+    def close(self)->None:
+        os.close(self.masterFd)
+        os.close(self.slaveFd)
+        return None
+
+    def advertiseBinaryMode(self)->None:
+        if self.binaryMode or self.hostHasSpoken:
+            return None
+        now = time.monotonic()
+        if self.binModeAdvertisementTime is None or now - self.binModeAdvertisementTime >= self.BIN_MODE_ADVERTISEMENT_PERIOD:
+            self.binModeAdvertisementTime = now
+            try:
+                os.write(self.masterFd, BIN_MODE_ADVERTISEMENT + b"\n")
+            except BlockingIOError:
+                pass
+        return None
+
+    def write(self, canMsgs : List[can_frame])->None:
+        self.advertiseBinaryMode()
+        for canMsg in canMsgs:
+            if canMsg.destinationAddress != MODULE_ADDRESS.CONTROL_CENTER:
+                continue
+            packet = canMsg.to_binFrame() if self.binaryMode else canMsg.to_canStr().encode("utf-8")
+            try:
+                os.write(self.masterFd, packet)
+            except BlockingIOError:
+                self.framesDropped += 1
+        return None
+
+    def read(self)->List[can_frame]:
+        try:
+            data = os.read(self.masterFd, 4096)
+        except (BlockingIOError, OSError):
+            return []
+        self.hostHasSpoken = self.hostHasSpoken or len(data) > 0
+        self.rxBuffer += data
+        return self.readBinaryMode() if self.binaryMode else self.readAsciiMode()
+
+    def readAsciiMode(self)->List[can_frame]:
+        res = []
+        while b"\n" in self.rxBuffer and not self.binaryMode:
+            line, _, self.rxBuffer = self.rxBuffer.partition(b"\n")
+            if line == b"#BIN":
+                os.write(self.masterFd, BIN_MODE_ACK + b"\n")
+                self.binaryMode = True
+                continue
+            try:
+                res.append(can_frame.from_canStr(line.decode("utf-8")))
+            except (ValueError, UnicodeDecodeError):
+                pass
+        if self.binaryMode:
+            res.extend(self.readBinaryMode())
+        return res
+
+    def readBinaryMode(self)->List[can_frame]:
+        # A re-sent "#BIN" request is acknowledged again, framed by delimiters, as the firmware does: only
+        # at a frame boundary (i.e, right after a delimiter), never within a frame.
+        res = []
+        while True:
+            if self.rxBuffer.startswith(BIN_MODE_REQUEST):
+                self.rxBuffer = self.rxBuffer[len(BIN_MODE_REQUEST):]
+                os.write(self.masterFd, BIN_FRAME_DELIMITER + BIN_MODE_ACK + b"\n" + BIN_FRAME_DELIMITER)
+                continue
+            if BIN_FRAME_DELIMITER not in self.rxBuffer:
+                break
+            packet, _, self.rxBuffer = self.rxBuffer.partition(BIN_FRAME_DELIMITER)
+            if not packet or len(packet) > self.COBS_FRAME_MAXLEN:
+                continue
+            try:
+                res.append(can_frame.from_binFrame(bytes(packet)))
+            except ValueError:
+                pass
+        return res
+
+
+class EmulatedStationServer:
+    """
+    Runs a StationEmulator against the wall clock and serves it through 'numBridges' pty bridges.
+    Every bridge sees the whole network, just like several serial bridges on the same CAN bus would.
+    """
+    TICK_PERIOD = 0.005 #[s]
+
+    def __init__(self, emulator : StationEmulator, numBridges : int = 1):
+        self.emulator = emulator
+        self.bridges = [EmulatedSerialBridge() for _ in range(numBridges)]
+        self.keepRunning = True
+        return None
+
+    @property
+    def ports(self)->List[str]:
+        return [bridge.port for bridge in self.bridges]
+
+    def endRun(self)->None:
+        self.keepRunning = False
+        return None
+
+    def run(self, duration : float = float("inf"))->None:
+        start = time.monotonic()
+        self.emulator.now = 0
+        while self.keepRunning and time.monotonic() - start < duration:
+            canMsgs = self.emulator.step(1000*(time.monotonic() - start))
+            for bridge in self.bridges:
+                bridge.write(canMsgs)
+
+            readable, _, _ = select.select(self.bridges, [], [], self.TICK_PERIOD)
+            for bridge in readable:
+                for canMsg in bridge.read():
+                    self.emulator.executeCanMsg(canMsg)
+
+        for bridge in self.bridges:
+            bridge.close()
+        return None
+
+
+#%%                    EXAMPLES
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Emulated station served through pty serial bridges.")
+    parser.add_argument("--slots", type=int, nargs="+", default=[1,4,5,8], help="Slot addresses (1..8).")
+    parser.add_argument("--bridges", type=int, default=1, help="Number of pty serial bridges.")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="FULL_STATION")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Speed-up of the battery model.")
+    parser.add_argument("--duration", type=float, default=float("inf"), help="Run time [s].")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    emulator = StationEmulator([MODULE_ADDRESS(i) for i in args.slots], args.time_scale, args.seed)
+    emulator.loadScenario(args.scenario)
+    server = EmulatedStationServer(emulator, args.bridges)
+    for port in server.ports:
+        print(f"SERIAL BRIDGE: {port}")
+
+    try:
+        server.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    print(f"FRAMES SENT: {emulator.framesSent}, COMMANDS EXECUTED: {emulator.commandsExecuted}")
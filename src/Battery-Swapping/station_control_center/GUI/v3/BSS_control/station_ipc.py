@@ -0,0 +1,143 @@
+"""
+Protocol between the station daemon (see station_daemon.py) and its clients (e.g, the GUI), over a
+local (unix) stream socket. Every message is one line of JSON:
+
+    client -> daemon : {"id" : int, "method" : str, "params" : list}  (without "id", no reply is sent)
+    daemon -> client : {"id" : int, "result" : ...} or {"id" : int, "error" : str}
+    daemon -> client : {"event" : str, "params" : list}              (to the clients that subscribed)
+
+Enums, sets and arrays are tagged so that they come back as what they were (see toJsonable).
+"""
+import json
+import numpy as np
+from enum import Enum
+from array import array
+from typing import List
+from BSS_control.battery import BATTERY_WARNINGS
+from BSS_control.battery_slot import SOLENOID_NAME, LED_STRIP_STATE
+from BSS_control.eight_channel_relay import CHANNEL_NAME
+from BSS_control.charge_sequencer import CHARGE_SEQUENCE_STATE
+from BSS_control.control_center import ControlCenter
+from BSS_control.slot_state_index import SlotStateIndex, SlotStatesQuery
+from BSS_control.CanUtils import MODULE_ADDRESS
+
+
+
+DEFAULT_SOCKET_PATH = "/tmp/bss_control.sock"
+
+ENUMS = {enum.__name__ : enum for enum in (MODULE_ADDRESS, SOLENOID_NAME, LED_STRIP_STATE, CHANNEL_NAME, BATTERY_WARNINGS, CHARGE_SEQUENCE_STATE)}
+
+# States copied into every snapshot (those of STATES_TO_MATCH_LOGIC are added, so that clients can run the same queries).
+SNAPSHOT_SLOT_ATTRIBUTES = tuple(dict.fromkeys((
+    "limitSwitchState", "ledStripState", "bmsSolenoidState", "doorLockSolenoidState", "batteryLockSolenoidState",
+    "batteryCanBusErrorState", "solenoidsStates", "currentGlobalTime",
+    *(attrName for isSlotAttr, attrName in ControlCenter.STATES_TO_MATCH_LOGIC.values() if isSlotAttr))))
+SNAPSHOT_BATTERY_ATTRIBUTES = tuple(dict.fromkeys((
+    "currentGlobalTime", "localTimer", "dataPacketsAreDamagedTimer",
+    "inSlot", "bmsON", "waitingForAllData", "bmsHasCanBusError", "isAddressable",
+    "isDamaged", "hasWarnings", "hasFatalWarnings", "hasCellImbalance", "dataPacketsAreDamaged", "warnings", "fatalWarnings",
+    "voltage", "current", "soc", "minCellVoltage", "maxCellVoltage", "cellVoltageDelta", "maxTemp",
+    "isCharging", "isChargedEnough", "canProceedToBeCharged", "timeUntilFullCharge", "timeUntilFullChargeInStrFormat",
+    "isDeliverableToUser", "proccessToStartChargeIsActive", "proccessToFinishChargeIsActive", "isBusyWithChargeProcess", "relayChanneOn",
+    *(attrName for isSlotAttr, attrName in ControlCenter.STATES_TO_MATCH_LOGIC.values() if not isSlotAttr))))
+SNAPSHOT_RELAY_ATTRIBUTES = ("channelsStates", "currentGlobalTime")
+
+
+def toJsonable(value):
+    if isinstance(value, Enum):
+        return {"__enum__" : type(value).__name__, "name" : value.name}
+    elif isinstance(value, (set, frozenset)):
+        return {"__set__" : [toJsonable(item) for item in value]}
+    elif isinstance(value, (list, tuple, array)):
+        return [toJsonable(item) for item in value]
+    elif isinstance(value, dict):
+        return {key : toJsonable(item) for key, item in value.items()}
+    elif isinstance(value, np.ndarray):
+        return value.tolist()
+    elif isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def fromJsonable(value):
+    if isinstance(value, list):
+        return [fromJsonable(item) for item in value]
+    elif isinstance(value, dict):
+        if "__enum__" in value:
+            return ENUMS[value["__enum__"]][value["name"]]
+        elif "__set__" in value:
+            return {fromJsonable(item) for item in value["__set__"]}
+        return {key : fromJsonable(item) for key, item in value.items()}
+    return value
+
+def encodeMessage(message : dict)->bytes:
+    # (nan is kept as the NaN token, which the json module reads back.)
+    return json.dumps(toJsonable(message), separators=(",", ":")).encode("utf-8") + b"\n"
+
+def decodeMessage(line : bytes)->dict:
+    return fromJsonable(json.loads(line))
+
+
+def getStationSnapshot(controlCenter : ControlCenter)->dict:
+    modules = []
+    for slotAddress in controlCenter.SLOT_ADDRESSES:
+        slot = controlCenter.modules[slotAddress]
+        modules.append([slotAddress,
+                        {attrName : getattr(slot, attrName) for attrName in SNAPSHOT_SLOT_ATTRIBUTES},
+                        {attrName : getattr(slot.battery, attrName) for attrName in SNAPSHOT_BATTERY_ATTRIBUTES}])
+    relay = controlCenter.modules[controlCenter.EIGHT_CHANNEL_RELAY_ADDRESS]
+    modules.append([controlCenter.EIGHT_CHANNEL_RELAY_ADDRESS, {attrName : getattr(relay, attrName) for attrName in SNAPSHOT_RELAY_ATTRIBUTES}, None])
+    return {"currentGlobalTime" : controlCenter.currentGlobalTime, "modules" : modules}
+
+
+class ModuleMirror:
+    """
+    Read-only copy of the states of a module (or battery) as of the latest snapshot. Its generation is
+    bumped on every update, so that a SlotStateIndex can run over mirrors as it does over the modules.
+    """
+    def __init__(self, attrNames : tuple):
+        self.__dict__.update(dict.fromkeys(attrNames, np.nan))
+        self.generation = 0
+        self.battery = None
+        return None
+
+    def update(self, states : dict)->None:
+        self.__dict__.update(states)
+        self.generation += 1
+        return None
+
+
+class StationMirror:
+    """
+    The ControlCenter as seen by a client of the daemon: the same addresses, 'modules' (with their
+    'battery') holding the states of the latest snapshot, and the same state queries.
+    """
+    SLOT_ADDRESSES = ControlCenter.SLOT_ADDRESSES
+    EIGHT_CHANNEL_RELAY_ADDRESS = ControlCenter.EIGHT_CHANNEL_RELAY_ADDRESS
+
+    def __init__(self):
+        self.modules = {slotAddress : ModuleMirror(SNAPSHOT_SLOT_ATTRIBUTES) for slotAddress in self.SLOT_ADDRESSES}
+        for slotAddress in self.SLOT_ADDRESSES:
+            self.modules[slotAddress].battery = ModuleMirror(SNAPSHOT_BATTERY_ATTRIBUTES)
+        self.modules[self.EIGHT_CHANNEL_RELAY_ADDRESS] = ModuleMirror(SNAPSHOT_RELAY_ATTRIBUTES)
+        self.stateIndex = SlotStateIndex(self.modules, self.SLOT_ADDRESSES, ControlCenter.STATES_TO_MATCH_LOGIC)
+        self.currentGlobalTime = 0
+        self.numSnapshots = 0
+        return None
+
+    def applySnapshot(self, snapshot : dict)->None:
+        self.currentGlobalTime = snapshot["currentGlobalTime"]
+        for address, states, batteryStates in snapshot["modules"]:
+            if address in self.modules:
+                self.modules[address].update(states)
+                if batteryStates is not None:
+                    self.modules[address].battery.update(batteryStates)
+        self.numSnapshots += 1
+        return None
+
+    def getSlotsThatMatchStates(self, statesToMatch : dict | SlotStatesQuery)->List[MODULE_ADDRESS]:
+        if not isinstance(statesToMatch, SlotStatesQuery):
+            statesToMatch = SlotStatesQuery.compile(statesToMatch, ControlCenter.STATES_TO_MATCH_LOGIC)
+        return self.stateIndex.match(statesToMatch)
+
+    def getDeliverableSlots(self)->List[MODULE_ADDRESS]:
+        return self.getSlotsThatMatchStates(ControlCenter.DELIVERABLE_SLOTS_QUERY)
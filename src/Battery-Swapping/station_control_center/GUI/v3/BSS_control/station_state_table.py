@@ -0,0 +1,418 @@
+import time
+import numpy as np
+from collections import deque
+from typing import List, Tuple, Iterable, Callable
+from BSS_control.CanUtils import MODULE_ADDRESS
+
+
+
+class ColumnGroup:
+    """
+    Fields that are always appended together (i.e, that come from the same CAN frame), stored as
+    one array shaped [field, row, window] and used as a ring buffer along the last axis. Every row
+    has its own cursor, number of valid samples and validity mask. The sums and the number of
+    negative values of every [field, row] window are kept up to date on append, so means can be
+    read in O(1) (or for all rows at once). So are the minimum and maximum of every window, through
+    monotonic queues of candidates per [field, row] (i.e, amortized O(1) appends).
+
+    The receive time (from 'clock') of the latest sample of every row is kept as well. A field whose
+    latest sample is older than its deadline in 'staleAfter' [s] is stale, and its means (and minimums
+    and maximums) read nan.
+    """
+    def __init__(self, fields : List[str], numRows : int, window : int, staleAfter : float = np.inf,
+                 clock : Callable[[], float] = time.monotonic):
+        self.fields = fields
+        self.fieldIndices = {field : i for i, field in enumerate(fields)}
+        self.window = window
+        self.values = np.zeros((len(fields), numRows, window))
+        self.valid = np.zeros((numRows, window), dtype=bool)
+        self.cursors = np.zeros(numRows, dtype=np.intp)
+        self.counts = np.zeros(numRows, dtype=np.intp)
+        self.sums = np.zeros((len(fields), numRows))
+        self.numNegatives = np.zeros((len(fields), numRows), dtype=np.intp)
+        self.numAppended = [0]*numRows
+        self.minCandidates = [[deque() for _ in range(numRows)] for _ in fields] # (sequence number, value), with increasing values.
+        self.maxCandidates = [[deque() for _ in range(numRows)] for _ in fields] # (sequence number, value), with decreasing values.
+        self.lastReceived = np.full(numRows, np.nan)
+        self.staleAfter = np.full(len(fields), staleAfter, dtype=float)
+        self.clock = clock
+        return None
+
+    def append(self, row : int, values : Tuple[float, ...])->None:
+        cursor = self.cursors[row]
+        values = np.asarray(values, dtype=float)
+        self.lastReceived[row] = self.clock()
+
+        if self.valid[row, cursor]:
+            oldValues = self.values[:, row, cursor]
+            self.sums[:, row] -= oldValues
+            self.numNegatives[:, row] -= oldValues < 0
+        else:
+            self.valid[row, cursor] = True
+            self.counts[row] += 1
+
+        self.values[:, row, cursor] = values
+        self.sums[:, row] += values
+        self.numNegatives[:, row] += values < 0
+        self.updateMinMaxCandidates(row, values.tolist())
+
+        cursor += 1
+        if cursor == self.window:
+            # The running sums are recomputed once per lap so that float rounding errors can't pile up.
+            self.sums[:, row] = self.values[:, row, :].sum(axis=1)
+            cursor = 0
+        self.cursors[row] = cursor
+        return None
+
+    def updateMinMaxCandidates(self, row : int, values : List[float])->None:
+        sequence = self.numAppended[row]
+        self.numAppended[row] = sequence + 1
+        oldestSequence = sequence + 1 - self.counts.item(row)
+        for field, value in enumerate(values):
+            minCandidates, maxCandidates = self.minCandidates[field][row], self.maxCandidates[field][row]
+            while minCandidates and minCandidates[-1][1] >= value:
+                minCandidates.pop()
+            while maxCandidates and maxCandidates[-1][1] <= value:
+                maxCandidates.pop()
+            minCandidates.append((sequence, value))
+            maxCandidates.append((sequence, value))
+            if minCandidates[0][0] < oldestSequence:
+                minCandidates.popleft()
+            if maxCandidates[0][0] < oldestSequence:
+                maxCandidates.popleft()
+        return None
+
+    def clearRow(self, row : int)->None:
+        self.valid[row] = False
+        self.cursors[row] = 0
+        self.counts[row] = 0
+        self.sums[:, row] = 0
+        self.numNegatives[:, row] = 0
+        self.numAppended[row] = 0
+        for field in range(len(self.fields)):
+            self.minCandidates[field][row].clear()
+            self.maxCandidates[field][row].clear()
+        self.lastReceived[row] = np.nan
+        return None
+
+    def getFresh(self, field : str)->np.ndarray:
+        # Rows that never received a sample aren't fresh (nan comparisons are False).
+        return self.clock() - self.lastReceived <= self.staleAfter[self.fieldIndices[field]]
+
+    def getMeans(self, field : str)->np.ndarray:
+        means = np.full(len(self.counts), np.nan)
+        return np.divide(self.sums[self.fieldIndices[field]], self.counts, out=means, where=(self.counts > 0) & self.getFresh(field))
+
+    def getMins(self, field : str)->np.ndarray:
+        return self.getExtrema(self.minCandidates[self.fieldIndices[field]], field)
+
+    def getMaxs(self, field : str)->np.ndarray:
+        return self.getExtrema(self.maxCandidates[self.fieldIndices[field]], field)
+
+    def getExtrema(self, candidates : List[deque], field : str)->np.ndarray:
+        # The oldest candidate of every row is its extremum (rows without samples have none).
+        extrema = np.array([rowCandidates[0][1] if rowCandidates else np.nan for rowCandidates in candidates])
+        return np.where(self.getFresh(field), extrema, np.nan)
+
+
+class CellVoltageGroup:
+    """
+    Cell voltages of every row, preallocated as an array shaped [row, cell, window] in [mV]. The BMS
+    sends 4 cells per frame (BATTERY_DATA_2..8 carry cells 1..28 and BATTERY_DATA_9 cells 29..30), so
+    every frame has its own cursor, number of samples and receive time per row. Writing a frame only
+    assigns into the preallocated arrays and updates the running sums of its cells. Cells that read
+    0 [mV] aren't fitted in the pack and are left out of the statistics, and so are rows with any
+    frame older than 'staleAfter' [s].
+    """
+    MAX_NUM_CELLS = 30
+    CELLS_PER_FRAME = 4
+
+    def __init__(self, numRows : int, window : int, staleAfter : float = np.inf, clock : Callable[[], float] = time.monotonic):
+        numFrames = -(-self.MAX_NUM_CELLS // self.CELLS_PER_FRAME)
+        self.window = window
+        self.values = np.zeros((numRows, self.MAX_NUM_CELLS, window), dtype=np.uint16)
+        self.sums = np.zeros((numRows, self.MAX_NUM_CELLS))
+        self.cursors = np.zeros((numRows, numFrames), dtype=np.intp)
+        self.counts = np.zeros((numRows, numFrames), dtype=np.intp)
+        self.lastReceived = np.full((numRows, numFrames), np.nan)
+        self.staleAfter = staleAfter
+        self.clock = clock
+        return None
+
+    def write(self, row : int, frameIndex : int, data)->None:
+        values, sums = self.values, self.sums
+        firstCell = self.CELLS_PER_FRAME*frameIndex
+        cursor = self.cursors.item(row, frameIndex)
+        for cell in range(firstCell, min(firstCell + self.CELLS_PER_FRAME, self.MAX_NUM_CELLS)):
+            i = 2*(cell - firstCell)
+            value = data[i] | (data[i+1] << 8)
+            sums[row, cell] += value - values.item(row, cell, cursor) # Samples never written read 0.
+            values[row, cell, cursor] = value
+
+        self.lastReceived[row, frameIndex] = self.clock()
+        self.cursors[row, frameIndex] = (cursor + 1) % self.window
+        if self.counts.item(row, frameIndex) < self.window:
+            self.counts[row, frameIndex] += 1
+        return None
+
+    def clearRow(self, row : int)->None:
+        self.values[row] = 0
+        self.sums[row] = 0
+        self.cursors[row] = 0
+        self.counts[row] = 0
+        self.lastReceived[row] = np.nan
+        return None
+
+    def getFresh(self)->np.ndarray:
+        # Rows whose oldest received frame is within the deadline (rows without any frame aren't fresh).
+        return self.clock() - np.fmin.reduce(self.lastReceived, axis=-1) <= self.staleAfter
+
+    def isRowFresh(self, row : int)->bool:
+        received = [lastReceived for lastReceived in self.lastReceived[row].tolist() if lastReceived == lastReceived]
+        return bool(received) and self.clock() - min(received) <= self.staleAfter
+
+    def getCellMeans(self, row : int | None = None)->np.ndarray:
+        """
+        Mean voltage [V] of every cell over its window, shaped [row, cell] (or [cell] for a single row).
+        Cells without samples or that aren't fitted are nan.
+        """
+        sums = self.sums if row is None else self.sums[row]
+        counts = self.counts if row is None else self.counts[row]
+        counts = np.repeat(counts, self.CELLS_PER_FRAME, axis=-1)[..., :self.MAX_NUM_CELLS]
+        means = np.full(sums.shape, np.nan)
+        return np.divide(0.001*sums, counts, out=means, where=(counts > 0) & (sums > 0))
+
+    def getStats(self)->dict:
+        """
+        Min, max, delta (i.e, imbalance) and mean [V] of the cell voltages of every row, vectorized
+        over rows and cells. All of them are nan for rows without (fresh) cell data.
+        """
+        means = np.where(self.getFresh()[:, None], self.getCellMeans(), np.nan)
+        isFitted = ~np.isnan(means)
+        numFitted = isFitted.sum(axis=-1)
+        minVoltages = np.fmin.reduce(means, axis=-1)
+        maxVoltages = np.fmax.reduce(means, axis=-1)
+        meanVoltages = np.divide(np.where(isFitted, means, 0).sum(axis=-1), numFitted, 
+                                 out=np.full(numFitted.shape, np.nan), where=numFitted > 0)
+        return {"min" : minVoltages, "max" : maxVoltages, "delta" : maxVoltages - minVoltages, "mean" : meanVoltages}
+
+    def getRowStats(self, row : int)->dict:
+        # Same as 'getStats' for a single row, without numpy's per-call overhead (it's read once per generation).
+        if not self.isRowFresh(row):
+            return {"min" : np.nan, "max" : np.nan, "delta" : np.nan, "mean" : np.nan}
+        counts = self.counts[row].tolist()
+        means = [0.001*cellSum/counts[cell // self.CELLS_PER_FRAME] for cell, cellSum in enumerate(self.sums[row].tolist()) 
+                 if cellSum > 0 and counts[cell // self.CELLS_PER_FRAME] > 0]
+        if not means:
+            return {"min" : np.nan, "max" : np.nan, "delta" : np.nan, "mean" : np.nan}
+        minVoltage, maxVoltage = min(means), max(means)
+        return {"min" : minVoltage, "max" : maxVoltage, "delta" : maxVoltage - minVoltage, "mean" : sum(means)/len(means)}
+
+
+class StationStateRowView:
+    """
+    One field of one row of a ColumnGroup, i.e, what used to be a deque in a Battery/BatterySlot.
+    'mean', 'min' and 'max' read nan once the field is stale, while iterating goes through all the
+    samples in the window.
+    """
+    __slots__ = ("group", "fieldIndex", "row")
+
+    def __init__(self, group : ColumnGroup, field : str, row : int):
+        self.group = group
+        self.fieldIndex = group.fieldIndices[field]
+        self.row = row
+        return None
+
+    @property
+    def mean(self)->float:
+        group, row = self.group, self.row
+        count = group.counts.item(row)
+        if not count or group.clock() - group.lastReceived.item(row) > group.staleAfter.item(self.fieldIndex):
+            return np.nan
+        return group.sums.item(self.fieldIndex, row)/count
+
+    @property
+    def min(self)->float:
+        candidates = self.group.minCandidates[self.fieldIndex][self.row]
+        return candidates[0][1] if candidates and self.isFresh else np.nan
+
+    @property
+    def max(self)->float:
+        candidates = self.group.maxCandidates[self.fieldIndex][self.row]
+        return candidates[0][1] if candidates and self.isFresh else np.nan
+
+    @property
+    def lastReceived(self)->float:
+        return self.group.lastReceived.item(self.row)
+
+    @property
+    def age(self)->float:
+        # Time [s] since the latest sample was received (nan if there's none).
+        return self.group.clock() - self.group.lastReceived.item(self.row)
+
+    @property
+    def isFresh(self)->bool:
+        return self.age <= self.group.staleAfter.item(self.fieldIndex)
+
+    @property
+    def last(self)->float:
+        group, row = self.group, self.row
+        if not group.counts.item(row):
+            return np.nan
+        return group.values.item(self.fieldIndex, row, group.cursors.item(row) - 1) # (-1 wraps to the end of the window.)
+
+    @property
+    def hasNegatives(self)->bool:
+        return self.group.numNegatives.item(self.fieldIndex, self.row) > 0
+
+    def __len__(self)->int:
+        return self.group.counts.item(self.row)
+
+    def __iter__(self):
+        group, row = self.group, self.row
+        count, cursor = group.counts[row], group.cursors[row]
+        start = (cursor - count) % group.window
+        return (float(group.values[self.fieldIndex, row, (start + i) % group.window]) for i in range(count))
+
+    def __repr__(self)->str:
+        return f"{self.group.fields[self.fieldIndex]}{list(self)}"
+
+
+class StateVectorField:
+    """
+    Descriptor that stores a scalar attribute of a Battery/BatterySlot in one of the station table's
+    state vectors (one value per row), so that it keeps being read and written like a plain attribute.
+    'kind' restores the attribute's type on read (nan is always returned as nan).
+    """
+    def __init__(self, kind : type = float):
+        self.kind = kind
+        return None
+
+    def __set_name__(self, owner, name : str)->None:
+        self.name = name
+        return None
+
+    def __get__(self, obj, objtype = None):
+        if obj is None:
+            return self
+        value = obj.stateTable.stateVectors[self.name].item(obj.row)
+        return value if value != value else self.kind(value) # (value != value) <=> isnan(value)
+
+    def __set__(self, obj, value)->None:
+        obj.stateTable.getStateVector(self.name)[obj.row] = value
+        return None
+
+
+class StationStateTable:
+    """
+    Station-wide columnar store of the states of all slots (one row per slot address). Battery and
+    BatterySlot objects are thin views over their row, and station-wide questions can be answered
+    with a few vectorized operations over the columns instead of walking the slots one by one.
+
+    Column groups:
+        - BATTERY_DATA_0  : voltage, current, soc.
+        - BATTERY_DATA_9  : NTC1..NTC4.
+        - BATTERY_DATA_10 : NTC5, NTC6, MOSFET.
+        - PERIPHERALS     : limit switch, LED strip, solenoids and battery CAN-bus error.
+
+    Cell voltages (BATTERY_DATA_2..9) are kept apart, in 'cellVoltages' (see CellVoltageGroup).
+
+    Every sample is stamped with its receive time from 'clock' (time.monotonic by default), and every
+    field goes stale (i.e, its means read nan) STALENESS_DEADLINES[group] seconds after its latest
+    sample, unless its deadline is changed with setStalenessDeadline.
+
+    State vectors hold the scalar attributes declared as StateVectorFields by the views.
+    """
+    TEMPERATURE_FIELDS = ["NTC1", "NTC2", "NTC3", "NTC4", "NTC5", "NTC6", "MOSFET"]
+    BATTERY_COLUMN_GROUPS = {
+        "BATTERY_DATA_0"  : ["voltage", "current", "soc"],
+        "BATTERY_DATA_9"  : ["NTC1", "NTC2", "NTC3", "NTC4"],
+        "BATTERY_DATA_10" : ["NTC5", "NTC6", "MOSFET"],
+    }
+    SLOT_COLUMN_GROUPS = {
+        "PERIPHERALS" : ["limitSwitchState", "ledStripState", "bmsSolenoidState", "doorLockSolenoidState",
+                         "batteryLockSolenoidState", "batteryCanBusErrorState"],
+    }
+    # The modules send every group each 50..100 ms, so a deadline is worth 10..20 lost frames in a row.
+    STALENESS_DEADLINES = {
+        "BATTERY_DATA_0"  : 2.0, #[s]
+        "BATTERY_DATA_9"  : 2.0, #[s]
+        "BATTERY_DATA_10" : 2.0, #[s]
+        "CELL_VOLTAGES"   : 2.0, #[s]
+        "PERIPHERALS"     : 1.0, #[s]
+    }
+
+    def __init__(self, slotAddresses : Iterable[MODULE_ADDRESS], batteryWindow : int = 10, slotWindow : int = 5,
+                 clock : Callable[[], float] = time.monotonic):
+        self.slotAddresses = list(slotAddresses)
+        self.rows = {address : row for row, address in enumerate(self.slotAddresses)}
+        self.numRows = len(self.slotAddresses)
+        self.clock = clock
+
+        deadlines = self.STALENESS_DEADLINES
+        self.groups = {name : ColumnGroup(fields, self.numRows, batteryWindow, deadlines[name], clock) for name, fields in self.BATTERY_COLUMN_GROUPS.items()}
+        self.groups.update({name : ColumnGroup(fields, self.numRows, slotWindow, deadlines[name], clock) for name, fields in self.SLOT_COLUMN_GROUPS.items()})
+        self.fieldGroups = {field : group for group in self.groups.values() for field in group.fields}
+        self.cellVoltages = CellVoltageGroup(self.numRows, batteryWindow, deadlines["CELL_VOLTAGES"], clock)
+        self.stateVectors = {}
+        self.batteries = [None]*self.numRows # The Battery viewing each row (set by Battery itself).
+        return None
+
+    def getRowView(self, field : str, row : int)->StationStateRowView:
+        return StationStateRowView(self.fieldGroups[field], field, row)
+
+    def getStateVector(self, name : str, initialValue : float = np.nan)->np.ndarray:
+        # State vectors are created on first write, by the views that declare them.
+        if name not in self.stateVectors:
+            self.stateVectors[name] = np.full(self.numRows, initialValue, dtype=float)
+        return self.stateVectors[name]
+
+    def append(self, groupName : str, row : int, values : Tuple[float, ...])->None:
+        self.groups[groupName].append(row, values)
+        return None
+
+    def clearRow(self, row : int, groupNames : Iterable[str])->None:
+        for groupName in groupNames:
+            self.groups[groupName].clearRow(row)
+        return None
+
+    def setStalenessDeadline(self, field : str, deadline : float)->None:
+        # Per field, for the column groups' fields ("CELL_VOLTAGES" sets the deadline of the cell voltages).
+        if field == "CELL_VOLTAGES":
+            self.cellVoltages.staleAfter = deadline
+        else:
+            group = self.fieldGroups[field]
+            group.staleAfter[group.fieldIndices[field]] = deadline
+        return None
+
+
+    # STATION-WIDE QUERIES
+    def getMeans(self, field : str)->np.ndarray:
+        return self.fieldGroups[field].getMeans(field)
+
+    def getMins(self, field : str)->np.ndarray:
+        return self.fieldGroups[field].getMins(field)
+
+    def getMaxs(self, field : str)->np.ndarray:
+        return self.fieldGroups[field].getMaxs(field)
+
+    def getFreshStates(self, field : str)->np.ndarray:
+        return self.fieldGroups[field].getFresh(field)
+
+    def getHasNegatives(self, field : str)->np.ndarray:
+        group = self.fieldGroups[field]
+        return group.numNegatives[group.fieldIndices[field]] > 0
+
+    def getMaxTemperatures(self)->np.ndarray:
+        # 'fmax' ignores nan unless every temperature of the row is nan (i.e, there's no battery data yet).
+        return np.fmax.reduce([self.getMeans(field) for field in self.TEMPERATURE_FIELDS])
+
+    def getLastTemperatures(self, row : int)->List[float]:
+        # Latest sample of every TEMPERATURE_FIELDS field (nan if there's none yet).
+        return [self.getRowView(field, row).last for field in self.TEMPERATURE_FIELDS]
+
+    def getStationMaxTemperature(self)->float:
+        return float(np.fmax.reduce(self.getMaxTemperatures()))
+
+    def getSlotsFromMask(self, mask : np.ndarray)->List[MODULE_ADDRESS]:
+        return [self.slotAddresses[row] for row in np.flatnonzero(mask)]
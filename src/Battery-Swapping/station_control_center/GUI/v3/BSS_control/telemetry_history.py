@@ -0,0 +1,177 @@
+import os
+import warnings
+import numpy as np
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Iterable
+from BSS_control.CanUtils import MODULE_ADDRESS
+
+
+
+TELEMETRY_RECORD_DTYPE = np.dtype([
+    ("timestamp",    "<f8"),        #[s] (Since the epoch.)
+    ("voltage",      "<f4"),        #[V]
+    ("current",      "<f4"),        #[A]
+    ("soc",          "<f4"),        #[%]
+    ("temperatures", "<f4", (7,)),  #[°C] (NTC1..NTC6, MOSFET.)
+    ("warningsMask", "<u4"),        # (Bit i <=> BATTERY_WARNINGS(i).)
+])
+
+TELEMETRY_HEADER_DTYPE = np.dtype([
+    ("magic",      "S8"),
+    ("recordSize", "<u4"),
+    ("capacity",   "<u8"),
+    ("numWritten", "<u8"),
+])
+
+
+class TelemetryRing:
+    """
+    Fixed-capacity ring of telemetry records (see TELEMETRY_RECORD_DTYPE) stored in a memory-mapped
+    file: a small header followed by 'capacity' records. Records are written in place in the mapped
+    pages (the OS writes them back, so they survive a restart or a crash of the application), and
+    once the ring is full the oldest records are overwritten, which bounds the size of the file.
+
+    Timestamps are kept non-decreasing, so a time range is found by bisecting the ring in O(log n)
+    and only the records in that range are read from disk.
+    """
+    MAGIC = b"BSSTLM01"
+    HEADER_SIZE = 64 #[bytes]
+
+    def __init__(self, path : str, capacity : int | None):
+        # With capacity=None, the file must already exist (e.g, to read the history of a station).
+        self.path = path
+        if not self.openExisting(capacity):
+            if capacity is None:
+                raise ValueError(f"'{path}' isn't a valid telemetry ring file.")
+            if os.path.exists(path):
+                warnings.warn(f"WARNING: '{path}' isn't a valid telemetry ring file. It will be overwritten.")
+            self.create(capacity)
+        self.lastTimestamp = self.timestampAt(len(self)-1) if len(self) else -np.inf
+        return None
+
+    def create(self, capacity : int)->None:
+        with open(self.path, "wb") as file:
+            # The file is sparse: disk blocks are only allocated as records get written.
+            file.truncate(self.HEADER_SIZE + capacity*TELEMETRY_RECORD_DTYPE.itemsize)
+        self.mapFile(capacity)
+        self.header["magic"] = self.MAGIC
+        self.header["recordSize"] = TELEMETRY_RECORD_DTYPE.itemsize
+        self.header["capacity"] = capacity
+        self.header["numWritten"] = 0
+        return None
+
+    def openExisting(self, capacity : int | None)->bool:
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) < self.HEADER_SIZE:
+            return False
+
+        header = np.fromfile(self.path, dtype=TELEMETRY_HEADER_DTYPE, count=1)[0]
+        fileCapacity = int(header["capacity"])
+        expectedSize = self.HEADER_SIZE + fileCapacity*TELEMETRY_RECORD_DTYPE.itemsize
+        if header["magic"] != self.MAGIC or header["recordSize"] != TELEMETRY_RECORD_DTYPE.itemsize or os.path.getsize(self.path) != expectedSize:
+            return False
+
+        if capacity is not None and fileCapacity != capacity:
+            warnings.warn(f"WARNING: '{self.path}' holds {fileCapacity} records instead of {capacity}. Its capacity is kept.")
+        self.mapFile(fileCapacity)
+        return True
+
+    def mapFile(self, capacity : int)->None:
+        self.capacity = capacity
+        self.header = np.memmap(self.path, dtype=TELEMETRY_HEADER_DTYPE, mode="r+", shape=(1,))[0]
+        self.records = np.memmap(self.path, dtype=TELEMETRY_RECORD_DTYPE, mode="r+", offset=self.HEADER_SIZE, shape=(capacity,))
+        return None
+
+    def __len__(self)->int:
+        return min(int(self.header["numWritten"]), self.capacity)
+
+    def physicalIndex(self, logicalIndex : int)->int:
+        # Logical index 0 is the oldest record still in the ring.
+        numWritten = int(self.header["numWritten"])
+        start = numWritten % self.capacity if numWritten > self.capacity else 0
+        return (start + logicalIndex) % self.capacity
+
+    def timestampAt(self, logicalIndex : int)->float:
+        return self.records["timestamp"].item(self.physicalIndex(logicalIndex))
+
+    def append(self, timestamp : float, voltage : float, current : float, soc : float, temperatures : Iterable[float], warningsMask : int)->None:
+        # A clock that steps back (e.g, an NTP correction) mustn't break the ordering bisection relies on.
+        timestamp = max(timestamp, self.lastTimestamp)
+        numWritten = int(self.header["numWritten"])
+        self.records[numWritten % self.capacity] = (timestamp, voltage, current, soc, temperatures, warningsMask)
+        # The count is only bumped once the record is complete.
+        self.header["numWritten"] = numWritten + 1
+        self.lastTimestamp = timestamp
+        return None
+
+    def read(self, startTime : float = -np.inf, endTime : float = np.inf)->np.ndarray:
+        """
+        Records with startTime <= timestamp <= endTime, oldest first (copied out of the file).
+        """
+        timestamps = _RingTimestamps(self)
+        firstIndex = bisect_left(timestamps, startTime)
+        lastIndex = bisect_right(timestamps, endTime)
+        if lastIndex <= firstIndex:
+            return np.empty(0, dtype=TELEMETRY_RECORD_DTYPE)
+
+        first = self.physicalIndex(firstIndex)
+        last = self.physicalIndex(lastIndex - 1)
+        if first <= last:
+            return np.array(self.records[first:last+1])
+        return np.concatenate((self.records[first:], self.records[:last+1]))
+
+    def flush(self)->None:
+        self.records.flush()
+        return None
+
+
+class _RingTimestamps:
+    # Read-only sequence of the timestamps of a TelemetryRing, in logical order (for 'bisect').
+    __slots__ = ("ring",)
+
+    def __init__(self, ring : TelemetryRing):
+        self.ring = ring
+        return None
+
+    def __len__(self)->int:
+        return len(self.ring)
+
+    def __getitem__(self, logicalIndex : int)->float:
+        return self.ring.timestampAt(logicalIndex)
+
+
+class TelemetryHistory:
+    """
+    Persistent telemetry history of a station: one TelemetryRing file per slot, in 'directory'.
+    By default, every ring holds RETENTION seconds of records at the rate at which the BMS
+    sends BATTERY_DATA_0, i.e, one record per frame.
+    """
+    RECORDS_PER_SECOND = 20 #[Hz] (BATTERY_DATA_0 is relayed every 50 ms.)
+    RETENTION = 2*24*3600 #[s]
+
+    def __init__(self, directory : str, slotAddresses : List[MODULE_ADDRESS], capacity : int | None = None):
+        if capacity is None:
+            capacity = self.RECORDS_PER_SECOND*self.RETENTION
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rings : Dict[MODULE_ADDRESS, TelemetryRing] = {
+            slotAddress : TelemetryRing(os.path.join(directory, f"{slotAddress.name}.telemetry"), capacity)
+            for slotAddress in slotAddresses
+        }
+        return None
+
+    def append(self, slotAddress : MODULE_ADDRESS, timestamp : float, voltage : float, current : float, soc : float,
+               temperatures : Iterable[float], warningsMask : int)->None:
+        self.rings[slotAddress].append(timestamp, voltage, current, soc, temperatures, warningsMask)
+        return None
+
+    def getLastTimestamp(self, slotAddress : MODULE_ADDRESS)->float:
+        # Timestamp of the latest record, as stored (i.e, once made non-decreasing).
+        return self.rings[slotAddress].lastTimestamp
+
+    def read(self, slotAddress : MODULE_ADDRESS, startTime : float = -np.inf, endTime : float = np.inf)->np.ndarray:
+        return self.rings[slotAddress].read(startTime, endTime)
+
+    def flush(self)->None:
+        for ring in self.rings.values():
+            ring.flush()
+        return None
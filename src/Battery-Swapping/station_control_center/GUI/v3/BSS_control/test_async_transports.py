@@ -0,0 +1,213 @@
+import os
+import asyncio
+import pytest
+from BSS_control.async_transports import AsyncSerialBridgeTransport, AsyncSocketCanTransport, CAN_EFF_MASK
+from BSS_control.station_emulator import StationEmulator, EmulatedSerialBridge
+from BSS_control.CanUtils import (
+    can_frame,
+    PRIORITY_LEVEL,
+    MODULE_ADDRESS,
+    ACTIVITY_CODE,
+    SERIAL_LINK_MODE,
+    BIN_FRAME_DELIMITER,
+    BIN_MODE_REQUEST,
+    BIN_MODE_ACK,
+    BIN_MODE_ADVERTISEMENT)
+
+try:
+    import can
+except ImportError:
+    can = None
+
+
+
+class FakeControlCenter:
+    class SIGNALS:
+        class sendCanMsg:
+            @staticmethod
+            def connect(slot):
+                return None
+
+    def __init__(self):
+        self.canMsgs = []
+        return None
+
+    def updateStatesFromCanMsgs(self, canMsgs):
+        self.canMsgs += canMsgs
+        return None
+
+
+def makeCanMsgs(num):
+    return [can_frame.from_canStr(f"{(MODULE_ADDRESS.CONTROL_CENTER.value << 8) | 1}-{i},1,2,3,4,5,6,7,\n") for i in range(num)]
+
+
+#%% SERIAL BRIDGE: LINK NEGOTIATION
+def makeNegotiatingTransport(loop):
+    # A transport waiting for the bridge's acknowledgement, whose writes are recorded instead of sent.
+    transport = AsyncSerialBridgeTransport()
+    transport.connectToControlCenter(FakeControlCenter())
+    transport.written = []
+    transport.write = transport.written.append
+    transport.isNegotiating = True
+    transport.binModeAcknowledged = loop.create_future()
+    return transport
+
+
+def test_no_request_is_sent_to_a_legacy_bridge():
+    async def main():
+        transport = makeNegotiatingTransport(asyncio.get_running_loop())
+        transport.handleData(b"".join(canMsg.to_canStr().encode("utf-8") for canMsg in makeCanMsgs(10)))
+        return transport
+    transport = asyncio.run(main())
+    assert transport.written == []
+    assert len(transport.controlCenter.canMsgs) == 10
+    assert transport.linkMode == SERIAL_LINK_MODE.ASCII
+
+
+def test_request_is_sent_once_advertised():
+    async def main():
+        transport = makeNegotiatingTransport(asyncio.get_running_loop())
+        transport.handleData(BIN_MODE_ADVERTISEMENT + b"\n" + BIN_MODE_ADVERTISEMENT + b"\n")
+        return transport
+    transport = asyncio.run(main())
+    assert transport.written == [BIN_MODE_REQUEST]
+    assert transport.framesRejected == 0
+
+
+def test_frames_that_follow_the_ack_in_the_same_read_are_binary():
+    canMsgs = makeCanMsgs(5)
+    async def main():
+        transport = makeNegotiatingTransport(asyncio.get_running_loop())
+        transport.handleData(canMsgs[0].to_canStr().encode("utf-8") + BIN_MODE_ACK + b"\n" + b"".join(canMsg.to_binFrame() for canMsg in canMsgs[1:]))
+        return transport
+    transport = asyncio.run(main())
+    assert transport.linkMode == SERIAL_LINK_MODE.BINARY
+    assert [canMsg.can_id for canMsg in transport.controlCenter.canMsgs] == [canMsg.can_id for canMsg in canMsgs]
+    assert transport.framesRejected == 0
+
+
+def test_bridge_left_in_binary_mode_is_acknowledged_again():
+    # The bridge's re-acknowledgement is framed by delimiters, in the middle of its binary frames.
+    canMsgs = makeCanMsgs(6)
+    async def main():
+        transport = makeNegotiatingTransport(asyncio.get_running_loop())
+        transport.handleData(b"".join(canMsg.to_binFrame() for canMsg in canMsgs[:3]))
+        transport.handleData(b"".join(canMsg.to_binFrame() for canMsg in canMsgs[:3]))
+        transport.handleData(canMsgs[3].to_binFrame()[:5])
+        transport.handleData(BIN_FRAME_DELIMITER + BIN_MODE_ACK + b"\n" + BIN_FRAME_DELIMITER + b"".join(canMsg.to_binFrame() for canMsg in canMsgs[4:]))
+        return transport
+    transport = asyncio.run(main())
+    # (Sent after a delimiter, so that the bridge takes it at a frame boundary.)
+    assert transport.written == [BIN_FRAME_DELIMITER + BIN_MODE_REQUEST]
+    assert transport.linkMode == SERIAL_LINK_MODE.BINARY
+    assert [canMsg.can_id for canMsg in transport.controlCenter.canMsgs] == [canMsg.can_id for canMsg in canMsgs[4:]]
+    assert transport.framesRejected == 0
+
+
+def test_bridge_in_binary_mode_only_takes_the_request_at_a_frame_boundary():
+    # A frame whose payload holds the bytes of the request is still a frame, and a request that follows
+    # a partial frame (but a delimiter) is still acknowledged.
+    lookalike = can_frame.from_canIdParams(PRIORITY_LEVEL.MEDIUM, ACTIVITY_CODE.rpy2net_SET_LED_STRIP_STATE_OF_BATTERY_SLOT_MODULE,
+                                           MODULE_ADDRESS.SLOT4, MODULE_ADDRESS.CONTROL_CENTER, [1, *BIN_MODE_REQUEST, 2, 3])
+    bridge = EmulatedSerialBridge()
+    bridge.binaryMode = True
+    bridge.hostHasSpoken = True
+    try:
+        os.write(bridge.slaveFd, lookalike.to_binFrame())
+        assert [canMsg.can_id for canMsg in bridge.read()] == [lookalike.can_id]
+        os.write(bridge.slaveFd, lookalike.to_binFrame()[:6] + BIN_FRAME_DELIMITER + BIN_MODE_REQUEST + lookalike.to_binFrame())
+        assert [canMsg.can_id for canMsg in bridge.read()] == [lookalike.can_id]
+        os.set_blocking(bridge.slaveFd, False)
+        assert os.read(bridge.slaveFd, 4096) == BIN_FRAME_DELIMITER + BIN_MODE_ACK + b"\n" + BIN_FRAME_DELIMITER
+    finally:
+        bridge.close()
+
+
+def test_emulated_bridge_negotiates_binary_mode_again_after_a_restart():
+    emulator = StationEmulator()
+    emulator.loadScenario("FULL_STATION")
+    bridge = EmulatedSerialBridge()
+
+    async def serveBridge():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        while True:
+            bridge.write(emulator.step(1000*(loop.time() - start)))
+            for canMsg in bridge.read():
+                emulator.executeCanMsg(canMsg)
+            await asyncio.sleep(0.005)
+
+    async def runTransport():
+        transport = AsyncSerialBridgeTransport(bridge.port)
+        transport.connectToControlCenter(FakeControlCenter())
+        assert await transport.open()
+        await asyncio.sleep(0.5)
+        transport.close()
+        return transport
+
+    async def main():
+        server = asyncio.create_task(serveBridge())
+        transports = [await runTransport(), await runTransport()]
+        server.cancel()
+        return transports
+
+    try:
+        transports = asyncio.run(main())
+    finally:
+        bridge.close()
+    for transport in transports:
+        assert transport.linkMode == SERIAL_LINK_MODE.BINARY
+        assert len(transport.controlCenter.canMsgs) > 0
+        assert transport.framesRejected == 0
+
+
+#%% SOCKETCAN
+SOCKETCAN_INTERFACES = [
+    # (python-can's in-process bus, so that it runs anywhere, and a virtual SocketCAN interface where there's one.)
+    ("virtual", "bss_test"),
+    pytest.param("socketcan", "vcan0", marks=pytest.mark.skipif(not os.path.exists("/sys/class/net/vcan0"), reason="vcan0 is not set up")),
+]
+
+@pytest.mark.skipif(can is None, reason="python-can is not installed")
+@pytest.mark.parametrize("interface, channel", SOCKETCAN_INTERFACES)
+def test_socketcan_transport_filters_decodes_and_sends_frames(interface, channel):
+    toControlCenter = [can_frame.from_canIdParams(PRIORITY_LEVEL.MEDIUM, ACTIVITY_CODE.net2rpy_BATTERY_DATA_0, MODULE_ADDRESS.CONTROL_CENTER,
+                                                  MODULE_ADDRESS.SLOT1, [i, 1, 2, 3, 4, 5, 6, 7]) for i in range(5)]
+    toSlot = can_frame.from_canIdParams(PRIORITY_LEVEL.MEDIUM, ACTIVITY_CODE.rpy2net_SET_LED_STRIP_STATE_OF_BATTERY_SLOT_MODULE, MODULE_ADDRESS.SLOT4,
+                                        MODULE_ADDRESS.CONTROL_CENTER, [1, 0, 0, 0, 0, 0, 0, 0])
+
+    def toBusMessage(canMsg, **kwargs):
+        return can.Message(arbitration_id=canMsg.can_id & CAN_EFF_MASK, is_extended_id=True, data=bytes(canMsg.data), **kwargs)
+
+    async def main():
+        transport = AsyncSocketCanTransport(channel, interface)
+        transport.connectToControlCenter(FakeControlCenter())
+        assert await transport.open()
+        runTask = asyncio.create_task(transport.run())
+        try:
+            with can.Bus(interface=interface, channel=channel) as network:
+                for canMsg in toControlCenter[:3]:
+                    network.send(toBusMessage(canMsg))
+                # Filtered out (not addressed to the control center, or a standard frame), or rejected (remote frame).
+                network.send(toBusMessage(toSlot))
+                network.send(can.Message(arbitration_id=toControlCenter[0].can_id & 0x7FF, is_extended_id=False, data=bytes(8)))
+                network.send(toBusMessage(toControlCenter[0], is_remote_frame=True))
+                for canMsg in toControlCenter[3:]:
+                    network.send(toBusMessage(canMsg))
+                await asyncio.sleep(0.2)
+
+                transport.sendCanMsg(toSlot.to_canStr())
+                sent = network.recv(timeout=1.0)
+        finally:
+            transport.close()
+            runTask.cancel()
+        return transport, sent
+
+    transport, sent = asyncio.run(main())
+    received = transport.controlCenter.canMsgs
+    assert [(canMsg.can_id, list(canMsg.data)) for canMsg in received] == [(canMsg.can_id, list(canMsg.data)) for canMsg in toControlCenter]
+    assert [canMsg.destinationAddress for canMsg in received] == [MODULE_ADDRESS.CONTROL_CENTER]*len(toControlCenter)
+    assert transport.framesRejected == 1
+
+    assert sent is not None and sent.is_extended_id
+    assert sent.arbitration_id == toSlot.can_id & CAN_EFF_MASK and list(sent.data) == list(toSlot.data)
@@ -0,0 +1,65 @@
+import random
+import warnings
+from BSS_control.battery import Battery, BATTERY_WARNINGS, warningsToMask
+from BSS_control.control_center import ControlCenter
+from BSS_control.station_emulator import StationEmulator
+from BSS_control.CanUtils import can_frame, PRIORITY_LEVEL, ACTIVITY_CODE, MODULE_ADDRESS
+
+
+
+def decodeWarningsBitByBit(activityCode : ACTIVITY_CODE, data : list)->set:
+    # The per-bit decoding the masks replaced: the reference every frame is checked against.
+    if activityCode == ACTIVITY_CODE.net2rpy_BATTERY_DATA_0:
+        return {BATTERY_WARNINGS(8*i + j) for i in range(3) for j in range(8) if data[5 + i] >> j & 1}
+    return ({BATTERY_WARNINGS(24 + j) for j in range(5) if data[0] >> j & 1} |
+            {BATTERY_WARNINGS(29 + j) for j in range(3) if data[1] >> j & 1})
+
+
+def test_warnings_decode_like_bit_by_bit():
+    rng = random.Random(3)
+    mismatches = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for _ in range(3000):
+            battery = Battery(MODULE_ADDRESS.SLOT1)
+            battery.updateStatesFromBatterySlotModule(True, False, True)
+            activityCode = rng.choice([ACTIVITY_CODE.net2rpy_BATTERY_DATA_0, ACTIVITY_CODE.net2rpy_BATTERY_DATA_1])
+            data = [rng.randrange(256) for _ in range(8)]
+            battery.updateStatesFromCanMsg(can_frame.from_canIdParams(PRIORITY_LEVEL.HIGH_, activityCode, MODULE_ADDRESS.CONTROL_CENTER,
+                                                                      MODULE_ADDRESS.SLOT1, data))
+            if battery.warnings != decodeWarningsBitByBit(activityCode, data):
+                mismatches.append((activityCode, data, battery.warnings))
+    assert mismatches == []
+
+
+def test_fatal_warning_is_flagged_by_scalar_and_vectorized_checks(monkeypatch):
+    fatalWarnings = {BATTERY_WARNINGS.SHORT_CIRCUIT_PROTECTION}
+    monkeypatch.setattr(Battery, "FATAL_BATTERY_WARNINGS", fatalWarnings)
+    monkeypatch.setattr(Battery, "FATAL_BATTERY_WARNINGS_MASK", warningsToMask(fatalWarnings))
+
+    emulator = StationEmulator(timeScale=20)
+    emulator.loadScenario("FULL_STATION")
+    controlCenter = ControlCenter()
+    controlCenter.SIGNALS.sendCanMsg.connect(emulator.executeCanStr)
+    damagedSlotAddress = controlCenter.SLOT_ADDRESSES[2]
+
+    now = 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for tick in range(60):
+            if tick == 30:
+                emulator.setBatteryWarnings(damagedSlotAddress, list(fatalWarnings))
+            for _ in range(10):
+                now += 25
+                controlCenter.updateStatesFromCanMsgs(emulator.step(now))
+            controlCenter.updateCurrentGlobalTime(now)
+            controlCenter.reconcilePeripherals()
+            controlCenter.sendCanMsg()
+            if tick % 4 == 0:
+                controlCenter.turnOnBmsSolenoidsWhereWise()
+
+        scalarStates = [controlCenter.modules[slotAddress].battery.isDamaged for slotAddress in controlCenter.SLOT_ADDRESSES]
+        vectorizedStates = list(Battery.getDamagedStates(controlCenter.stateTable))
+    assert controlCenter.modules[damagedSlotAddress].battery.fatalWarnings == fatalWarnings
+    assert controlCenter.getSlotsThatMatchStates({"BATTERY_HAS_FATAL_WARNINGS" : True}) == [damagedSlotAddress]
+    assert [float(state) for state in vectorizedStates] == [float(state) for state in scalarStates] == [0, 0, 1, 0]
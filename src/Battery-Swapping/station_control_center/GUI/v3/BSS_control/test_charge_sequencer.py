@@ -0,0 +1,152 @@
+import random
+import warnings
+from math import isnan
+from BSS_control.charge_sequencer import TimerWheel, ChargeSequencer, CHARGE_SEQUENCE_STATE
+from BSS_control.control_center import ControlCenter
+from BSS_control.CanUtils import MODULE_ADDRESS
+
+
+
+SLOT = MODULE_ADDRESS.SLOT1
+
+
+#%% TIMER WHEEL
+def test_timers_fire_in_order_of_deadline():
+    wheel = TimerWheel()
+    fired = []
+    handles = [wheel.schedule(deadline, lambda deadline=deadline: fired.append(deadline)) for deadline in [500, 250, 20000, 100000, 0, 260]]
+    wheel.cancel(handles[2])
+    assert len(wheel) == 5
+
+    wheel.advance(250)
+    assert fired == [0, 250]
+    wheel.advance(600)
+    assert fired == [0, 250, 260, 500]
+    wheel.advance(99999)
+    assert fired == [0, 250, 260, 500]
+    wheel.advance(100000)
+    assert fired == [0, 250, 260, 500, 100000]
+    assert len(wheel) == 0
+
+
+def test_timers_fire_on_time_when_unaligned():
+    # Driven from a time that isn't a multiple of the resolution, each timer must fire on the very tick
+    # that reaches its deadline (not one tick late).
+    start = 1000.3
+    wheel = TimerWheel(now=start)
+    fired = []
+    for offset in [250, 500, 750, 6000]:
+        wheel.schedule(start + offset, lambda offset=offset: fired.append(offset))
+
+    for tick in range(1, 30):
+        wheel.advance(start + tick*TimerWheel.RESOLUTION)
+        assert fired == [offset for offset in [250, 500, 750, 6000] if offset <= tick*TimerWheel.RESOLUTION]
+
+
+def test_timers_fire_once_and_never_early():
+    rng = random.Random(1)
+    wheel = TimerWheel()
+    expected, fired = [], []
+    for order in range(2000):
+        deadline = rng.uniform(0, 60000)
+        expected.append((deadline, order))
+        wheel.schedule(deadline, lambda deadline=deadline, order=order: fired.append((deadline, order)))
+
+    now = 0
+    while now < 61000:
+        now += rng.choice([250, 250, 250, 250.7, 500, 17000])
+        wheel.advance(now)
+        assert fired == sorted(expected)[:len(fired)]
+        assert all(deadline <= now for deadline, _ in fired)
+        assert all(deadline > now for deadline, _ in sorted(expected)[len(fired):])
+    assert fired == sorted(expected)
+
+
+#%% SEQUENCER
+def makeSequencer():
+    wheel = TimerWheel()
+    sequencer = ChargeSequencer([SLOT], wheel)
+    busy, steps = [], []
+    def makeSteps(tag):
+        return [(0,    f"{tag}_0",    lambda: steps.append(f"{tag}_0")),
+                (250,  f"{tag}_250",  lambda: steps.append(f"{tag}_250")),
+                (1000, f"{tag}_1000", lambda: steps.append(f"{tag}_1000"))]
+    return wheel, sequencer, busy, steps, makeSteps
+
+
+def test_sequence_runs_its_steps_and_ends_its_busy_window():
+    wheel, sequencer, busy, steps, makeSteps = makeSequencer()
+    assert sequencer.start(SLOT, CHARGE_SEQUENCE_STATE.STARTING_CHARGE, 0, makeSteps("start"), 6000, busy.append)
+    assert steps == ["start_0"] and busy == [True]
+
+    wheel.advance(250)
+    assert steps == ["start_0", "start_250"]
+    assert sequencer.getStatus(SLOT)["pendingSteps"] == [("start_1000", 1000)]
+    wheel.advance(5750)
+    assert steps == ["start_0", "start_250", "start_1000"]
+    assert sequencer.getState(SLOT) == CHARGE_SEQUENCE_STATE.STARTING_CHARGE
+    wheel.advance(6000)
+    assert sequencer.getState(SLOT) == CHARGE_SEQUENCE_STATE.IDLE and busy == [True, False]
+    assert len(wheel) == 0
+
+
+def test_sequence_of_same_priority_is_rejected():
+    wheel, sequencer, busy, steps, makeSteps = makeSequencer()
+    sequencer.start(SLOT, CHARGE_SEQUENCE_STATE.STARTING_CHARGE, 0, makeSteps("start"), 6000, busy.append)
+    assert not sequencer.start(SLOT, CHARGE_SEQUENCE_STATE.FINISHING_CHARGE, 0, makeSteps("finish"), 6000, busy.append)
+    assert sequencer.sequencesRejected == 1 and sequencer.sequencesPreempted == 0
+    assert steps == ["start_0"]
+
+
+def test_forced_stop_preempts_and_cancels_pending_steps():
+    wheel, sequencer, busy, steps, makeSteps = makeSequencer()
+    sequencer.start(SLOT, CHARGE_SEQUENCE_STATE.STARTING_CHARGE, 0, makeSteps("start"), 6000, busy.append)
+    wheel.advance(250)
+    assert sequencer.start(SLOT, CHARGE_SEQUENCE_STATE.FORCING_STOP, 250, makeSteps("stop"), 12000, busy.append)
+    assert sequencer.sequencesPreempted == 1
+    assert busy == [True, False, True]
+
+    wheel.advance(20000)
+    # The start's pending step never ran, nor did its end of busy window.
+    assert steps == ["start_0", "start_250", "stop_0", "stop_250", "stop_1000"]
+    assert busy == [True, False, True, False]
+    assert len(wheel) == 0
+
+
+def test_cancel_drops_pending_steps():
+    wheel, sequencer, busy, steps, makeSteps = makeSequencer()
+    sequencer.start(SLOT, CHARGE_SEQUENCE_STATE.FINISHING_CHARGE, 0, makeSteps("finish"), 6000, busy.append)
+    assert sequencer.cancel(SLOT)
+    assert not sequencer.cancel(SLOT)
+    wheel.advance(10000)
+    assert steps == ["finish_0"] and busy == [True, False]
+    assert len(wheel) == 0
+
+
+#%% CONTROL CENTER
+def startChargeSequence(controlCenter):
+    controlCenter.chargeSequencer.start(SLOT, CHARGE_SEQUENCE_STATE.STARTING_CHARGE, controlCenter.currentGlobalTime,
+                                        [], controlCenter.CHARGE_SEQUENCE_BUSY_TIME, lambda isBusy: None)
+    return None
+
+
+def test_plain_finish_does_not_preempt_start_in_flight():
+    # No data has been received yet, so 'isDamaged' is nan, as it is while a start power cycles the BMS.
+    controlCenter = ControlCenter()
+    assert isnan(controlCenter.modules[SLOT].battery.isDamaged)
+    startChargeSequence(controlCenter)
+
+    controlCenter.finishChargeOfSlotBatteryIfAllowable(SLOT)
+    assert controlCenter.chargeSequencer.getState(SLOT) == CHARGE_SEQUENCE_STATE.STARTING_CHARGE
+    assert controlCenter.chargeSequencer.sequencesPreempted == 0
+
+
+def test_forced_finish_preempts_start_in_flight():
+    controlCenter = ControlCenter()
+    startChargeSequence(controlCenter)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        controlCenter.finishChargeOfSlotBatteryIfAllowable(SLOT, forcedStop=True)
+    assert controlCenter.chargeSequencer.getState(SLOT) == CHARGE_SEQUENCE_STATE.FORCING_STOP
+    assert controlCenter.chargeSequencer.sequencesPreempted == 1
@@ -0,0 +1,64 @@
+import random
+import warnings
+import numpy as np
+import pytest
+from BSS_control.control_center import ControlCenter
+from BSS_control.station_emulator import StationEmulator, SCENARIOS
+from BSS_control.battery_slot import LED_STRIP_STATE
+from BSS_control.eight_channel_relay import CHANNEL_NAME
+
+
+
+KEYWORDS = list(ControlCenter.STATES_TO_MATCH_LOGIC) + ["UNKNOWN_STATE"]
+VALUES = [True, False, 0, 1, np.nan, LED_STRIP_STATE.RED, LED_STRIP_STATE.BLUE, [1]]
+NUM_TICKS = 200
+NUM_QUERIES_PER_STEP = 3
+
+
+def getSlotsThatMatchStatesLinearly(controlCenter, statesToMatch : dict)->list:
+    # The linear filter the index replaced: the reference every query is checked against.
+    res = list(controlCenter.SLOT_ADDRESSES)
+    for keyword, value in statesToMatch.items():
+        if keyword not in controlCenter.STATES_TO_MATCH_LOGIC:
+            continue
+        isSlotAttr, attrName = controlCenter.STATES_TO_MATCH_LOGIC[keyword]
+        res = [slotAddress for slotAddress in res
+               if getattr(controlCenter.modules[slotAddress] if isSlotAttr else controlCenter.modules[slotAddress].battery, attrName) == value]
+    return res
+
+
+@pytest.mark.parametrize("scenario", list(SCENARIOS))
+def test_index_matches_linear_filter(scenario):
+    # 6,000 random queries per scenario (30,000 over the 5 of them), plain and precompiled, while the
+    # emulated station goes through its scenario.
+    rng = random.Random(1)
+    emulator = StationEmulator(timeScale=20)
+    emulator.loadScenario(scenario)
+    controlCenter = ControlCenter()
+    controlCenter.SIGNALS.sendCanMsg.connect(emulator.executeCanStr)
+
+    mismatches = []
+    now = 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for tick in range(NUM_TICKS):
+            for _ in range(10):
+                now += 25
+                controlCenter.updateStatesFromCanMsgs(emulator.step(now))
+                for i in range(NUM_QUERIES_PER_STEP):
+                    statesToMatch = {rng.choice(KEYWORDS) : rng.choice(VALUES) for _ in range(rng.randint(1, 4))}
+                    query = statesToMatch if i else controlCenter.compileStatesQuery(statesToMatch)
+                    res = controlCenter.getSlotsThatMatchStates(query)
+                    expected = getSlotsThatMatchStatesLinearly(controlCenter, statesToMatch)
+                    if res != expected:
+                        mismatches.append((tick, statesToMatch, res, expected))
+
+            controlCenter.updateCurrentGlobalTime(now)
+            controlCenter.reconcilePeripherals()
+            controlCenter.sendCanMsg()
+            if tick % 4 == 0:
+                controlCenter.turnOnLedStripsBasedOnState()
+                controlCenter.turnOnBmsSolenoidsWhereWise()
+            if tick == 20:
+                controlCenter.setRelayChannelState(CHANNEL_NAME(0), True)
+    assert mismatches == []
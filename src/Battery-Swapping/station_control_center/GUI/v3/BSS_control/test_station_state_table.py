@@ -0,0 +1,53 @@
+import random
+import numpy as np
+from BSS_control.station_state_table import ColumnGroup, StationStateRowView
+
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        return None
+
+    def __call__(self)->float:
+        return self.now
+
+
+def test_window_aggregates_match_the_samples_in_the_window():
+    rng = random.Random(5)
+    clock = FakeClock()
+    group = ColumnGroup(["voltage", "current"], numRows=3, window=7, staleAfter=1.0, clock=clock)
+    windows = [[] for _ in range(3)]
+    for n in range(3000):
+        row = rng.randrange(3)
+        if rng.random() < 0.01:
+            group.clearRow(row)
+            windows[row] = []
+            continue
+        values = (rng.uniform(40, 55), rng.choice([-1, 1])*rng.randint(0, 5))
+        group.append(row, values)
+        windows[row] = (windows[row] + [values])[-7:]
+
+        for field, i in group.fieldIndices.items():
+            samples = [[values[i] for values in window] for window in windows]
+            expectedMins = [min(rowSamples) if rowSamples else np.nan for rowSamples in samples]
+            expectedMaxs = [max(rowSamples) if rowSamples else np.nan for rowSamples in samples]
+            np.testing.assert_array_equal(group.getMins(field), expectedMins)
+            np.testing.assert_array_equal(group.getMaxs(field), expectedMaxs)
+            np.testing.assert_allclose(group.getMeans(field), [np.mean(rowSamples) if rowSamples else np.nan for rowSamples in samples])
+            rowView = StationStateRowView(group, field, row)
+            assert (rowView.min, rowView.max) == (expectedMins[row], expectedMaxs[row])
+            assert rowView.hasNegatives == any(sample < 0 for sample in samples[row])
+
+
+def test_stale_window_aggregates_read_nan():
+    clock = FakeClock()
+    group = ColumnGroup(["soc"], numRows=1, window=5, staleAfter=1.0, clock=clock)
+    for soc in [80, 81, 79]:
+        group.append(0, (soc,))
+    assert (group.getMins("soc")[0], group.getMaxs("soc")[0]) == (79, 81)
+
+    clock.now = 1.5
+    rowView = StationStateRowView(group, "soc", 0)
+    assert np.isnan(rowView.min) and np.isnan(rowView.max) and np.isnan(rowView.mean)
+    assert np.isnan(group.getMins("soc")[0]) and np.isnan(group.getMaxs("soc")[0])
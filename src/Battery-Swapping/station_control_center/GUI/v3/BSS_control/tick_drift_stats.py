@@ -0,0 +1,50 @@
+import numpy as np
+from bisect import bisect_right
+
+
+
+class TickDriftStats:
+    """
+    Actual timing of the ticks of a periodic timer meant to fire every 'period' [ms]: number of ticks,
+    mean/max interval, a histogram of the lateness of every tick (its interval minus the period) and
+    the ticks that were missed altogether (a Qt timer whose thread stalls doesn't queue the timeouts
+    it misses, it fires once when the thread is back).
+    """
+    LATENESS_BIN_EDGES = (0, 10, 25, 50, 100, 250, 500, 1000) #[ms] (Lower edges. Earlier ticks fall in the first bin.)
+
+    def __init__(self, period : float):
+        self.period = period #[ms]
+        self.numTicks = 0
+        self.lastTick = np.nan #[ms]
+        self.intervalsSum = 0.0 #[ms]
+        self.maxInterval = 0.0 #[ms]
+        self.maxLateness = 0.0 #[ms]
+        self.missedTicks = 0
+        self.latenessHistogram = [0]*len(self.LATENESS_BIN_EDGES)
+        return None
+
+    def update(self, now : float)->None:
+        if self.numTicks:
+            interval = now - self.lastTick
+            lateness = interval - self.period
+            self.intervalsSum += interval
+            self.maxInterval = max(self.maxInterval, interval)
+            self.maxLateness = max(self.maxLateness, lateness)
+            self.latenessHistogram[max(bisect_right(self.LATENESS_BIN_EDGES, lateness) - 1, 0)] += 1
+            self.missedTicks += max(round(interval/self.period) - 1, 0)
+        self.lastTick = now
+        self.numTicks += 1
+        return None
+
+    @property
+    def meanInterval(self)->float:
+        return self.intervalsSum/(self.numTicks - 1) if self.numTicks > 1 else np.nan
+
+    def asDict(self)->dict:
+        return {"period"            : self.period,
+                "numTicks"          : self.numTicks,
+                "meanInterval"      : self.meanInterval,
+                "maxInterval"       : self.maxInterval,
+                "maxLateness"       : self.maxLateness,
+                "missedTicks"       : self.missedTicks,
+                "latenessHistogram" : dict(zip(self.LATENESS_BIN_EDGES, self.latenessHistogram))}
@@ -22,6 +22,7 @@ class SuperAccessBatteryStatusPanelWindow(QWidget):
         "isDamaged"             : "IS_DAMAGED",
         "hasWarnings"           : "HAS_WARNINGS",
         "hasFatalWarnings"      : "HAS_FATAL_WARNINGS",
+        "hasCellImbalance"      : "HAS_CELL_IMBALANCE",
         "bmsHasCanBusError"     : "BMS_HAS_CAN_BUS_ERROR",
         "dataPacketsAreDamaged" : "DATA_PACKETS_ARE_DAMAGED"
     }
@@ -29,6 +30,9 @@ class SuperAccessBatteryStatusPanelWindow(QWidget):
         "voltage"                        : "VOLTAGE [V]",
         "current"                        : "CURRENT [A]",
         "soc"                            : "SOC [%]",
+        "minCellVoltage"                 : "MIN_CELL_VOLTAGE [V]",
+        "maxCellVoltage"                 : "MAX_CELL_VOLTAGE [V]",
+        "cellVoltageDelta"               : "CELL_VOLTAGE_DELTA [V]",
         "maxTemp"                        : "MAX_TEMP [°C]",
         "isCharging"                     : "IS_CHARGING",
         "isChargedEnough"                : "IS_CHARGED_ENOUGH",
@@ -213,6 +217,8 @@ class SuperAccessBatteryStatusPanelWindow(QWidget):
             value = getattr(self.ControlCenter_obj.modules[slotAddress].battery, key)
             if key in ["voltage", "current"]:
                 value = round(value, 2)
+            elif key in ["minCellVoltage", "maxCellVoltage", "cellVoltageDelta"]:
+                value = round(value, 3)
             self.attributesLabels[key].setText(str(value))
 
         for key in self.timersLabels:
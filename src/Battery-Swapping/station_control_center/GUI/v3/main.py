@@ -1,13 +1,53 @@
+import os
 import sys
+import socket
+import argparse
+import subprocess
 from main_window import MainWindow
 #from main_window_test import MainWindow
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPalette
 from PyQt5.QtWidgets import QApplication
+from BSS_control.station_ipc import DEFAULT_SOCKET_PATH
 
 
+# The station is run by the station daemon (see BSS_control/station_daemon.py), not by the GUI. Unless
+# it's already running (e.g, as a service), it's started here in a session of its own, so that it
+# keeps running (and charging) if the GUI crashes or is closed. Its link to the CAN network is picked
+# on the command line (e.g, 'python main.py --transport socketcan --channel can0') or from the environment.
+def parseStationDaemonArgs(argv):
+    parser = argparse.ArgumentParser(description="GUI of the battery swapping station.", allow_abbrev=False)
+    parser.add_argument("--transport", choices=("serial", "socketcan", "emulator"), default=os.environ.get("BSS_TRANSPORT", "serial"))
+    parser.add_argument("--port", default=os.environ.get("BSS_SERIAL_PORT", "/dev/ttyUSB0"), help="Serial port of the bridge module (serial transport).")
+    parser.add_argument("--channel", default=os.environ.get("BSS_SOCKETCAN_CHANNEL", "can0"), help="CAN interface (socketcan transport).")
+    parser.add_argument("--scenario", default=os.environ.get("BSS_EMULATOR_SCENARIO", "FULL_STATION"), help="Scenario of the emulated station (emulator transport).")
+    parser.add_argument("--no-rfid", action="store_true", default=os.environ.get("BSS_RFID", "1") == "0", help="Don't read the RFID card reader.")
+    args, qtArgv = parser.parse_known_args(argv[1:])
 
-app = QApplication(sys.argv)
+    stationDaemonArgs = ["--transport", args.transport, "--port", args.port, "--channel", args.channel, "--scenario", args.scenario]
+    if not args.no_rfid:
+        stationDaemonArgs.append("--rfid")
+    # (Whatever isn't for the daemon is left to Qt.)
+    return stationDaemonArgs, argv[:1] + qtArgv
+
+def stationDaemonIsRunning(socketPath):
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socketPath)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+stationDaemonArgs, qtArgv = parseStationDaemonArgs(sys.argv)
+if not stationDaemonIsRunning(DEFAULT_SOCKET_PATH):
+    subprocess.Popen([sys.executable, "-m", "BSS_control.station_daemon", "--socket", DEFAULT_SOCKET_PATH, *stationDaemonArgs],
+                     cwd=os.path.dirname(os.path.abspath(__file__)),
+                     start_new_session=True)
+
+
+app = QApplication(qtArgv)
 app.setStyle('Fusion')
 
 palette = QPalette()
@@ -20,7 +20,6 @@ from PyQt5.QtCore import (
     pyqtSignal,
     QObject,
     Qt, 
-    QThreadPool, 
     QTimer, 
     QSize)
 
@@ -35,13 +34,10 @@ from User_database.user_database import (
     getUsers,
     updateUsersNumBatts)
 
-from BSS_control.thread_workers import (
-    SerialReadWorker,
-    RfidReadWorker)
-
-
 from BSS_control.CanUtils import MODULE_ADDRESS
 from BSS_control.control_center import ControlCenter
+from BSS_control.station_client import StationClient
+from BSS_control.station_ipc import DEFAULT_SOCKET_PATH
 from BSS_control.battery_slot import SOLENOID_NAME
 
 
@@ -70,8 +66,6 @@ class WINS(Enum):
 
 
 class MainWindowSignals(QObject):
-    terminate_SerialReadWorker = pyqtSignal()
-    terminate_RfidReadWorker   = pyqtSignal()
     batteryEntryDetected       = pyqtSignal(int)
     batteryEgressDetected      = pyqtSignal(int)
     
@@ -81,6 +75,7 @@ class MainWindow(QMainWindow):
     USER_INTERACTION_TIMEOUT = 2.5*60*1000
     BATTERY_ENTRY_INTERACTION_EMIT_TIMEOUT = 1000
     BATTERY_EGRESS_INTERACTION_EMIT_TIMEOUT = 3000
+    STATION_DAEMON_SOCKET_PATH = DEFAULT_SOCKET_PATH
     
 
     def __init__(self):
@@ -102,16 +97,17 @@ class MainWindow(QMainWindow):
         self.moduleStatusPanelToUpdate = None
         self.checkingForUserAndBatteryInteraction = False
 
-        self.ControlCenter_obj = ControlCenter()
+        # The station itself is run by the station daemon (see BSS_control/station_daemon.py), this is a client of it.
+        self.ControlCenter_obj = StationClient(self.STATION_DAEMON_SOCKET_PATH)
         self.globalTimers_setup()
+        self.slotEvents_setup()
         self.windows_setup()
         self.toolbar_setup()
-        self.threadWorkers_setup()
+        self.rfidReads_setup()
 
+        # Booting lasts until the station daemon reports the station ready (see BSS_control/boot_coordinator.py).
         self.windows[WINS.LOCK_SCREEN].text = "BOOTING UP..."
-        QTimer.singleShot(10000, self.hardware_setup)
-        QTimer.singleShot(20000, self.workFlowReset)
-        QTimer.singleShot(20250, self.isNotBootingUp)
+        StationClient.SIGNALS.stationReady.connect(self.stationReady_workflow)
         return None
     
 
@@ -124,6 +120,8 @@ class MainWindow(QMainWindow):
         }
         for key in self.globalTimers.keys():
             self.globalTimers[key].setInterval(key)
+        # (A coarse timer may fire up to 5% late, which adds to the jitter of the control loop.)
+        self.globalTimers[250].setTimerType(Qt.PreciseTimer)
 
         self.globalTimers[250].timeout.connect(self.updateGlobalTimerVars250)
         self.globalTimers[1000].timeout.connect(self.updateGlobalTimerVars1000)
@@ -134,6 +132,11 @@ class MainWindow(QMainWindow):
         return None
 
 
+    def slotEvents_setup(self):
+        StationClient.SIGNALS.limitSwitchStateChanged.connect(self.batteryInteraction_workflow)
+        return None
+
+
     def windows_setup(self):
         self.stckdWidget = QStackedWidget()
 
@@ -247,34 +250,9 @@ class MainWindow(QMainWindow):
         return None
     
 
-    def threadWorkers_setup(self):
-        self.threadpool = QThreadPool()
-        self.serialReadWorker_setup()
-        self.rfidReadWorker_setup()
-        return None
-    def serialReadWorker_setup(self):
-        self.serialReadWorker = SerialReadWorker()
-        self.SIGNALS.terminate_SerialReadWorker.connect(self.serialReadWorker.endRun)
-        self.ControlCenter_obj.SIGNALS.sendCanMsg.connect(self.serialReadWorker.sendCanMsg)
-        self.serialReadWorker.signals.serialLaunchFailure.connect(self.serialLaunchFailure)
-        self.serialReadWorker.signals.serialReadResults.connect(self.ControlCenter_obj.updateStatesFromCanStr)
-        self.threadpool.start(self.serialReadWorker)
-        return None
-    def serialLaunchFailure(self):
-        self.readyToCloseApp = True
-        self.close()
-        return None
-    def rfidReadWorker_setup(self):
-        self.rfidReadWorker = RfidReadWorker()
-        self.SIGNALS.terminate_RfidReadWorker.connect(self.rfidReadWorker.endRun)
-        self.rfidReadWorker.signals.rfidReadResults.connect(self.LockScreenWindow_workFlow)
-        self.threadpool.start(self.rfidReadWorker)
-        return None
-    
-    def hardware_setup(self):
-        self.ControlCenter_obj.turnOffAllLedStrips()
-        self.ControlCenter_obj.secureAllSlots()
-        self.ControlCenter_obj.turnOnBmsSolenoidsWhereWise()
+    def rfidReads_setup(self):
+        # The card reader is read by the station daemon, which forwards its reads.
+        StationClient.SIGNALS.rfidReadResults.connect(self.LockScreenWindow_workFlow)
         return None
     
 
@@ -282,37 +260,17 @@ class MainWindow(QMainWindow):
 # (1) ------------------- GLOBAL TIMERS FUNCS --------------------------- (1)
     
     def updateGlobalTimerVars250(self):
-        self.currentGlobalTime += 250
-        self.ControlCenter_obj.updateCurrentGlobalTime(self.currentGlobalTime)
-        self.ControlCenter_obj.sendCanMsg()
+        # Time is read from a monotonic clock, rather than counted in ticks, so that the timeouts
+        # don't stretch when the GUI thread stalls and ticks get delayed or missed.
+        # (The station's own tick, reconciliation and CAN traffic are run by the station daemon.)
+        self.currentGlobalTime = self.ControlCenter_obj.recordTick(250)
         return None
     
     def updateGlobalTimerVars1000(self):
-        freeSlots = self.ControlCenter_obj.getSlotsThatMatchStates({"BATTERY_IN_SLOT":False})
-        
-        if self.checkingForUserAndBatteryInteraction:   
-            # BATTERY ENTRY DETECTION
-            if len(freeSlots) < len(self.freeSlots):
-                self.user["numBatts"] -= 1
-                self.numBattsStationDelta += 1
-                slotTargeted = [slotAddress for slotAddress in self.freeSlots if slotAddress not in freeSlots][0]
-                QTimer.singleShot(
-                    self.BATTERY_ENTRY_INTERACTION_EMIT_TIMEOUT, 
-                    partial(self.batteryEntry_workflow_part2, slotTargeted.value))
-                self.checkingForUserAndBatteryInteraction = False
-
-            # BATTERY EGRESS DETECTION
-            elif len(freeSlots) > len(self.freeSlots):
-                self.user["numBatts"] += 1
-                self.numBattsStationDelta -= 1
-                slotTargeted = [slotAddress for slotAddress in freeSlots if slotAddress not in self.freeSlots][0]
-                QTimer.singleShot(
-                    self.BATTERY_EGRESS_INTERACTION_EMIT_TIMEOUT, 
-                    partial(self.batteryEgress_workflow_part2, slotTargeted.value))
-                self.checkingForUserAndBatteryInteraction = False
-
-        self.freeSlots = freeSlots
-        self.slotsWithDeliverableBattsToUser = self.ControlCenter_obj.getSlotsThatMatchStates({"BATTERY_IS_DELIVERABLE_TO_USER":True})
+        self.ControlCenter_obj.recordTick(1000)
+        # Battery entry/egress isn't polled for here anymore (see batteryInteraction_workflow).
+        self.freeSlots = self.ControlCenter_obj.getSlotsThatMatchStates(ControlCenter.FREE_SLOTS_QUERY)
+        self.slotsWithDeliverableBattsToUser = self.ControlCenter_obj.getDeliverableSlots()
 
         if not self.attendingUser:
             self.userInteractionTimer = self.currentGlobalTime
@@ -332,6 +290,7 @@ class MainWindow(QMainWindow):
         return None
     
     def updateGlobalTimerVars30000(self):
+        self.ControlCenter_obj.recordTick(30000)
         self.windows[WINS.LOCK_SCREEN].dateClock.updateTime()
         self.windows[WINS.LOCK_SCREEN].dateClock.updateDate()
 
@@ -342,10 +301,7 @@ class MainWindow(QMainWindow):
         if self.attendingUser:
             if self.currentGlobalTime - self.userInteractionTimer > self.USER_INTERACTION_TIMEOUT:
                 self.workFlowReset()
-
-        if (not self.isBootingUp) and (not self.isShuttingDown):
-            self.ControlCenter_obj.startChargeOfSlotBatteriesIfAllowable() 
-            QTimer.singleShot(15000, self.ControlCenter_obj.finishChargeOfSlotBatteriesIfAllowable)
+        # (Charging is managed by the station daemon, whether the GUI is running or not.)
         return None
 
 
@@ -410,6 +366,35 @@ class MainWindow(QMainWindow):
         return None
     
 
+# (3.0) ------------ BATTERY INTERACTION DETECTION -------------------- (3.0)
+
+    def batteryInteraction_workflow(self, slotAddressValue, batteryInSlot, timestamp):
+        # Triggered (through the station daemon) by BatterySlot the moment the debounced limit switch of a slot changes.
+        slotAddress = MODULE_ADDRESS(slotAddressValue)
+        
+        if self.checkingForUserAndBatteryInteraction:
+            # BATTERY ENTRY DETECTION
+            if batteryInSlot and slotAddress in self.freeSlots:
+                self.user["numBatts"] -= 1
+                self.numBattsStationDelta += 1
+                QTimer.singleShot(
+                    self.BATTERY_ENTRY_INTERACTION_EMIT_TIMEOUT, 
+                    partial(self.batteryEntry_workflow_part2, slotAddressValue))
+                self.checkingForUserAndBatteryInteraction = False
+
+            # BATTERY EGRESS DETECTION
+            elif (not batteryInSlot) and slotAddress not in self.freeSlots:
+                self.user["numBatts"] += 1
+                self.numBattsStationDelta -= 1
+                QTimer.singleShot(
+                    self.BATTERY_EGRESS_INTERACTION_EMIT_TIMEOUT, 
+                    partial(self.batteryEgress_workflow_part2, slotAddressValue))
+                self.checkingForUserAndBatteryInteraction = False
+
+        self.freeSlots = self.ControlCenter_obj.getSlotsThatMatchStates(ControlCenter.FREE_SLOTS_QUERY)
+        return None
+
+
 # (3.1) ------------ BATTERY ENTRY WORKFLOW-------------------- (3.1)
     
     def batteryEntry_workflow_part1(self):
@@ -508,8 +493,7 @@ class MainWindow(QMainWindow):
         elif len(self.slotsWithDeliverableBattsToUser) < maxNumBattsRequestableByUser:
             msg = "¡LO SENTIMOS! NO HAY SUFICIENTES BATERÍAS CARGADAS DISPONIBLES"
 
-            eligibleSlots = self.ControlCenter_obj.getSlotsThatMatchStates({"BATTERY_IS_ADDRESSABLE" : True,
-                                                                            "BATTERY_IS_DAMAGED"     : False})
+            eligibleSlots = self.ControlCenter_obj.getSlotsThatMatchStates(ControlCenter.ELIGIBLE_SLOTS_QUERY)
             
             if len(eligibleSlots) < maxNumBattsRequestableByUser:
                 msg = f"{msg}. VUELVA MÁS TARDE."
@@ -613,7 +597,7 @@ class MainWindow(QMainWindow):
         if self.isShuttingDown:
             self.hardware_shutdown()
         elif not self.isBootingUp:
-            self.hardware_setup()
+            self.ControlCenter_obj.hardwareSetup()
 
         resetMsg = "POR FAVOR ACERQUE SU TARJETA AL LECTOR PARA INICIAR"
         self.windows[WINS.LOCK_SCREEN].text = resetMsg
@@ -626,6 +610,13 @@ class MainWindow(QMainWindow):
         self.isBootingUp = False
         return None
 
+    def stationReady_workflow(self, bootReport):
+        # (Also received when reconnecting to a daemon that was already running: only the first one counts.)
+        if self.isBootingUp and not self.isShuttingDown:
+            self.workFlowReset()
+            self.isNotBootingUp()
+        return None
+
     def readyToCloseAppTrue(self):
         self.readyToCloseApp = True
         return None
@@ -642,14 +633,13 @@ class MainWindow(QMainWindow):
             self.workFlowReset()
             self.windows[WINS.LOCK_SCREEN].text = "SHUTTING DOWN ..."
             self.show_window[WINS.LOCK_SCREEN]()
-            self.SIGNALS.terminate_RfidReadWorker.emit()
-            QTimer.singleShot(5000, self.SIGNALS.terminate_SerialReadWorker.emit)
             QTimer.singleShot(10000, self.readyToCloseAppTrue)
             QTimer.singleShot(10500, self.close)
         return None
 
     def closeEvent(self, e):
         if self.readyToCloseApp:
+            self.ControlCenter_obj.close()
             e.accept()
         else:
             self.exitCall()
@@ -8,6 +8,14 @@ Thus, it is easier and more reliable to convert between modes of communication,
 global CAN network together with the Raspberry Pi. To do this, we translate CAN messages proceeding from the 
 global CAN network into string messages that can be sent to the Raspberry Pi via Serial, and we translate
 string messages coming from the Raspberry Pi into CAN messages that can then be sent over the global CAN network.
+
+The module boots in ASCII mode (i.e, CAN strings) and advertises that it supports binary mode with the line
+"#BIN-CAPABLE", repeated every second until the Raspberry Pi sends anything (older modules don't, so the Raspberry
+Pi never sends them a request that they would put on the CAN network as a CAN string). If the Raspberry Pi sends
+the line "#BIN", the module answers "#BIN-OK" and switches to binary mode: every CAN message is then sent as a fixed
+13-byte frame (can_id little-endian [4 bytes] + data [8 bytes] + CRC-8 [1 byte]), COBS-encoded and terminated by a
+0x00 byte. In binary mode, a "#BIN" line at a frame boundary (the Raspberry Pi sends it after a 0x00 byte) is
+acknowledged again, framed by 0x00 bytes.
 */
 
 #include <mcp2515.h> 
@@ -19,6 +27,21 @@ struct can_frame canMsg_rpy2net = {.can_id = 0, .can_dlc = 8, .data = {0,0,0,0,0
 MCP2515 canNetworkGlobal(9); // CS pin of global CAN network is 9.
 
 
+// -DEFINITION OF SERIAL LINK VARIABLES-
+const uint8_t BIN_FRAME_LEN = 13;
+const uint8_t COBS_FRAME_MAXLEN = BIN_FRAME_LEN + 1;
+const char BIN_MODE_REQUEST[] = "#BIN";
+const char BIN_MODE_ACK[] = "#BIN-OK\n";
+const char BIN_MODE_ADVERTISEMENT[] = "#BIN-CAPABLE\n";
+const unsigned long BIN_MODE_ADVERTISEMENT_PERIOD = 1000; // [ms]
+unsigned long binModeAdvertisementTime = 0;
+bool rpyHasSpoken = false;
+bool binaryMode = false;
+uint8_t binRxBuffer[COBS_FRAME_MAXLEN];
+uint8_t binRxIndex = 0;
+bool binRxOverflow = false;
+
+
 // CAN MSG ---> CAN STRING 
 String canMsg2canStr(struct can_frame canMsg){
   String canStr = String(canMsg.can_id) + "-";
@@ -49,17 +72,137 @@ can_frame canStr2canMsg(String canStr){
 }
 
 
+uint8_t crc8(const uint8_t* data, uint8_t len){
+  uint8_t crc = 0;
+  for (uint8_t i=0; i<len; i++){
+    crc ^= data[i];
+    for (uint8_t j=0; j<8; j++){
+      crc = (crc & 0x80) ? (crc << 1) ^ 0x07 : (crc << 1);
+    }
+  }
+  return crc;
+}
+uint8_t cobsEncode(const uint8_t* src, uint8_t len, uint8_t* dst){
+  uint8_t codeIndex = 0;
+  uint8_t writeIndex = 1;
+  uint8_t code = 1;
+  for (uint8_t i=0; i<len; i++){
+    if (src[i] == 0){
+      dst[codeIndex] = code;
+      codeIndex = writeIndex++;
+      code = 1;
+    }
+    else {
+      dst[writeIndex++] = src[i];
+      code++;
+    }
+  }
+  dst[codeIndex] = code;
+  return writeIndex;
+}
+uint8_t cobsDecode(const uint8_t* src, uint8_t len, uint8_t* dst){
+  uint8_t readIndex = 0;
+  uint8_t writeIndex = 0;
+  while (readIndex < len){
+    uint8_t code = src[readIndex];
+    if (code == 0 || readIndex + code > len){return 0;}
+    readIndex++;
+    for (uint8_t i=1; i<code; i++){
+      dst[writeIndex++] = src[readIndex++];
+    }
+    if (code != 0xFF && readIndex < len){dst[writeIndex++] = 0;}
+  }
+  return writeIndex;
+}
+
+
+// CAN MSG ---> BINARY FRAME (COBS-encoded, without delimiter)
+uint8_t canMsg2binFrame(struct can_frame canMsg, uint8_t* binFrame){
+  uint8_t frame[BIN_FRAME_LEN];
+  for (int i=0; i<4; i++){
+    frame[i] = uint8_t(canMsg.can_id >> (8*i));
+  }
+  for (int i=0; i<8; i++){
+    frame[i+4] = canMsg.data[i];
+  }
+  frame[BIN_FRAME_LEN-1] = crc8(frame, BIN_FRAME_LEN-1);
+  return cobsEncode(frame, BIN_FRAME_LEN, binFrame);
+}
+// CAN MSG <--- BINARY FRAME (COBS-encoded, without delimiter)
+bool binFrame2canMsg(const uint8_t* binFrame, uint8_t len, struct can_frame* p_canMsg){
+  uint8_t frame[COBS_FRAME_MAXLEN];
+  if (cobsDecode(binFrame, len, frame) != BIN_FRAME_LEN){return false;}
+  if (crc8(frame, BIN_FRAME_LEN-1) != frame[BIN_FRAME_LEN-1]){return false;}
+
+  p_canMsg->can_id = 0;
+  for (int i=0; i<4; i++){
+    p_canMsg->can_id |= uint32_t(frame[i]) << (8*i);
+  }
+  for (int i=0; i<8; i++){
+    p_canMsg->data[i] = frame[i+4];
+  }
+  p_canMsg->can_dlc = 8;
+  return true;
+}
+
+
 void transmit_net2rpy(MCP2515& canNetwork, struct can_frame* p_canMsg){
   if (canUtils::readCanMsg(canNetwork, p_canMsg, canUtils::CONTROL_CENTER) == MCP2515::ERROR_OK){
-    Serial.print(canMsg2canStr(*p_canMsg));
+    if (binaryMode){
+      uint8_t binFrame[COBS_FRAME_MAXLEN+1];
+      uint8_t len = canMsg2binFrame(*p_canMsg, binFrame);
+      binFrame[len] = 0x00;
+      Serial.write(binFrame, len+1);
+    }
+    else {
+      Serial.print(canMsg2canStr(*p_canMsg));
+    }
   }
 }
 void transmit_rpy2net(MCP2515& canNetwork, struct can_frame* p_canMsg){
   if (Serial.available() > 0){
-    *p_canMsg = canStr2canMsg(Serial.readStringUntil('\n'));
+    rpyHasSpoken = true;
+    String canStr = Serial.readStringUntil('\n');
+    if (canStr == BIN_MODE_REQUEST){
+      Serial.print(BIN_MODE_ACK);
+      binaryMode = true;
+      return;
+    }
+    *p_canMsg = canStr2canMsg(canStr);
     canNetwork.sendMessage(p_canMsg);
   }
 }
+void transmit_rpy2net_binaryMode(MCP2515& canNetwork, struct can_frame* p_canMsg){
+  while (Serial.available() > 0){
+    uint8_t rxByte = Serial.read();
+
+    // A re-sent "#BIN" request (e.g, the RPY restarted without resetting us) is acknowledged again. It's only
+    // accepted at a frame boundary: a frame's COBS code byte is at most COBS_FRAME_MAXLEN, so it's never a '#'.
+    // (The ack is framed by delimiters, so that it neither sticks to a frame nor leaves the next one unterminated.)
+    if ((rxByte == '\n') && (binRxIndex == 4) && (!binRxOverflow) && (memcmp(binRxBuffer, BIN_MODE_REQUEST, 4) == 0)){
+      Serial.write(uint8_t(0x00));
+      Serial.print(BIN_MODE_ACK);
+      Serial.write(uint8_t(0x00));
+      binRxIndex = 0;
+      binRxOverflow = false;
+      continue;
+    }
+
+    if (rxByte == 0x00){
+      if ((!binRxOverflow) && binFrame2canMsg(binRxBuffer, binRxIndex, p_canMsg)){
+        canNetwork.sendMessage(p_canMsg);
+      }
+      binRxIndex = 0;
+      binRxOverflow = false;
+    }
+    else if (binRxIndex < COBS_FRAME_MAXLEN){
+      binRxBuffer[binRxIndex++] = rxByte;
+    }
+    else {
+      binRxOverflow = true;
+    }
+  }
+}
 
 
 void setup(){
@@ -70,16 +213,31 @@ void setup(){
   // CAN Network standard set-up.
   canUtils::stdCanNetworkSetUp(canNetworkGlobal);
 
+  // Let the RPY know that it can request binary mode.
+  Serial.print(BIN_MODE_ADVERTISEMENT);
+  binModeAdvertisementTime = millis();
+
 }
 
 
 void loop(){
 
+  // Keep advertising binary mode until the RPY speaks (it may have opened the port after our boot).
+  if ((!binaryMode) && (!rpyHasSpoken) && (millis() - binModeAdvertisementTime >= BIN_MODE_ADVERTISEMENT_PERIOD)){
+    Serial.print(BIN_MODE_ADVERTISEMENT);
+    binModeAdvertisementTime = millis();
+  }
+
   // Receive CAN messages from global network and send it via Serial to the RPY as strings.
   transmit_net2rpy(canNetworkGlobal, &canMsg_net2rpy);
 
   // Receive data via Serial from the RPY and send it over to the global network as CAN messages.
-  transmit_rpy2net(canNetworkGlobal, &canMsg_rpy2net);
+  if (binaryMode){
+    transmit_rpy2net_binaryMode(canNetworkGlobal, &canMsg_rpy2net);
+  }
+  else {
+    transmit_rpy2net(canNetworkGlobal, &canMsg_rpy2net);
+  }
 }
 
 